@@ -0,0 +1,221 @@
+"""
+Sales analytics.
+
+Every order event (placed, accepted, declined, delivered) is appended to
+order_events by the ledger, in the same transaction as the change itself,
+and the rollups it touches are bumped right there: one row per day, per
+hour of the day, per café and per item, each holding orders, quantity,
+revenue and how many were accepted, declined and delivered. Outcomes count
+towards the day and hour the order was placed, so a day's accept rate is
+that of its orders. A pre-order is placed when it is scheduled, not when
+preorders.py releases it, so an order taken overnight counts towards the
+evening it was taken.
+
+/report reads a handful of rollup rows by key, however long the history.
+rebuild() recomputes every rollup from the event log in a few GROUP BY
+statements, for when the rollup rules change or the table is lost. On a
+database from before the log existed, it first fills the log in from the
+orders table: each order's placing, and the outcomes its status implies,
+timed at its last update.
+
+Revenue is order totals (with fee and discount) for days and hours, and
+item amounts before fee and discount for cafés and items.
+"""
+import datetime
+import json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    at       REAL NOT NULL,
+    day      TEXT NOT NULL,
+    hour     INTEGER NOT NULL,
+    total    INTEGER NOT NULL,
+    qty      INTEGER NOT NULL,
+    items    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    scope     TEXT NOT NULL,
+    day       TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    orders    INTEGER NOT NULL DEFAULT 0,
+    qty       INTEGER NOT NULL DEFAULT 0,
+    revenue   INTEGER NOT NULL DEFAULT 0,
+    accepted  INTEGER NOT NULL DEFAULT 0,
+    declined  INTEGER NOT NULL DEFAULT 0,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, day, key)
+) WITHOUT ROWID;
+"""
+
+PLACED, ACCEPTED, DECLINED, DELIVERED = 'placed', 'accepted', 'declined', 'delivered'
+DAY, HOUR, CAFE, ITEM = 'day', 'hour', 'cafe', 'item'
+COUNTERS = ('orders', 'qty', 'revenue', 'accepted', 'declined', 'delivered')
+OUTCOMES = (ACCEPTED, DECLINED, DELIVERED)
+TOP = 5
+
+_UPSERT = (
+    f"INSERT INTO rollups (scope, day, key, {', '.join(COUNTERS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (scope, day, key) DO UPDATE SET "
+    + ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNTERS)
+)
+
+
+def item_key(cafe, item):
+    return f"{cafe} · {item}"
+
+
+def _line(row):
+    """A ledger items entry: [cafe, item, qty, amount]; entries from before amounts were kept have none."""
+    return row[0], row[1], row[2], row[3] if len(row) > 3 else 0
+
+
+def _counts(kind, qty, revenue):
+    """The COUNTERS an event adds to one rollup row."""
+    if kind == PLACED:
+        return (1, qty, revenue, 0, 0, 0)
+    return (0, 0, 0, kind == ACCEPTED, kind == DECLINED, kind == DELIVERED)
+
+
+def deltas(kind, day, hour, total, items):
+    """[(scope, day, key, *COUNTERS)] for one event."""
+    lines = [_line(row) for row in items]
+    qty = sum(line[2] for line in lines)
+    rows = [(DAY, day, '', *_counts(kind, qty, total)), (HOUR, day, f"{hour:02d}", *_counts(kind, qty, total))]
+    cafes = {}
+    for cafe, item, n, amount in lines:
+        q, r = cafes.get(cafe, (0, 0))
+        cafes[cafe] = (q + n, r + amount)
+        rows.append((ITEM, day, item_key(cafe, item), *_counts(kind, n, amount)))
+    rows += [(CAFE, day, cafe, *_counts(kind, q, r)) for cafe, (q, r) in cafes.items()]
+    return rows
+
+
+def record(conn, order_id, kind, day, hour, total, items, now):
+    """Appends an event and bumps its rollups. Call inside the caller's transaction."""
+    conn.execute(
+        "INSERT INTO order_events (order_id, kind, at, day, hour, total, qty, items) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (order_id, kind, now, day, hour, total, sum(_line(row)[2] for row in items),
+         json.dumps(items, ensure_ascii=False, separators=(',', ':'))),
+    )
+    conn.executemany(_UPSERT, deltas(kind, day, hour, total, items))
+
+
+# Events for orders from before the log, rebuilt from each order's row. Hours are EAT,
+# as orders.local_hour(); orders with no items (adopted) were never counted.
+_BACKFILL_EVENT = """
+    INSERT INTO order_events (order_id, kind, at, day, hour, total, qty, items)
+    SELECT order_id, '{kind}', {at}, day, CAST(strftime('%H', created_at + 10800, 'unixepoch') AS INTEGER), total,
+           (SELECT COALESCE(SUM(json_extract(l.value, '$[2]')), 0) FROM json_each(orders.items) l), items
+    FROM orders WHERE items != '[]' AND {where} ORDER BY created_at
+"""
+BACKFILL = [
+    _BACKFILL_EVENT.format(kind=PLACED, at='created_at', where='1'),
+    _BACKFILL_EVENT.format(kind=ACCEPTED, at='updated_at', where="status IN ('accepted', 'delivered')"),
+    _BACKFILL_EVENT.format(kind=DECLINED, at='updated_at', where="status = 'declined'"),
+    _BACKFILL_EVENT.format(kind=DELIVERED, at='updated_at', where="status = 'delivered'"),
+]
+
+# Rollups straight from the event log, one statement per scope. Item lines are pulled
+# out of the JSON once, into a temporary table. A café counts an order once however
+# many of its items are in it, as in deltas().
+_LINES = """
+    CREATE TEMP TABLE rebuild_lines AS
+    SELECT e.id, e.kind, e.day, json_extract(l.value, '$[0]') AS cafe, json_extract(l.value, '$[1]') AS item,
+           json_extract(l.value, '$[2]') AS qty, COALESCE(json_extract(l.value, '$[3]'), 0) AS amount
+    FROM order_events e, json_each(e.items) l
+"""
+_SUMS = """
+    SUM(kind = 'placed'), SUM((kind = 'placed') * qty), SUM((kind = 'placed') * {revenue}),
+    SUM(kind = 'accepted'), SUM(kind = 'declined'), SUM(kind = 'delivered')
+"""
+REBUILD = [
+    "DROP TABLE IF EXISTS rebuild_lines",
+    "DELETE FROM rollups",
+    f"INSERT INTO rollups SELECT 'day', day, '', {_SUMS.format(revenue='total')}"
+    " FROM order_events GROUP BY day",
+    f"INSERT INTO rollups SELECT 'hour', day, printf('%02d', hour), {_SUMS.format(revenue='total')}"
+    " FROM order_events GROUP BY day, hour",
+    _LINES,
+    f"INSERT INTO rollups SELECT 'item', day, cafe || ' · ' || item, {_SUMS.format(revenue='amount')}"
+    " FROM rebuild_lines GROUP BY day, cafe, item",
+    f"INSERT INTO rollups SELECT 'cafe', day, cafe, {_SUMS.format(revenue='amount')}"
+    " FROM (SELECT id, kind, day, cafe, SUM(qty) AS qty, SUM(amount) AS amount FROM rebuild_lines GROUP BY id, cafe)"
+    " GROUP BY day, cafe",
+    "DROP TABLE rebuild_lines",
+]
+
+
+class Analytics:
+    def __init__(self, store):
+        self.store = store
+
+    # --- DB THREAD ---
+
+    def _rows(self, day, days):
+        """Every rollup row of day, and the daily totals of days."""
+        marks = ', '.join('?' * len(days))
+        return self.store.conn.execute(
+            f"SELECT scope, day, key, {', '.join(COUNTERS)} FROM rollups"
+            f" WHERE scope IN ('day', 'hour', 'cafe', 'item') AND day = ?"
+            f" UNION ALL SELECT scope, day, key, {', '.join(COUNTERS)} FROM rollups"
+            f" WHERE scope = 'day' AND day IN ({marks}) AND day != ?",
+            (day, *days, day),
+        ).fetchall()
+
+    def _rebuild(self):
+        conn = self.store.conn
+        with conn:
+            if conn.execute("SELECT 1 FROM order_events LIMIT 1").fetchone() is None:
+                for statement in BACKFILL:
+                    conn.execute(statement)
+            for statement in REBUILD:
+                conn.execute(statement)
+        return conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0]
+
+    # --- PUBLIC ---
+
+    async def rollups(self, day, days=()):
+        """{(scope, day, key): {counter: value}} for every rollup of day, and the daily ones of days."""
+        rows = await self.store.run(self._rows, day, list(days))
+        return {(scope, d, key): dict(zip(COUNTERS, values)) for scope, d, key, *values in rows}
+
+    async def rebuild(self):
+        """Recomputes every rollup from the event log, filled in from the orders table if
+        empty. Returns the number of events read."""
+        return await self.store.run(self._rebuild)
+
+    async def report(self, day, week=7):
+        """The /report text for a day (YYYY-MM-DD)."""
+        start = datetime.date.fromisoformat(day)
+        recent = [(start - datetime.timedelta(days=n)).isoformat() for n in range(week - 1, -1, -1)]
+        rows = await self.rollups(day, recent)
+        totals = rows.get((DAY, day, ''), dict.fromkeys(COUNTERS, 0))
+        hours, cafes, items = ({key: c for (s, d, key), c in rows.items() if s == scope and d == day}
+                               for scope in (HOUR, CAFE, ITEM))
+        per_day = {d: c['orders'] for (s, d, key), c in rows.items() if s == DAY}
+
+        orders, decided = totals['orders'], totals['accepted'] + totals['declined']
+        lines = [
+            f"📊 Report for {day}",
+            f"Orders: {orders} · Revenue: {totals['revenue']:,} ETB"
+            + (f" · Avg {totals['revenue'] // orders:,} ETB" if orders else ""),
+            f"Accepted {totals['accepted']} · Declined {totals['declined']}"
+            + (f" ({totals['declined'] * 100 // decided}%)" if decided else "")
+            + f" · Delivered {totals['delivered']}",
+        ]
+        if hours:
+            busiest = sorted(hours.items(), key=lambda kv: -kv[1]['orders'])[:3]
+            lines.append("Busiest hours: " + ", ".join(f"{h}:00 ({c['orders']})" for h, c in busiest))
+        if cafes:
+            lines.append("\nTop cafés:")
+            lines += [f"• {name}: {c['orders']} orders, {c['revenue']:,} ETB"
+                      for name, c in sorted(cafes.items(), key=lambda kv: -kv[1]['revenue'])[:TOP]]
+        if items:
+            lines.append("\nTop items:")
+            lines += [f"• {name} ×{c['qty']}"
+                      for name, c in sorted(items.items(), key=lambda kv: -kv[1]['qty'])[:TOP]]
+        lines.append(f"\nLast {week} days: " + " · ".join(f"{d[5:]} {per_day.get(d, 0)}" for d in recent))
+        return "\n".join(lines)
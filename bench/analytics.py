@@ -0,0 +1,137 @@
+"""
+Sales analytics at scale: --orders orders over --days days, through the
+same transactions the ledger uses.
+
+Reports what the event log and rollups add to each order write, how long
+/report takes from the rollups against totalling the same day from the
+event log, and how fast rebuild() recomputes every rollup with its GROUP BY
+statements against replaying the log event by event through deltas().
+
+    python bench/analytics.py [--orders 100000] [--days 90]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+import orders  # noqa: E402
+import storage  # noqa: E402
+
+CAFES = [f"cafe {n}" for n in range(12)]
+ITEMS = [f"item {n}" for n in range(30)]
+DAY_START = 1_790_000_000.0
+
+
+def synthetic_orders(count, days, rng):
+    for n in range(count):
+        at = DAY_START + rng.uniform(0, days * 86400)
+        cafe = rng.choice(CAFES)
+        items = [[cafe, item, rng.randint(1, 3), 0] for item in rng.sample(ITEMS, rng.randint(1, 3))]
+        for line in items:
+            line[3] = line[2] * rng.randrange(80, 400, 10)
+        outcome = rng.choices((orders.ACCEPTED, orders.DECLINED, None), (85, 10, 5))[0]
+        yield f"#{n:08X}", n % 5000, at, items, sum(line[3] for line in items) + 39, outcome
+
+
+def place_all(conn, rows, with_log):
+    started = time.perf_counter()
+    for order_id, chat_id, at, items, total, outcome in rows:
+        with conn:
+            if with_log:
+                orders.insert_order(conn, order_id, chat_id, items, total, None, orders.PENDING, at)
+            else:
+                conn.execute(
+                    "INSERT INTO orders (order_id, chat_id, status, total, items, location, day, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (order_id, chat_id, orders.PENDING, total, json.dumps(items), 'null', orders.local_day(at), at, at),
+                )
+        if outcome:
+            with conn:
+                if with_log:
+                    orders.update_status(conn, order_id, outcome, "admin", at + 60)
+                else:
+                    conn.execute("UPDATE orders SET status = ? WHERE order_id = ?", (outcome, order_id))
+    return (time.perf_counter() - started) / len(rows) * 1e6
+
+
+def replay(conn):
+    """Every rollup from the log, one event at a time through analytics.deltas()."""
+    totals = {}
+    for kind, day, hour, total, items in conn.execute("SELECT kind, day, hour, total, items FROM order_events"):
+        for scope, d, key, *counts in analytics.deltas(kind, day, hour, total, json.loads(items)):
+            row = totals.setdefault((scope, d, key), [0] * len(counts))
+            for i, c in enumerate(counts):
+                row[i] += c
+    return sorted((*k, *v) for k, v in totals.items())
+
+
+def day_from_log(conn, day):
+    return conn.execute(
+        "SELECT SUM(kind = 'placed'), SUM((kind = 'placed') * total), SUM(kind = 'accepted'), SUM(kind = 'declined')"
+        " FROM order_events WHERE day = ?", (day,)
+    ).fetchone()
+
+
+async def run(count, days):
+    rng = random.Random(3)
+    rows = list(synthetic_orders(count, days, rng))
+    sample = rows[: max(1, count // 10)]
+    store = storage.SessionStore(os.path.join(tempfile.mkdtemp(), "analytics.db"))
+    await store.start()
+    await orders.OrderLedger(store).start()
+    conn = store.conn
+
+    plain = await store.run(place_all, conn, [(f"P{r[0]}", *r[1:]) for r in sample], False)
+    logged = await store.run(place_all, conn, rows, True)
+    events = conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0]
+    print(f"{count} orders over {days} days, {events} events, "
+          f"{conn.execute('SELECT COUNT(*) FROM rollups').fetchone()[0]} rollup rows")
+    print(f"  order write, ledger only      {plain:7.0f} µs")
+    print(f"  order write, with log/rollups {logged:7.0f} µs")
+
+    report = analytics.Analytics(store)
+    day = orders.local_day(DAY_START + days * 86400 / 2)
+    started = time.perf_counter()
+    for _ in range(50):
+        await report.report(day)
+    from_rollups = (time.perf_counter() - started) / 50 * 1000
+    started = time.perf_counter()
+    for _ in range(50):
+        await store.run(day_from_log, conn, day)
+    from_log = (time.perf_counter() - started) / 50 * 1000
+    print(f"  /report from rollups          {from_rollups:7.2f} ms")
+    print(f"  one day's totals from the log {from_log:7.2f} ms (no index on day; grows with history)")
+
+    incremental = sorted(conn.execute("SELECT * FROM rollups").fetchall())
+    started = time.perf_counter()
+    await report.rebuild()
+    rebuild = time.perf_counter() - started
+    started = time.perf_counter()
+    replayed = await store.run(replay, conn)
+    python = time.perf_counter() - started
+    rebuilt = sorted(conn.execute("SELECT * FROM rollups").fetchall())
+    print(f"  rebuild(), GROUP BY           {rebuild:7.2f} s")
+    print(f"  replay through deltas()       {python:7.2f} s")
+    print(f"  rebuilt == incremental: {rebuilt == incremental}, replayed == incremental: {replayed == incremental}")
+    await store.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sales analytics at scale: order write cost, /report latency and rollup rebuild time."
+    )
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+    asyncio.run(run(args.orders, args.days))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Throughput of the bot as 1, 2 and 4 processes (WORKERS, see cluster.py).
+
+The bot runs as a real process in webhook mode, against a stand-in Bot API
+server in this process (BOT_API_URL) with API pacing off, so what is
+measured is how fast the bot itself handles updates. --chats new customers
+each send /start and then pick a language, all at once; the run ends when
+every one of them has had both replies. Each run starts from an empty
+database.
+
+Scaling needs cores: the workers, the front and this process all compete
+for them, so on a machine with fewer cores than workers expect no gain.
+
+    python bench/cluster.py [--chats 400] [--workers 1,2,4] [--api-latency 0.02]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+from aiohttp import ClientSession, ClientError, web  # noqa: E402
+
+from startup import ROOT, SECRET, free_port  # noqa: E402
+
+CONNECTIONS = 64
+REPLIES = 2   # one to /start, one to the language choice
+
+
+class StandInAPI:
+    def __init__(self, latency):
+        self.latency = latency
+        self.fake = fakes.FakeTelegramAPI()
+        self.replies = Counter()   # chat_id -> sendMessage calls
+        self.expected = 0
+        self.done = None           # future resolved once every chat has REPLIES replies
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await request.json() if request.content_type == 'application/json' else dict(await request.post())
+        await asyncio.sleep(self.latency)
+        if method == 'sendMessage':
+            chat_id = int(params.get('chat_id', 0))
+            self.replies[chat_id] += 1
+            if self.replies[chat_id] == REPLIES:
+                self.expected -= 1
+                if self.expected == 0 and not self.done.done():
+                    self.done.set_result(time.perf_counter())
+        return web.json_response({'ok': True, 'result': self.fake.answer(method, params)})
+
+
+async def post(http, port, payload):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    while True:
+        try:
+            async with http.post(f"http://127.0.0.1:{port}/telegram", json=payload, headers=headers) as r:
+                if r.status == 200:
+                    return
+        except ClientError:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def customer(http, port, chat_id, slots):
+    async with slots:
+        await post(http, port, fakes.make_text(chat_id, "/start"))
+        await post(http, port, fakes.make_text(chat_id, "🇺🇸 English"))
+
+
+async def measure(api, workers, chats, api_port):
+    workdir = tempfile.mkdtemp()
+    port = free_port()
+    env = {
+        **os.environ,
+        "BOT_TOKEN": fakes.TOKEN, "BOT_API_URL": f"http://127.0.0.1:{api_port}", "CHANNEL_ID": "-1001",
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}", "WEBHOOK_SECRET": SECRET, "PORT": str(port),
+        "DB_PATH": os.path.join(workdir, "cluster.db"), "LOG_LEVEL": "ERROR",   # every update is "slow" here
+        "WORKERS": str(workers), "API_SHAPING": "0",
+    }
+    proc = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, "bot.py"), env=env,
+                                                stdout=asyncio.subprocess.DEVNULL)
+    try:
+        async with ClientSession() as http:
+            while True:   # ready once every worker has connected to the front
+                try:
+                    async with http.get(f"http://127.0.0.1:{port}/readyz") as r:
+                        if r.status == 200:
+                            break
+                except ClientError:
+                    pass
+                await asyncio.sleep(0.05)
+
+            api.replies.clear()
+            api.expected = chats
+            api.done = asyncio.get_running_loop().create_future()
+            slots = asyncio.Semaphore(CONNECTIONS)
+            first = 10_000_000
+            started = time.perf_counter()
+            await asyncio.gather(*(customer(http, port, first + i, slots) for i in range(chats)))
+            finished = await asyncio.wait_for(api.done, 300)
+        return finished - started
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        await proc.wait()
+
+
+async def run(chats, workers_list, latency):
+    api = StandInAPI(latency)
+    web_app = web.Application()
+    web_app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', api_port).start()
+
+    print(f"{chats} customers x {REPLIES} updates, API latency {latency * 1000:.0f} ms, {os.cpu_count()} cores")
+    baseline = None
+    for workers in workers_list:
+        elapsed = await measure(api, workers, chats, api_port)
+        rate = chats * REPLIES / elapsed
+        baseline = baseline or rate
+        print(f"  WORKERS={workers}: {elapsed:6.2f} s  {rate:7.0f} updates/s  x{rate / baseline:.2f}")
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput of the bot as 1, 2 and 4 processes (WORKERS, see cluster.py)."
+    )
+    parser.add_argument("--chats", type=int, default=400)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated process counts")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="seconds per Bot API call")
+    args = parser.parse_args()
+    asyncio.run(run(args.chats, [int(n) for n in args.workers.split(",")], args.api_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Throughput as update concurrency grows.
+
+Feeds interleaved conversations (every user's step 1, then every user's
+step 2, ...) through the Application's update queue, the same path polling
+and webhooks use, at several PerChatUpdateProcessor caps. Each simulated Bot
+API call takes --api-latency seconds. A run only counts if every user ends
+up with a placed order, which needs each chat's updates handled in order.
+
+    python bench/concurrency.py [--users 300] [--api-latency 0.02] [--caps 1,8,32,128]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "concurrency.db"))
+os.environ.setdefault("CHANNEL_ID", "-1001")
+os.environ.pop("WEBHOOK_URL", None)
+
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+import bot  # noqa: E402
+
+
+def conversation(chat_id):
+    return [
+        fakes.make_text(chat_id, "/start"),
+        fakes.make_text(chat_id, "🇺🇸 English"),
+        fakes.make_contact(chat_id),
+        fakes.make_text(chat_id, "Temberlin cafe"),
+        fakes.make_text(chat_id, "tibs — 330 ETB"),
+        fakes.make_text(chat_id, "✅ Done"),
+        fakes.make_location(chat_id),
+    ]
+
+
+async def run_once(cap, users, api_latency, first_chat_id):
+    api = fakes.FakeTelegramAPI(latency=api_latency)
+    app = bot.build_app(token=fakes.TOKEN, request=api, max_concurrent_updates=cap, shape_traffic=False)
+    done = asyncio.Event()
+    handled = 0
+    steps = conversation(0)
+
+    async def count(update, ctx):
+        nonlocal handled
+        handled += 1
+        if handled == users * len(steps):
+            done.set()
+
+    app.add_handler(TypeHandler(Update, count), group=99)
+
+    chats = range(first_chat_id, first_chat_id + users)
+    scripts = [conversation(chat_id) for chat_id in chats]
+    async with app:
+        await bot.on_startup(app)
+        await app.start()
+        started = time.perf_counter()
+        for step in range(len(steps)):
+            for script in scripts:
+                await app.update_queue.put(Update.de_json(script[step], app.bot))
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        placed = 0
+        for chat_id in chats:
+            placed += len(await bot.ledger.by_customer(chat_id, limit=1))
+        await app.stop()
+        await bot.on_shutdown(app)
+    return elapsed, handled, placed
+
+
+async def run(users, api_latency, caps):
+    bot.SERVICE_MODE = 'OPEN'
+    print(f"{users} users, API latency {api_latency * 1000:.0f} ms")
+    print(f"{'cap':>5} {'seconds':>8} {'updates/s':>10} {'orders placed':>14}")
+    for n, cap in enumerate(caps):
+        elapsed, handled, placed = await run_once(cap, users, api_latency, first_chat_id=1000 + n * users)
+        print(f"{cap:5d} {elapsed:8.2f} {handled / elapsed:10.0f} {placed:8d}/{users}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput as update concurrency grows.")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    parser.add_argument("--caps", default="1,8,32,128")
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.api_latency, [int(c) for c in args.caps.split(",")]))
+
+
+if __name__ == "__main__":
+    main()
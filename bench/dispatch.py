@@ -0,0 +1,202 @@
+"""
+Courier dispatch, simulated: hundreds of couriers, thousands of orders an hour.
+
+Runs dispatch.CourierIndex and dispatch.match on a simulated clock, with no
+bot around them. Cafés sit near the town centre and drop-offs are spread
+around it. Orders arrive at random (Poisson) at --orders per hour. Couriers
+ride at --speed km/h in straight lines, spend HANDOVER_SECONDS at each end
+and send a live location update every PING_SECONDS. Free couriers are in
+the index, busy ones are not.
+
+Each run compares two policies on the same orders:
+  * one by one: each order takes the nearest free courier as it arrives;
+  * batched: orders are matched every --batch seconds, shortest pairs first.
+
+It reports order waits, pickup distances and delivery times, and the CPU
+time spent in the index and the matcher. A last table times nearest-courier
+lookups in the grid index against a scan of every free courier.
+
+    python bench/dispatch.py [--couriers 500] [--orders 2000] [--hours 1] [--batch 2]
+"""
+import argparse
+import math
+import random
+import statistics
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402,F401  (puts the repo on sys.path)
+
+import dispatch  # noqa: E402
+import geofence  # noqa: E402
+
+CENTRE = (7.925, 38.100)
+CAFES = 12
+HANDOVER_SECONDS = 120
+PING_SECONDS = 10
+SPREAD_KM = 2.0            # drop-offs: normal around the centre with this deviation
+KM_PER_DEGREE = 111.2
+
+
+def offset(point, km_north, km_east):
+    lat, lon = point
+    return (lat + km_north / KM_PER_DEGREE,
+            lon + km_east / (KM_PER_DEGREE * math.cos(math.radians(lat))))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+class Rider:
+    __slots__ = ('id', 'pos', 'legs')
+
+    def __init__(self, rider_id, pos):
+        self.id = rider_id
+        self.pos = pos
+        self.legs = []     # [(start_time, end_time, from, to)] still ahead
+
+    def where(self, now):
+        """Position at `now`, moving along the legs."""
+        while self.legs and self.legs[0][1] <= now:
+            self.pos = self.legs.pop(0)[3]
+        if not self.legs or now <= self.legs[0][0]:
+            return self.pos
+        start, end, a, b = self.legs[0]
+        f = (now - start) / (end - start)
+        return (a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f)
+
+
+def simulate(seed, couriers, orders_per_hour, hours, speed_kmh, batch_seconds):
+    rng = random.Random(seed)
+    cafes = [offset(CENTRE, rng.gauss(0, 0.7), rng.gauss(0, 0.7)) for _ in range(CAFES)]
+    riders = [Rider(i, offset(CENTRE, rng.gauss(0, SPREAD_KM), rng.gauss(0, SPREAD_KM))) for i in range(couriers)]
+    index = dispatch.CourierIndex()
+    for r in riders:
+        index.put(r.id, *r.pos)
+
+    # The same orders for both policies: Poisson arrivals over the run.
+    arrivals, t = [], 0.0
+    while True:
+        t += rng.expovariate(orders_per_hour / 3600)
+        if t >= hours * 3600:
+            break
+        cafe = rng.randrange(CAFES)
+        dropoff = offset(CENTRE, rng.gauss(0, SPREAD_KM), rng.gauss(0, SPREAD_KM))
+        arrivals.append(dispatch.Job(f"#{len(arrivals)}", 0, cafe, None, cafes[cafe], dropoff, 0, t))
+
+    seconds_per_km = 3600 / speed_kmh
+    waiting, waits, pickups, totals = [], [], [], []
+    busy = {}                 # rider id -> time they are free again
+    match_cpu = index_cpu = 0.0
+    index_ops = 0
+    next_arrival = 0
+    horizon = hours * 3600
+    now = 0
+    while now < horizon or waiting or busy:
+        # New orders.
+        while next_arrival < len(arrivals) and arrivals[next_arrival].since <= now:
+            waiting.append(arrivals[next_arrival])
+            next_arrival += 1
+        # Riders finishing a delivery become free where they are.
+        for rider_id in [r for r, free_at in busy.items() if free_at <= now]:
+            del busy[rider_id]
+        # Live location updates, staggered across riders.
+        started = time.perf_counter()
+        for r in riders:
+            if (now + r.id) % PING_SECONDS == 0:
+                pos = r.where(now)
+                if r.id in busy:
+                    index.remove(r.id)
+                else:
+                    index.put(r.id, *pos)
+                index_ops += 1
+        index_cpu += time.perf_counter() - started
+
+        if waiting and (batch_seconds == 0 or now % batch_seconds == 0):
+            started = time.perf_counter()
+            if batch_seconds == 0:
+                assigned = []
+                for job in waiting:
+                    assigned += dispatch.match(index, [job], candidates=1)
+            else:
+                assigned = dispatch.match(index, waiting)
+            match_cpu += time.perf_counter() - started
+            done = set()
+            for job, rider_id, km in assigned:
+                r = riders[rider_id]
+                pos = r.where(now)
+                to_cafe = now + km * seconds_per_km
+                picked = to_cafe + HANDOVER_SECONDS
+                ride = geofence.haversine_km(*job.pickup, *job.dropoff) * seconds_per_km
+                r.legs = [(now, to_cafe, pos, job.pickup), (picked, picked + ride, job.pickup, job.dropoff)]
+                busy[rider_id] = picked + ride + HANDOVER_SECONDS
+                waits.append(now - job.since)
+                pickups.append(km)
+                totals.append(picked + ride - job.since)
+                done.add(job.order_id)
+            waiting = [job for job in waiting if job.order_id not in done]
+        now += 1
+        if now > horizon * 3:
+            break   # hopelessly overloaded; report what got delivered
+
+    return {
+        'orders': len(arrivals), 'delivered': len(totals),
+        'wait_p50': percentile(waits, 50), 'wait_p90': percentile(waits, 90),
+        'pickup_km': statistics.mean(pickups) if pickups else 0.0,
+        'total_p50': percentile(totals, 50), 'total_p90': percentile(totals, 90),
+        'match_ms': match_cpu * 1000, 'index_us': index_cpu / max(1, index_ops) * 1e6,
+    }
+
+
+def lookup_costs(rng, sizes, queries=2000):
+    print("\nNearest free courier, per lookup:")
+    print(f"  {'couriers':>8} {'grid index':>11} {'full scan':>10}")
+    for n in sizes:
+        index = dispatch.CourierIndex()
+        points = {}
+        for i in range(n):
+            points[i] = offset(CENTRE, rng.gauss(0, SPREAD_KM), rng.gauss(0, SPREAD_KM))
+            index.put(i, *points[i])
+        targets = [offset(CENTRE, rng.gauss(0, 0.7), rng.gauss(0, 0.7)) for _ in range(queries)]
+
+        started = time.perf_counter()
+        grid = [index.nearest(lat, lon)[0][1] for lat, lon in targets]
+        grid_us = (time.perf_counter() - started) / queries * 1e6
+
+        started = time.perf_counter()
+        scan = [min((geofence.haversine_km(lat, lon, *p), i) for i, p in points.items())[1] for lat, lon in targets]
+        scan_us = (time.perf_counter() - started) / queries * 1e6
+        assert grid == scan
+        print(f"  {n:8} {grid_us:9.1f} µs {scan_us:8.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Courier dispatch, simulated: hundreds of couriers, thousands of orders an hour."
+    )
+    parser.add_argument("--couriers", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=2000, help="orders per hour")
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--speed", type=float, default=25, help="km/h")
+    parser.add_argument("--batch", type=int, default=int(dispatch.BATCH_SECONDS), help="seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.couriers} couriers, {args.orders} orders/hour for {args.hours:g} h, {args.speed:g} km/h")
+    print(f"  {'policy':<12} {'delivered':>9} {'wait p50/p90':>14} {'pickup':>8} "
+          f"{'order to door p50/p90':>22} {'matching':>9} {'per ping':>9}")
+    for label, batch in (("one by one", 0), (f"batch {args.batch}s", args.batch)):
+        s = simulate(args.seed, args.couriers, args.orders, args.hours, args.speed, batch)
+        print(f"  {label:<12} {s['delivered']:5}/{s['orders']:<4} "
+              f"{s['wait_p50']:5.0f}/{s['wait_p90']:5.0f} s  {s['pickup_km']:5.2f} km "
+              f"{s['total_p50'] / 60:9.1f}/{s['total_p90'] / 60:5.1f} min  "
+              f"{s['match_ms']:6.0f} ms {s['index_us']:6.2f} µs")
+    lookup_costs(random.Random(args.seed), (20, 100, 400, 1600, 6400))
+
+
+if __name__ == "__main__":
+    main()
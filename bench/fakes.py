@@ -0,0 +1,129 @@
+"""
+Local stand-ins for Telegram, for benchmarks and smoke runs.
+
+FakeTelegramAPI plugs into python-telegram-bot as its HTTP request backend
+and answers Bot API calls from memory, recording every call. The make_*
+helpers build the raw update payloads Telegram would send.
+"""
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.request import BaseRequest
+
+TOKEN = "123456:FAKE-TOKEN"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Fake Bot", "username": "fake_bot"}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def user(chat_id, username=None):
+    return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "username": username or f"user{chat_id}"}
+
+
+def _message(chat_id, username=None, **fields):
+    return {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": user(chat_id, username),
+        **fields,
+    }
+
+
+def make_text(chat_id, text, username=None):
+    msg = _message(chat_id, username, text=text)
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": msg}
+
+
+def make_contact(chat_id, phone="+251900000000"):
+    contact = {"phone_number": phone, "first_name": f"User{chat_id}", "user_id": chat_id}
+    return {"update_id": next(_update_ids), "message": _message(chat_id, contact=contact)}
+
+
+def make_location(chat_id, lat=7.92, lon=38.10):
+    return {"update_id": next(_update_ids), "message": _message(chat_id, location={"latitude": lat, "longitude": lon})}
+
+
+def make_callback(admin_chat_id, data, message_text, channel_id=-100, username="admin"):
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": channel_id, "type": "channel"},
+        "text": message_text,
+    }
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": user(admin_chat_id, username),
+            "chat_instance": "bench",
+            "message": message,
+            "data": data,
+        },
+    }
+
+
+def make_inline_query(user_id, query):
+    return {
+        "update_id": next(_update_ids),
+        "inline_query": {"id": str(next(_update_ids)), "from": user(user_id), "query": query, "offset": ""},
+    }
+
+
+class FakeTelegramAPI(BaseRequest):
+    """A BaseRequest that answers Bot API methods locally instead of over HTTP."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []          # (method, params)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((api_method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self.answer(api_method, params)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def answer(self, api_method, params):
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method in ("sendMessage", "editMessageText"):
+            chat_id = params.get("chat_id", 0)
+            chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0
+            return {
+                "message_id": params.get("message_id") or next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if api_method == "getUpdates":
+            return []
+        return True
+
+    def count(self, api_method=None):
+        if api_method is None:
+            return len(self.calls)
+        return sum(1 for m, _ in self.calls if m == api_method)
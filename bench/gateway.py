@@ -0,0 +1,158 @@
+"""
+Drives gateway.Gateway against a local stand-in Bot API server over real
+HTTP (HTTPXRequest, one shared pool). The server answers 429 with
+retry_after when a chat or the whole bot goes over its limits, like
+Telegram does.
+
+Load: a broadcast on the bulk lane, order notifications to customers on the
+order lane while it runs, and bursts of several messages to the same chats.
+Compared with sending straight through HTTPXRequest.
+
+    python bench/gateway.py [--speedup 1]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+from aiohttp import web  # noqa: E402
+from telegram import Bot  # noqa: E402
+from telegram.error import RetryAfter, TelegramError  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+import gateway  # noqa: E402
+
+BROADCAST = 400
+ORDERS = 20
+BURST_CHATS, BURSTS = 20, 6
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+class Window:
+    """Token bucket that refuses instead of queueing."""
+
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, time.monotonic()
+
+    def deficit(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class StandInAPI:
+    """Bot API server enforcing per-chat and global flood limits."""
+
+    def __init__(self, speedup, latency=0.02):
+        self.speedup = speedup
+        self.latency = latency
+        self.chats = {}
+        self.everyone = Window(32 * speedup, 35)
+        self.delivered = 0
+        self.flood = 0
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await request.json() if request.content_type == 'application/json' else dict(await request.post())
+        await asyncio.sleep(self.latency)
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': fakes.BOT_USER})
+        chat_id = int(params['chat_id'])
+        now = time.monotonic()
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            rate, burst = (1.2, 4) if chat_id > 0 else (0.4, 6)
+            chat = self.chats[chat_id] = Window(rate * self.speedup, burst)
+        wait = max(chat.deficit(now), self.everyone.deficit(now))
+        if wait:
+            self.flood += 1
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                      'parameters': {'retry_after': max(1, round(wait))}}, status=429)
+        chat.tokens -= 1
+        self.everyone.tokens -= 1
+        self.delivered += 1
+        return web.json_response({'ok': True, 'result': {
+            'message_id': self.delivered, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }})
+
+
+async def scenario(port, shaped):
+    http = HTTPXRequest(connection_pool_size=128, pool_timeout=5.0, read_timeout=30.0)
+    request = gateway.Gateway(http) if shaped else http
+    bot = Bot(fakes.TOKEN, base_url=f"http://127.0.0.1:{port}/bot", request=request)
+    latencies = {'orders': [], 'broadcast': [], 'burst': []}
+    errors = 0
+
+    async def send(kind, lane, chat_id, text):
+        nonlocal errors
+        gateway.LANE.set(lane)
+        started = time.perf_counter()
+        try:
+            await bot.send_message(chat_id, text)
+        except (RetryAfter, TelegramError):
+            errors += 1
+            return
+        latencies[kind].append(time.perf_counter() - started)
+
+    async with bot:
+        started = time.perf_counter()
+        broadcast = [send('broadcast', gateway.BULK, 10_000 + i, "announcement") for i in range(BROADCAST)]
+        bursts = [send('burst', gateway.INTERACTIVE, 20_000 + i % BURST_CHATS, f"line {i}") for i in range(BURSTS * BURST_CHATS)]
+
+        async def orders():
+            await asyncio.sleep(0.5)
+            await asyncio.gather(*(send('orders', gateway.ORDERS, 30_000 + i, "Your order was accepted")
+                                   for i in range(ORDERS)))
+
+        await asyncio.gather(*broadcast, *bursts, orders())
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed, request
+
+
+async def run(speedup):
+    for name in ('GLOBAL_RATE', 'PRIVATE_RATE', 'GROUP_RATE'):
+        setattr(gateway, name, getattr(gateway, name) * speedup)
+    for shaped in (False, True):
+        api = StandInAPI(speedup)
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', api.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            latencies, errors, elapsed, request = await scenario(port, shaped)
+        finally:
+            await runner.cleanup()
+
+        print(f"{'gateway' if shaped else 'direct':8} {elapsed:6.2f}s  {api.delivered} delivered, "
+              f"{api.flood} answered 429, {errors} sends failed")
+        for kind, values in latencies.items():
+            print(f"    {kind:10} n={len(values):4}  p50 {percentile(values, 50) * 1000:7.0f} ms  "
+                  f"p95 {percentile(values, 95) * 1000:7.0f} ms")
+        if shaped:
+            print(f"    {request.coalesced} sends coalesced, {request.retries} retries")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drives gateway.Gateway against a flood-limited stand-in Bot API server over HTTP."
+    )
+    parser.add_argument("--speedup", type=int, default=1, help="scales every rate limit, to keep the run short")
+    args = parser.parse_args()
+    asyncio.run(run(args.speedup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Point-in-zone lookups with hundreds of zones: a linear scan over every
+polygon versus geofence.ZoneIndex, single lookups and batch classify().
+
+    python bench/geofence.py [--zones 400] [-n 200000]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geofence  # noqa: E402
+
+
+def synthetic_zones(count, rng):
+    """Irregular 12-gons scattered over a ~1°x1° area."""
+    zones = []
+    side = math.ceil(math.sqrt(count))
+    for n in range(count):
+        clat, clon = 7.5 + (n // side) / side, 37.8 + (n % side) / side
+        radius = 0.4 / side
+        polygon = []
+        for k in range(12):
+            a = 2 * math.pi * k / 12
+            r = radius * rng.uniform(0.6, 1.0)
+            polygon.append((clat + r * math.sin(a), clon + r * math.cos(a)))
+        lats, lons = [p[0] for p in polygon], [p[1] for p in polygon]
+        zones.append(geofence.Zone(f"zone{n}", polygon, (min(lats), min(lons), max(lats), max(lons)), (clat, clon)))
+    return zones
+
+
+def linear(zones, lat, lon):
+    for zone in zones:
+        if geofence.point_in_polygon(lat, lon, zone.polygon):
+            return zone
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Point-in-zone lookups: a linear scan over every polygon versus geofence.ZoneIndex."
+    )
+    parser.add_argument("--zones", type=int, default=400)
+    parser.add_argument("-n", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    zones = synthetic_zones(args.zones, rng)
+    index = geofence.ZoneIndex(zones, cell_size=0.005)
+    points = [(rng.uniform(7.5, 8.5), rng.uniform(37.8, 38.8)) for _ in range(args.n)]
+
+    sample = points[: max(1, args.n // 20)]
+    started = time.perf_counter()
+    expected = [linear(zones, lat, lon) for lat, lon in sample]
+    per_linear = (time.perf_counter() - started) / len(sample)
+
+    started = time.perf_counter()
+    got = [index.zone_at(lat, lon) for lat, lon in points]
+    per_index = (time.perf_counter() - started) / len(points)
+
+    started = time.perf_counter()
+    names = index.classify(points)
+    per_batch = (time.perf_counter() - started) / len(points)
+
+    mismatches = sum(1 for a, b in zip(expected, got) if (a and a.name) != (b and b.name))
+    print(f"{args.zones} zones, {len(index.grid)} cells, {len(index.interior)} interior")
+    print(f"linear scan : {per_linear * 1e6:8.2f} µs/point")
+    print(f"grid index  : {per_index * 1e6:8.2f} µs/point")
+    print(f"classify()  : {per_batch * 1e6:8.2f} µs/point, {sum(n is not None for n in names)} inside a zone")
+    print(f"mismatches vs linear scan on {len(sample)} points: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Opening hours and pre-orders.
+
+Times the open check run on every message: the old clock-hour test against
+hours.Schedule with its cached state, and the full calendar walk the cache
+saves. Then schedules --preorders overnight pre-orders through
+preorders.PreorderQueue on a scratch database and shows how their channel
+posts spread out after opening, next to releasing them all at once.
+
+    python bench/hours.py [-n 200000] [--preorders 200]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gateway  # noqa: E402
+import hours  # noqa: E402
+import orders  # noqa: E402
+import preorders  # noqa: E402
+import storage  # noqa: E402
+
+WEEK = {
+    "utc_offset_hours": 3,
+    "service": {
+        "daily": [["06:00", "22:00"]], "fri": [["06:00", "24:00"]], "sat": [["00:00", "01:00"], ["07:00", "22:00"]],
+        "holidays": {"2026-12-25": [], "2027-01-07": [["10:00", "16:00"]]},
+    },
+    "cafes": {"Night cafe": {"daily": [["16:00", "24:00"]]}},
+}
+POSTS = 2   # map link and order card
+
+
+def old_is_open(open_hour=6, close_hour=22):
+    now = datetime.datetime.utcnow() + datetime.timedelta(hours=3)
+    return open_hour <= now.hour < close_hour
+
+
+def per_call(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def open_checks(n):
+    table = hours.Hours.parse(json.dumps(WEEK))
+    schedule = table.service
+
+    def uncached():
+        schedule._from = schedule._until = 0.0
+        return schedule.is_open()
+
+    print("Open check, per call:")
+    print(f"  clock hour (before)      {per_call(old_is_open, n):6.2f} µs")
+    print(f"  Schedule.is_open         {per_call(schedule.is_open, n):6.2f} µs")
+    print(f"  café and service         {per_call(lambda: table.cafe_open('Night cafe'), n):6.2f} µs")
+    print(f"  calendar walk (no cache) {per_call(uncached, max(1, n // 100)):6.2f} µs")
+
+
+async def release_spread(count):
+    store = storage.SessionStore(os.path.join(tempfile.mkdtemp(), "hours.db"))
+    await store.start()
+    await orders.OrderLedger(store).start()
+    queue = preorders.PreorderQueue(store, notifier=None)
+    await queue.start()
+    opening = time.time() + 10 * 3600
+    posts = [{'chat_id': -1, 'text': 'post'}] * POSTS
+    started = time.perf_counter()
+    for i in range(count):
+        await queue.schedule(f"#{i:08d}", 1000 + i, [["cafe", "item", 1]], 100, None, opening, posts, [])
+    per_order = (time.perf_counter() - started) / count * 1000
+    offsets = sorted(release_at - opening for release_at, _ in queue.heap)
+    await queue.stop()
+    await store.stop()
+
+    print(f"\n{count} pre-orders taken overnight, {POSTS} channel posts each "
+          f"({per_order:.2f} ms each to schedule):")
+    print(f"  channel group limit {gateway.GROUP_RATE * 60:.0f} posts/min, so one order every "
+          f"{preorders.spacing(posts):.0f} s")
+    spaced = Counter(int(o // 60) for o in offsets)
+    print(f"  {'minute':>6} {'all at once':>12} {'spaced':>7}")
+    for minute in range(min(10, max(spaced) + 1)):
+        print(f"  {minute:6} {count * POSTS if minute == 0 else 0:12} {spaced[minute] * POSTS:7}")
+    print(f"  last order out after {offsets[-1] / 60:.1f} min either way; all at once leaves "
+          f"{count * POSTS} posts queued behind the limit at opening, spaced leaves none")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Opening-hours check cost and how pre-orders spread out after opening."
+    )
+    parser.add_argument("-n", type=int, default=200_000)
+    parser.add_argument("--preorders", type=int, default=200)
+    args = parser.parse_args()
+    open_checks(args.n)
+    asyncio.run(release_spread(args.preorders))
+
+
+if __name__ == "__main__":
+    main()
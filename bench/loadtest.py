@@ -0,0 +1,135 @@
+"""
+Load test: runs complete customer conversations through the real handlers.
+
+Each simulated user goes /start -> language -> contact -> café -> two items
+-> Done -> location, and an admin then accepts the order. Updates go through
+Application.process_update with FakeTelegramAPI standing in for Telegram, so
+handler code, session storage and the ledger all run for real.
+
+    python bench/loadtest.py [--users 2000] [--concurrency 200] [--api-latency 0.02]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "loadtest.db"))
+os.environ.setdefault("CHANNEL_ID", "-1001")
+os.environ.pop("WEBHOOK_URL", None)
+
+from telegram import Update  # noqa: E402
+
+import bot  # noqa: E402
+
+CAFE, ITEM = "Temberlin cafe", "tibs — 330 ETB"
+ADMIN_CHAT_ID = 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+class LoadTest:
+    def __init__(self, app, api):
+        self.app = app
+        self.api = api
+        self.latencies = {}   # step -> [seconds]
+        self.updates = 0
+
+    async def feed(self, step, payload):
+        update = Update.de_json(payload, self.app.bot)
+        started = time.perf_counter()
+        await self.app.process_update(update)
+        self.latencies.setdefault(step, []).append(time.perf_counter() - started)
+        self.updates += 1
+
+    async def conversation(self, chat_id):
+        await self.feed("start", fakes.make_text(chat_id, "/start"))
+        await self.feed("set_language", fakes.make_text(chat_id, "🇺🇸 English"))
+        await self.feed("contact", fakes.make_contact(chat_id))
+        await self.feed("handle_text:cafe", fakes.make_text(chat_id, CAFE))
+        await self.feed("handle_text:item", fakes.make_text(chat_id, ITEM))
+        await self.feed("handle_text:item", fakes.make_text(chat_id, ITEM))
+        await self.feed("handle_text:done", fakes.make_text(chat_id, "✅ Done"))
+        await self.feed("location", fakes.make_location(chat_id))
+
+        placed = await bot.ledger.by_customer(chat_id, limit=1)
+        if placed:
+            order = placed[0]
+            data = f"accept_{chat_id}_{order.order_id}"
+            await self.feed("accept_or_decline",
+                            fakes.make_callback(ADMIN_CHAT_ID, data, "ORDER", username=bot.ADMIN_USERNAME))
+
+    async def run(self, users, concurrency, first_chat_id=1000):
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(chat_id):
+            async with gate:
+                await self.conversation(chat_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(first_chat_id + i) for i in range(users)))
+        return time.perf_counter() - started
+
+
+async def run(users, concurrency, api_latency, memory_users):
+    bot.SERVICE_MODE = 'OPEN'
+    api = fakes.FakeTelegramAPI(latency=api_latency)
+    app = bot.build_app(token=fakes.TOKEN, request=api, shape_traffic=False)
+    async with app:
+        await bot.on_startup(app)
+        test = LoadTest(app, api)
+
+        # Warm up caches so the measured run reflects steady state.
+        await test.run(min(50, users), concurrency, first_chat_id=10)
+        test.latencies.clear()
+        test.updates = 0
+
+        elapsed = await test.run(users, concurrency)
+        orders = len(await bot.ledger.by_status(bot.orders.ACCEPTED, limit=users + 100))
+        api_calls = api.count()
+        updates = test.updates
+
+        # tracemalloc slows everything down, so memory gets its own pass over fresh users.
+        latencies, test.latencies = test.latencies, {}
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        await test.run(memory_users, concurrency, first_chat_id=10_000_000)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        await bot.on_shutdown(app)
+
+    print(f"{users} users, concurrency {concurrency}, API latency {api_latency * 1000:.0f} ms")
+    print(f"{updates} updates in {elapsed:.2f}s: {updates / elapsed:.0f} updates/s, "
+          f"{users / elapsed:.1f} orders/s, {orders} orders accepted (incl. warm-up)")
+    print(f"{api_calls} API calls, {api_calls / users:.1f} per order")
+    print(f"memory growth: {(after - before) / memory_users / 1024:.2f} KiB per user ({memory_users} users traced)")
+    print(f"{'step':22} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for step, values in latencies.items():
+        values.sort()
+        print(f"{step:22} {len(values):6d} {percentile(values, 50) * 1e3:8.2f} "
+              f"{percentile(values, 95) * 1e3:8.2f} {percentile(values, 99) * 1e3:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test: runs complete customer conversations through the real handlers."
+    )
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds per fake API call")
+    parser.add_argument("--memory-users", type=int, default=500, help="users in the tracemalloc pass")
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.concurrency, args.api_latency, args.memory_users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Measures how long logging holds up the event loop: simulated handlers log
+while a monitor task records how late its 1 ms ticks fire.
+
+  basicConfig: the old setup, a StreamHandler writing from the loop, with
+               f-string messages (formatted even for filtered DEBUG lines)
+  logs.setup:  queue to a writer thread, %-style messages, sampling
+
+The sink is a stream whose writes take --write-us microseconds, standing in
+for a pipe to a log collector that is keeping up slowly.
+
+    python bench/log_stall.py [--updates 5000] [--write-us 200]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import logs  # noqa: E402
+
+logger = logging.getLogger('bench')
+
+
+class SlowStream(io.TextIOBase):
+    def __init__(self, write_seconds):
+        self.write_seconds = write_seconds
+        self.lines = 0
+
+    def write(self, s):
+        time.sleep(self.write_seconds)
+        self.lines += s.count('\n')
+        return len(s)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+async def handler_fstrings(chat_id, cart):
+    logger.debug(f"cart for {chat_id}: {cart}")
+    logger.info(f"update from {chat_id}")
+    await asyncio.sleep(0)
+    logger.debug(f"rendered menu for {chat_id} with {len(cart)} items: {cart}")
+    logger.info(f"handled {chat_id}")
+
+
+async def handler_lazy(chat_id, cart):
+    logger.debug("cart for %s: %s", chat_id, cart)
+    logger.info("update from %s", chat_id, extra={'event': 'update'})
+    await asyncio.sleep(0)
+    logger.debug("rendered menu for %s with %s items: %s", chat_id, len(cart), cart)
+    logger.info("handled %s", chat_id, extra={'event': 'handled'})
+
+
+async def run(handler, updates, concurrency):
+    lags = []
+    done = asyncio.Event()
+
+    async def monitor():
+        while not done.is_set():
+            expected = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    async def worker(first):
+        for chat_id in range(first, updates, concurrency):
+            cart = [(item, 1) for item in range(chat_id % 7)]
+            await handler(chat_id, cart)
+
+    ticker = asyncio.create_task(monitor())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker
+    return elapsed, lags
+
+
+def report(name, elapsed, lags, updates, lines):
+    print(f"{name:24} {elapsed:6.2f}s loop time ({updates / elapsed:7.0f} updates/s), "
+          f"tick lag p50 {percentile(lags, 50) * 1000:5.2f} ms  p99 {percentile(lags, 99) * 1000:6.2f} ms  "
+          f"max {max(lags) * 1000:6.1f} ms, {lines} lines written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="How long logging holds up the event loop while handlers log.")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--write-us", type=float, default=200)
+    args = parser.parse_args()
+    write_seconds = args.write_us / 1e6
+
+    sink = SlowStream(write_seconds)
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        level=logging.INFO, stream=sink, force=True)
+    elapsed, lags = asyncio.run(run(handler_fstrings, args.updates, args.concurrency))
+    report("basicConfig, f-strings", elapsed, lags, args.updates, sink.lines)
+
+    for name, sample in (("logs.setup", {}), ("logs.setup, 10% sampled", {'handled': 0.1, 'update': 0.1})):
+        sink = SlowStream(write_seconds)
+        logs.setup(logging.INFO, 'json', sample, stream=sink)
+        elapsed, lags = asyncio.run(run(handler_lazy, args.updates, args.concurrency))
+        drain = time.perf_counter()
+        logs.shutdown()
+        report(name, elapsed, lags, args.updates, sink.lines)
+        print(f"{'':24} writer thread finished {time.perf_counter() - drain:.2f}s after the loop")
+
+    n = 200_000
+    cart = [(item, 1) for item in range(5)]
+    started = time.perf_counter()
+    for chat_id in range(n):
+        logger.debug(f"cart for {chat_id}: {cart}")
+    fstring = (time.perf_counter() - started) / n
+    started = time.perf_counter()
+    for chat_id in range(n):
+        logger.debug("cart for %s: %s", chat_id, cart)
+    lazy = (time.perf_counter() - started) / n
+    print(f"filtered DEBUG call: f-string {fstring * 1e9:.0f} ns, %-style {lazy * 1e9:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
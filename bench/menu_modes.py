@@ -0,0 +1,120 @@
+"""
+Places the same order through the reply-keyboard flow and the inline menu
+(config.MENU_MODE) and compares Bot API calls and request bytes per order.
+
+Each customer picks a café, adds one item from its first page and two of an
+item from the next page, then checks out.
+
+    python bench/menu_modes.py [--users 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "menu_modes.db"))
+os.environ.setdefault("CHANNEL_ID", "-1001")
+os.environ.pop("WEBHOOK_URL", None)
+
+from telegram import Update  # noqa: E402
+
+import bot  # noqa: E402
+import config  # noqa: E402
+import menus  # noqa: E402
+import render  # noqa: E402
+import router  # noqa: E402
+
+CAFE = "Temberlin cafe"
+
+
+def picks():
+    """(first item, its page), (later item, its page) in CAFE."""
+    pages = render.cafe_pages(CAFE)
+    return (pages[0][1][0], 0), (pages[1][1][0], 1)
+
+
+async def feed(app, payload):
+    await app.process_update(Update.de_json(payload, app.bot))
+
+
+async def reply_order(app, chat_id):
+    (first, _), (later, _) = picks()
+    for payload in (
+        fakes.make_text(chat_id, CAFE),
+        fakes.make_text(chat_id, render.item_label(first)),
+        fakes.make_text(chat_id, render.item_label(later)),
+        fakes.make_text(chat_id, render.item_label(later)),
+        fakes.make_text(chat_id, "✅ Done"),
+        fakes.make_location(chat_id),
+    ):
+        await feed(app, payload)
+
+
+async def inline_order(app, chat_id):
+    (first, first_page), (later, later_page) = picks()
+    cafe = render.cafe_index(CAFE)
+    for op, *args in (
+        (router.MenuOp.PAGE, cafe, 0),
+        (router.MenuOp.ADD, first.id, first_page),
+        (router.MenuOp.PAGE, cafe, later_page),
+        (router.MenuOp.ADD, later.id, later_page),
+        (router.MenuOp.ADD, later.id, later_page),
+        (router.MenuOp.DONE,),
+    ):
+        await feed(app, fakes.make_callback(chat_id, router.menu_data(op, *args), "menu", channel_id=chat_id))
+    await feed(app, fakes.make_location(chat_id))
+
+
+async def measure(mode, users):
+    config.MENU_MODE = mode
+    api = fakes.FakeTelegramAPI()
+    app = bot.build_app(token=fakes.TOKEN, request=api, shape_traffic=False)
+    order = inline_order if mode == 'inline' else reply_order
+    async with app:
+        await bot.on_startup(app)
+        # Registration is the same in both modes and not counted.
+        first = 1_000_000 if mode == 'inline' else 2_000_000
+        for chat_id in range(first, first + users):
+            for payload in (fakes.make_text(chat_id, "/start"), fakes.make_text(chat_id, "🇺🇸 English"),
+                            fakes.make_contact(chat_id)):
+                await feed(app, payload)
+        api.calls.clear()
+        await asyncio.gather(*(order(app, chat_id) for chat_id in range(first, first + users)))
+        while api.count("sendMessage") and await bot.notifier.store.run(
+                lambda: bot.notifier.store.conn.execute("SELECT COUNT(*) FROM outbox WHERE state = 'pending'")
+                .fetchone()[0]):
+            await asyncio.sleep(0.05)
+        await bot.on_shutdown(app)
+    placed = sum(1 for m, p in api.calls if m == "sendMessage" and "ORDER DETAILS" in p.get("text", ""))
+    assert placed == users, (mode, placed)
+    customer = [(m, p) for m, p in api.calls if str(p.get("chat_id")) != str(config.CHANNEL_ID)]
+    methods = Counter(m for m, _ in customer)
+    size = sum(len(json.dumps(p, ensure_ascii=False).encode()) for _, p in customer)
+    return len(api.calls) / users, len(customer) / users, size / users, methods
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bot API calls and request bytes per order, reply-keyboard flow versus inline menu."
+    )
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    bot.SERVICE_MODE = 'OPEN'
+    (first, _), (later, page) = picks()
+    print(f"order: {menus.display_name(first)} x1 (page 1), {menus.display_name(later)} x2 (page {page + 1})")
+    for mode in ("reply", "inline"):
+        total, customer, size, methods = asyncio.run(measure(mode, args.users))
+        detail = ", ".join(f"{m} {n / args.users:.1f}" for m, n in methods.most_common())
+        print(f"{mode:6}: {total:.1f} API calls/order ({customer:.1f} to the customer: {detail}), "
+              f"{size / 1024:.1f} KiB sent to the customer")
+
+
+if __name__ == "__main__":
+    main()
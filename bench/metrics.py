@@ -0,0 +1,60 @@
+"""
+Per-update cost of the metrics layer: a no-op handler with and without
+metrics.instrument(), and a Bot API call through FakeTelegramAPI with and
+without InstrumentedRequest.
+
+    python bench/metrics.py [-n 200000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+import metrics  # noqa: E402
+
+
+async def handler(update, ctx):
+    return None
+
+
+async def time_handler(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        await fn(None, None)
+    return (time.perf_counter() - started) / n
+
+
+async def time_request(request, n):
+    url = f"https://api.telegram.org/bot{fakes.TOKEN}/sendChatAction"
+    started = time.perf_counter()
+    for _ in range(n):
+        await request.do_request(url, "POST")
+    return (time.perf_counter() - started) / n
+
+
+async def run(n):
+    bare = await time_handler(handler, n)
+    wrapped = await time_handler(metrics.instrument(handler), n)
+    print(f"handler   bare {bare * 1e9:7.0f} ns   instrumented {wrapped * 1e9:7.0f} ns   "
+          f"overhead {(wrapped - bare) * 1e9:6.0f} ns/update")
+
+    api = fakes.FakeTelegramAPI()
+    bare = await time_request(api, n // 10)
+    wrapped = await time_request(metrics.InstrumentedRequest(fakes.FakeTelegramAPI()), n // 10)
+    print(f"api call  bare {bare * 1e9:7.0f} ns   instrumented {wrapped * 1e9:7.0f} ns   "
+          f"overhead {(wrapped - bare) * 1e9:6.0f} ns/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-update cost of the metrics layer on handlers and Bot API calls.")
+    parser.add_argument("-n", type=int, default=200_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.n))
+
+
+if __name__ == "__main__":
+    main()
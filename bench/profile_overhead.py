@@ -0,0 +1,71 @@
+"""
+Cost of running the /profile sampler during load: the loadtest conversations
+are run with and without profiler.profile() sampling the loop, alternating,
+and the throughput of each is compared. Run-to-run noise here is a few
+percent, so the time the sampler itself spent on the loop is printed too
+(it is in the first line of every report). The last report is printed as
+the admin would receive it.
+
+    python bench/profile_overhead.py [--users 1000] [--rounds 3] [--interval 0.01]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loadtest  # noqa: E402  (imports fakes, which puts the repo root first on sys.path)
+from loadtest import fakes  # noqa: E402
+
+import bot  # noqa: E402
+import profiler  # noqa: E402
+
+
+async def run(users, concurrency, rounds, interval):
+    bot.SERVICE_MODE = 'OPEN'
+    api = fakes.FakeTelegramAPI()
+    app = bot.build_app(token=fakes.TOKEN, request=api, shape_traffic=False)
+    rates = {False: [], True: []}
+    report = None
+    async with app:
+        await bot.on_startup(app)
+        test = loadtest.LoadTest(app, api)
+        await test.run(min(50, users), concurrency, first_chat_id=10)
+        first = 1000
+        for _ in range(rounds):
+            for profiled in (False, True):
+                test.updates = 0
+                if profiled:
+                    stop = asyncio.Event()
+                    sampling = asyncio.create_task(profiler.profile(profiler.MAX_SECONDS, interval, stop))
+                    await asyncio.sleep(0)
+                elapsed = await test.run(users, concurrency, first_chat_id=first)
+                if profiled:
+                    stop.set()
+                    report = await sampling
+                rates[profiled].append(test.updates / elapsed)
+                first += users
+        await bot.on_shutdown(app)
+
+    plain, sampled = statistics.median(rates[False]), statistics.median(rates[True])
+    print(f"{users} users x {rounds} rounds, sampling every {interval * 1000:.0f} ms")
+    print(f"without profiler: {plain:7.0f} updates/s (median of {rounds})")
+    print(f"with profiler:    {sampled:7.0f} updates/s ({sampled / plain - 1:+.1%}), "
+          f"{report.sampler.samples} samples costing {report.sampler.spent * 1e6 / max(1, report.sampler.samples):.0f} us each")
+    print()
+    print(report.text())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of running the /profile sampler during load.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=profiler.INTERVAL)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.concurrency, args.rounds, args.interval))
+
+
+if __name__ == "__main__":
+    main()
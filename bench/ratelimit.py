@@ -0,0 +1,76 @@
+"""
+Pushes simulated requests through the rate limiter: the old list-rebuilding
+sliding window from bot.py versus ratelimit.RateLimiter, then checks that idle
+eviction brings the key count back down.
+
+    python bench/ratelimit.py [-n 2000000] [--keys 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit  # noqa: E402
+
+WINDOW, MAX_REQUESTS, BLOCK = 60, 20, 60
+
+
+def old_check(state_map, key, now):
+    state = state_map.setdefault(key, {"timestamps": [], "blocked_until": 0.0, "last_notice_at": 0.0})
+    if now < state["blocked_until"]:
+        return True
+    state["timestamps"] = [ts for ts in state["timestamps"] if now - ts < WINDOW]
+    state["timestamps"].append(now)
+    if len(state["timestamps"]) > MAX_REQUESTS:
+        state["blocked_until"] = now + BLOCK
+        state["timestamps"].clear()
+        return True
+    return False
+
+
+def workload(n, keys, seconds):
+    rng = random.Random(1)
+    # Mostly uniform traffic, plus 1% of requests from a handful of flooders.
+    return [
+        (rng.randrange(10) if rng.random() < 0.01 else rng.randrange(keys), i * seconds / n)
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rate limiter cost: the old sliding window versus ratelimit.RateLimiter, and idle eviction."
+    )
+    parser.add_argument("-n", type=int, default=2_000_000)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=600.0, help="simulated time span")
+    args = parser.parse_args()
+
+    requests = workload(args.n, args.keys, args.seconds)
+
+    state = {}
+    started = time.perf_counter()
+    for key, now in requests:
+        old_check(state, key, now)
+    old = time.perf_counter() - started
+
+    limiter = ratelimit.RateLimiter({'message': ratelimit.Limit(MAX_REQUESTS, WINDOW, BLOCK)})
+    check = limiter.check
+    denied = 0
+    started = time.perf_counter()
+    for key, now in requests:
+        if not check('message', key, now).allowed:
+            denied += 1
+    new = time.perf_counter() - started
+
+    print(f"old sliding window : {old / args.n * 1e9:7.0f} ns/request, {len(state)} keys held forever")
+    print(f"token bucket       : {new / args.n * 1e9:7.0f} ns/request, {denied} denied, {len(limiter.backend)} keys")
+    evicted = limiter.evict_idle(now=args.seconds + limiter.idle_seconds + 1)
+    print(f"after idle sweep   : {evicted} evicted, {len(limiter.backend)} keys left")
+
+
+if __name__ == "__main__":
+    main()
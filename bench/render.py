@@ -0,0 +1,57 @@
+"""
+Per-message CPU for the café item keyboard: building it every time (the old
+show_cafe_items path, including the to_dict()/json.dumps() PTB does before
+sending) versus reading it from render's cache.
+
+    python bench/render.py [--cafe "Temberlin cafe"] [-n 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import ReplyKeyboardMarkup  # noqa: E402
+
+import languages  # noqa: E402
+import menus  # noqa: E402
+import render  # noqa: E402
+
+
+def uncached(cafe, lang):
+    keyboard = []
+    section = None
+    for item in menus.current().cafes[cafe]:
+        if item.section and item.section != section:
+            keyboard.append([render.section_label(item.section)])
+        section = item.section
+        keyboard.append([render.item_label(item)])
+    keyboard += [[languages.get_text(lang, 'btn_done')], [languages.get_text(lang, 'btn_cancel')],
+                 [languages.get_text(lang, 'btn_back')]]
+    header = languages.get_text(lang, 'menu_header').format(cafe)
+    markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    return header, json.dumps(markup.to_dict())
+
+
+def cached(cafe, lang):
+    return render.cafe_menu(cafe, lang)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-message CPU for the café item keyboard: built every time versus cached."
+    )
+    parser.add_argument("--cafe", default="Temberlin cafe")
+    parser.add_argument("-n", type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, fn in (("uncached", uncached), ("cached", cached)):
+        for lang in ("en", "am"):
+            per_call = min(timeit.repeat(lambda: fn(args.cafe, lang), number=args.n, repeat=5)) / args.n
+            print(f"{name:9} {lang}: {per_call * 1e6:9.2f} µs/message")
+
+
+if __name__ == "__main__":
+    main()
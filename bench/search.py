@@ -0,0 +1,101 @@
+"""
+Menu search on a catalog of thousands of items: a linear scan that scores
+every item against the query versus search.SearchIndex, cold and cached.
+
+    python bench/search.py [--copies 40]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import menus  # noqa: E402
+import search  # noqa: E402
+
+QUERIES = ["t", "tu", "tun", "tuna", "tuna ", "tuna p", "tuna pizza", "vegetable", "sanwich", "sandw",
+           "wrap", "chese burger", "pizza large", "fasting", "kitfo", "firfir", "omlet", "xyz"]
+
+
+def big_catalog(copies):
+    """The real menu repeated under `copies` café names, with fresh item ids."""
+    base = menus.current()
+    cafes = OrderedDict()
+    next_id = 1
+    for n in range(copies):
+        for cafe, items in base.cafes.items():
+            name = f"{cafe} {n}"
+            cafes[name] = tuple(item._replace(id=next_id + i, cafe=name) for i, item in enumerate(items))
+            next_id += len(items)
+    return menus.Catalog("bench", cafes)
+
+
+def linear_search(catalog, query, limit=search.LIMIT):
+    """The same matching rules, recomputed against every item."""
+    words = search.tokens(query)
+    if not words:
+        return []
+    partial = not query[-1:].isspace()
+    scored = []
+    for order, item in enumerate(catalog.items.values()):
+        fields = [(w, weight) for text, weight in ((item.name, search.NAME), (item.size, search.SIZE),
+                                                   (item.section, search.SECTION), (item.cafe, search.CAFE))
+                  for w in search.tokens(text or '')]
+        total = 0
+        for n, token in enumerate(words):
+            last = partial and n == len(words) - 1
+            best = 0
+            for word, weight in fields:
+                score = weight if word.startswith(token) else 0
+                if len(token) >= search.MIN_FUZZY_LEN:
+                    q, w = search.trigrams(token), search.trigrams(word)
+                    sim = 2 * len(q & w) / (len(q) + len(w))
+                    if last:
+                        head = search.trigrams(token, end=False)
+                        sim = max(sim, len(head & w) / len(head))
+                    if sim >= search.FUZZY_THRESHOLD:
+                        score = max(score, weight * sim * search.FUZZY_PENALTY)
+                best = max(best, score)
+            if not best:
+                break
+            total += best
+        else:
+            scored.append((-total, order, item))
+    scored.sort(key=lambda entry: entry[:2])
+    return [item for _, _, item in scored[:limit]]
+
+
+def per_query_us(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for q in QUERIES:
+            fn(q)
+    return (time.perf_counter() - start) / (rounds * len(QUERIES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Menu search on a large catalog: a linear scan versus search.SearchIndex."
+    )
+    parser.add_argument("--copies", type=int, default=40, help="times the menu is repeated")
+    args = parser.parse_args()
+
+    catalog = big_catalog(args.copies)
+    start = time.perf_counter()
+    index = search.SearchIndex(catalog)
+    build = time.perf_counter() - start
+
+    for q in QUERIES:
+        assert [i.id for i in index.search(q)] == [i.id for i in linear_search(catalog, q)], q
+
+    menus.swap(catalog)   # search.search() indexes and caches the current catalog
+    print(f"{len(catalog.items)} items, {len(index.postings)} distinct words, index built in {build * 1000:.1f} ms")
+    print(f"linear scan:   {per_query_us(lambda q: linear_search(catalog, q), 1):10.1f} us/query")
+    print(f"index, cold:   {per_query_us(index.search, 20):10.1f} us/query")
+    print(f"index, cached: {per_query_us(search.search, 200):10.2f} us/query")
+
+
+if __name__ == "__main__":
+    main()
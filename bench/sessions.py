@@ -0,0 +1,100 @@
+"""
+Measures resident session memory per 100k registered users: the old
+free-form dicts versus storage.Session, then how many sessions the LRU/TTL
+tier keeps resident when most users are idle.
+
+    python bench/sessions.py [--users 100000] [--active 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+CAFES = ["Temberlin cafe", "Nest cafe", "Habesha pizza"]
+
+
+def documents(users, active):
+    """Stored JSON for every user; `active` of them have an open cart."""
+    rng = random.Random(1)
+    docs = []
+    for i in range(users):
+        data = storage.Session()
+        data.lang = rng.choice(['en', 'am'])
+        data.phone = f"+2519{i:08d}"
+        data.location = storage.Location(7.92 + rng.random() / 50, 38.09 + rng.random() / 50, "Werabe", 1.2)
+        if rng.random() < active:
+            data.current_cafe = rng.choice(CAFES)
+            data.stage = storage.Stage.CART
+            data.catalog_version = "0123456789ab"
+            for _ in range(rng.randint(1, 3)):
+                data.add_item(rng.randint(1, 99), rng.randint(50, 900))
+        docs.append(storage.encode_session(data).encode())
+    return docs
+
+
+def old_decode(raw):
+    # decode_session before sessions were slotted objects.
+    doc = json.loads(raw)
+    doc['orders'] = {entry[0]: entry[1] for entry in doc.get('orders', []) if len(entry) == 2}
+    doc.setdefault('catalog_version', None)
+    doc['awaiting_location'] = False
+    del doc['stage']
+    return doc
+
+
+def resident_bytes(decode, docs):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = {chat_id: decode(raw) for chat_id, raw in enumerate(docs)}
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(cache) == len(docs)
+    return after - before
+
+
+def tiering(docs, active, idle_ttl):
+    store = storage.SessionStore(":memory:", idle_ttl=idle_ttl, max_resident=len(docs))
+    now = time.monotonic()
+    rng = random.Random(2)
+    for chat_id, raw in enumerate(docs):
+        data = store.cache[chat_id] = storage.decode_session(raw)
+        # Active users touched within the TTL; the rest spread over the last day.
+        data.touched = now - rng.uniform(0, idle_ttl if rng.random() < active else 86400)
+    store.cache = OrderedDict(sorted(store.cache.items(), key=lambda kv: kv[1].touched))
+    start = time.perf_counter()
+    evicted = store.evict_idle(now)
+    return len(store.cache), evicted, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resident session memory: the old free-form dicts versus storage.Session, and LRU/TTL eviction."
+    )
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--active", type=float, default=0.05, help="share of users active within the TTL")
+    parser.add_argument("--idle-ttl", type=float, default=1800.0)
+    args = parser.parse_args()
+
+    docs = documents(args.users, args.active)
+    per_100k = 100_000 / args.users / 1024 / 1024
+    old = resident_bytes(old_decode, docs)
+    new = resident_bytes(storage.decode_session, docs)
+    print(f"{args.users} users, {args.active:.0%} with an open cart")
+    print(f"dict sessions:    {old * per_100k:7.1f} MiB per 100k users ({old / args.users:.0f} B/user)")
+    print(f"slotted sessions: {new * per_100k:7.1f} MiB per 100k users ({new / args.users:.0f} B/user)")
+
+    resident, evicted, seconds = tiering(docs, args.active, args.idle_ttl)
+    print(f"LRU/TTL tier: {resident} resident, {evicted} paged out in {seconds * 1000:.1f} ms "
+          f"-> {new * resident / args.users * per_100k:.1f} MiB per 100k registered users")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Cold start: time from launching `python bot.py` to the first handled update.
+
+The bot runs as a real process in webhook mode, against a stand-in Bot API
+server in this process (BOT_API_URL) that adds --api-latency to every call.
+As soon as the bot's port accepts connections, the bench posts a returning
+customer's message to the webhook, the way Render forwards the request that
+woke a sleeping service, and redelivers on refusal as Telegram does. The
+update counts as handled when the reply reaches the stand-in API. The bot
+is then stopped with SIGTERM, so each boot but the first can read the
+snapshot the previous one wrote; --no-snapshot deletes it before each boot.
+
+    python bench/startup.py [--runs 5] [--api-latency 0.15] [--bot path/to/bot.py]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+from aiohttp import ClientSession, ClientError, web  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT_ID = 4242
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StandInAPI:
+    def __init__(self, latency):
+        self.latency = latency
+        self.fake = fakes.FakeTelegramAPI()
+        self.replied = None   # future resolved by the first sendMessage to CHAT_ID
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await request.json() if request.content_type == 'application/json' else dict(await request.post())
+        await asyncio.sleep(self.latency)
+        if method == 'sendMessage' and str(params.get('chat_id')) == str(CHAT_ID):
+            if self.replied is not None and not self.replied.done():
+                self.replied.set_result(time.perf_counter())
+        return web.json_response({'ok': True, 'result': self.fake.answer(method, params)})
+
+
+async def boot(bot_path, env, api, port, payload):
+    """(port bound, update acknowledged, update handled, refusals), in seconds since launch."""
+    api.replied = asyncio.get_running_loop().create_future()
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(sys.executable, bot_path, env=env,
+                                                stdout=asyncio.subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.002)
+        bound = time.perf_counter()
+
+        refused = 0
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        async with ClientSession() as http:
+            while True:
+                try:
+                    async with http.post(f"http://127.0.0.1:{port}/telegram", json=payload, headers=headers) as r:
+                        if r.status == 200:
+                            break
+                        retry = float(r.headers.get("Retry-After", 1))
+                except ClientError:
+                    retry = 0.05
+                refused += 1
+                await asyncio.sleep(retry)
+        acked = time.perf_counter()
+        handled = await asyncio.wait_for(api.replied, 60)
+        return bound - started, acked - started, handled - started, refused
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        await proc.wait()
+
+
+async def run(bot_path, runs, latency, snapshot):
+    api = StandInAPI(latency)
+    web_app = web.Application()
+    web_app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', api_port).start()
+
+    workdir = tempfile.mkdtemp()
+    port = free_port()
+    db_path = os.path.join(workdir, "startup.db")
+    env = {
+        **os.environ,
+        "BOT_TOKEN": fakes.TOKEN, "BOT_API_URL": f"http://127.0.0.1:{api_port}", "CHANNEL_ID": "-1001",
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}", "WEBHOOK_SECRET": SECRET, "PORT": str(port),
+        "DB_PATH": db_path, "LOG_LEVEL": "WARNING",
+    }
+
+    # Register the customer once, so every measured boot sees a returning one.
+    for payload in (fakes.make_text(CHAT_ID, "/start"),):
+        await boot(bot_path, env, api, port, payload)
+
+    results = []
+    for _ in range(runs):
+        if not snapshot and os.path.exists(db_path + ".snapshot"):
+            os.remove(db_path + ".snapshot")
+        results.append(await boot(bot_path, env, api, port, fakes.make_text(CHAT_ID, "🇺🇸 English")))
+    await runner.cleanup()
+
+    bound, acked, handled, refused = (statistics.median(column) for column in zip(*results))
+    print(f"{bot_path}: {runs} boots, API latency {latency * 1000:.0f} ms, "
+          f"snapshot {'on' if snapshot else 'off'} (medians)")
+    print(f"  port accepting connections  {bound * 1000:7.0f} ms")
+    print(f"  first update acknowledged   {acked * 1000:7.0f} ms  ({refused:.0f} refusals)")
+    print(f"  first update handled        {handled * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cold start: time from launching `python bot.py` to the first handled update."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--api-latency", type=float, default=0.15, help="seconds per Bot API call")
+    parser.add_argument("--bot", default=os.path.join(ROOT, "bot.py"))
+    parser.add_argument("--no-snapshot", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.bot, args.runs, args.api_latency, not args.no_snapshot))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Drives the webhook server end to end.
+
+Starts the real HTTP server and Application (with FakeTelegramAPI standing in
+for api.telegram.org), then acts as Telegram: POSTs update payloads to the
+webhook with the secret header and checks that every update was handled.
+
+    python bench/webhook.py [--users 200] [--queue 100]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402  (also puts the repo root on sys.path)
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ["WEBHOOK_URL"] = "http://127.0.0.1"
+
+import aiohttp  # noqa: E402
+
+import bot  # noqa: E402
+import config  # noqa: E402
+from keep_alive import KeepAliveServer, WEBHOOK_PATH  # noqa: E402
+
+
+async def run(users, queue_size, port):
+    config.UPDATE_QUEUE_SIZE = queue_size
+    api = fakes.FakeTelegramAPI()
+    app = bot.build_app(token=fakes.TOKEN, request=api, shape_traffic=False)
+    server = KeepAliveServer(port, host="127.0.0.1", secret=config.WEBHOOK_SECRET)
+    stop = asyncio.Event()
+    serving = asyncio.create_task(bot.serve(app, server, stop))
+
+    base = f"http://127.0.0.1:{port}"
+    async with aiohttp.ClientSession() as http:
+        while True:
+            try:
+                async with http.get(base + "/readyz") as r:
+                    if r.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+
+        async with http.post(base + WEBHOOK_PATH, json=fakes.make_text(1, "/start")) as r:
+            assert r.status == 403, "webhook must reject requests without the secret"
+
+        headers = {"X-Telegram-Bot-Api-Secret-Token": config.WEBHOOK_SECRET}
+        updates = [fakes.make_text(chat_id, "/start") for chat_id in range(1, users + 1)]
+        updates += [fakes.make_text(chat_id, "🇺🇸 English") for chat_id in range(1, users + 1)]
+        refused = 0
+
+        async def deliver(payload):
+            nonlocal refused
+            # Like Telegram: keep redelivering until the server accepts it.
+            while True:
+                async with http.post(base + WEBHOOK_PATH, json=payload, headers=headers) as r:
+                    if r.status == 200:
+                        return
+                    refused += 1
+                    await asyncio.sleep(float(r.headers.get("Retry-After", 1)))
+
+        started = time.perf_counter()
+        # /start must land before the language choice for the same chat.
+        await asyncio.gather(*(deliver(u) for u in updates[:users]))
+        await asyncio.gather(*(deliver(u) for u in updates[users:]))
+        while not app.update_queue.empty():
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await serving
+
+    sent = api.count("sendMessage")
+    print(f"{len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.0f}/s), "
+          f"{refused} refused for backpressure, {sent} replies sent")
+    assert sent >= len(updates), "every update should have produced a reply"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drives the webhook server end to end.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--queue", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.queue, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,108 @@
+import asyncio
 import logging
 import datetime
+import signal
+import time
+import functools
+import io
 import uuid
+
+import config
+
+# Started as a script: bind the HTTP port before the heavy imports below. Render
+# counts the service as up once the port is open, and the request that woke it
+# waits in the listen backlog until run() serves on this socket. Workers of a
+# multi-process bot get their updates from the front instead (see cluster.py).
+LISTEN_SOCKET = None
+if __name__ == "__main__" and config.WORKER_INDEX is None:
+    import socket
+    LISTEN_SOCKET = socket.create_server(("0.0.0.0", config.PORT), backlog=128)
+
 from telegram import (
-    Update, KeyboardButton, ReplyKeyboardMarkup,
-    InlineKeyboardButton, InlineKeyboardMarkup, Contact
+    Update, InlineKeyboardButton, InlineKeyboardMarkup
 )
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    CallbackQueryHandler, ContextTypes, filters
+    CallbackQueryHandler, ContextTypes, InlineQueryHandler, filters
 )
-
-import config
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+
+# The modules below take about 20 ms together, against about 550 ms for telegram,
+# httpx and aiohttp, and boot starts or reaches nearly all of them (the ledger
+# records into analytics, the workers shard with cluster), so they are imported
+# here. Only profiler waits for the command that needs it.
+import analytics
+import gateway
 import geofence
+import hours
 import menus 
+import metrics
 import languages
-from keep_alive import keep_alive
-
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+import logs
+import render
+import orders
+import pricing
+import outbox
+import preorders
+import processing
+import ratelimit
+import router
+import search
+import storage
+import broadcast
+import cluster
+import dispatch
+import shared
+from keep_alive import KeepAliveServer, WEBHOOK_PATH
+
+logs.setup(config.LOG_LEVEL, config.LOG_FORMAT, logs.parse_rates(config.LOG_SAMPLE))
 logger = logging.getLogger(__name__)
 
 # --- STORAGE ---
-user_data = {}           
-username_map = {}        
-rate_limit_state = {}
+# This worker's (index, count) when the bot runs as several processes (see cluster.py)
+SHARD = None if config.WORKER_INDEX is None else (config.WORKER_INDEX, config.WORKERS)
+sessions = storage.SessionStore(
+    config.DB_PATH,
+    snapshot_path=config.SNAPSHOT_PATH if SHARD is None else f"{config.SNAPSHOT_PATH}.{SHARD[0]}",
+)
+user_data = sessions.cache   # chat_id -> session, loaded lazily by check_user_exists
+broadcasts = broadcast.BroadcastEngine(sessions, shard=SHARD)
+ledger = orders.OrderLedger(sessions)
+reports = analytics.Analytics(sessions)
+notifier = outbox.Outbox(sessions, shard=SHARD)
+# Orders are matched to couriers where the channel's callbacks arrive (see dispatch.py)
+DISPATCHING = SHARD is None or cluster.shard_of(int(config.CHANNEL_ID), SHARD[1]) == SHARD[0]
+dispatcher = dispatch.Dispatcher(sessions, ledger, notifier, active=DISPATCHING, shared=SHARD is not None)
+preorder_queue = preorders.PreorderQueue(sessions, notifier, shard=SHARD)
+rate_limiter = ratelimit.RateLimiter({
+    'message': ratelimit.Limit(capacity=20, per_seconds=60, block_seconds=60),
+    'callback': ratelimit.Limit(capacity=30, per_seconds=60, block_seconds=30),
+    'order': ratelimit.Limit(capacity=3, per_seconds=600, block_seconds=600),
+    'inline': ratelimit.Limit(capacity=60, per_seconds=60, block_seconds=30),
+})
+
+background_tasks = []
 
 ADMIN_USERNAME = "kanzedin"
 SERVICE_MODE = 'AUTO' 
-RATE_LIMIT_WINDOW_SECONDS = 60
-RATE_LIMIT_MAX_REQUESTS = 20
-RATE_LIMIT_BLOCK_SECONDS = 60
+
+def apply_shared(key, value):
+    """Takes in a setting changed by another bot process."""
+    global SERVICE_MODE
+    if key == 'service_mode':
+        SERVICE_MODE = value
+
+cluster_state = shared.SharedState(
+    shared.SQLiteBackend(sessions) if config.STATE_BACKEND == 'sqlite' else shared.MemoryBackend(),
+    on_change=apply_shared,
+)
 
 # --- HELPERS ---
 
 def get_user_lang(chat_id):
-    return user_data.get(chat_id, {}).get('lang', 'en')
+    data = user_data.get(chat_id)
+    return (data and data.lang) or 'en'
 
 def t(chat_id, key):
     lang = get_user_lang(chat_id)
@@ -49,9 +115,25 @@ def is_admin(update: Update) -> bool:
 def is_open() -> bool:
     if SERVICE_MODE == 'OPEN': return True
     if SERVICE_MODE == 'CLOSED': return False
-    # Timezone: EAT (UTC+3)
-    now = datetime.datetime.utcnow() + datetime.timedelta(hours=3)
-    return config.OPEN_HOUR <= now.hour < config.CLOSE_HOUR
+    return hours.HOURS.is_open()
+
+def opens_at(cafes=()):
+    """When an order from `cafes` can go out: now if open, else the next opening if it is
+    within PREORDER_HOURS (a pre-order), else None."""
+    if SERVICE_MODE == 'OPEN': return time.time()
+    if SERVICE_MODE == 'CLOSED': return None
+    return hours.HOURS.opens_at(cafes, within=config.PREORDER_HOURS * 3600)
+
+def closed_text(chat_id):
+    next_open = hours.HOURS.opens_at() if SERVICE_MODE == 'AUTO' else None
+    if next_open is None:
+        return t(chat_id, 'closed')
+    return t(chat_id, 'closed_until').format(hours.HOURS.local_time(next_open))
+
+class CourierFilter(filters.MessageFilter):
+    """Messages from chats on the courier roster."""
+    def filter(self, message):
+        return dispatcher.is_courier(message.chat.id)
 
 def track_username(update: Update):
     """Updates the map of usernames to chat_ids on every interaction"""
@@ -59,65 +141,71 @@ def track_username(update: Update):
     chat_id = update.effective_chat.id
     if user and user.username:
         # Store as lowercase for case-insensitive lookup
-        username_map[user.username.lower()] = chat_id
+        sessions.set_username(user.username.lower(), chat_id)
+
+def persist_session(handler):
+    """Queues the chat's session for the next background flush once the handler finishes."""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+        try:
+            return await handler(update, ctx)
+        finally:
+            if update.effective_chat:
+                sessions.mark_dirty(update.effective_chat.id)
+    return wrapper
+
+def keyboard_after_step():
+    """Clears the reply keyboard before an inline menu follows; reply mode keeps it."""
+    return render.remove_keyboard() if config.MENU_MODE == 'inline' else None
+
+def price_summary(chat_id, quote):
+    """The customer-facing cart summary for a pricing.Quote."""
+    lines = [f"{menus.display_name(line.item)} x{line.qty}" for line in quote.lines]
+    lines += ["", f"{t(chat_id, 'delivery_fee')}: {quote.fee} ETB"]
+    if quote.discount:
+        lines.append(f"{t(chat_id, 'discount')} ({quote.promotion}): -{quote.discount} ETB")
+    lines.append(f"*{t(chat_id, 'total')}: {quote.total} ETB*")
+    return "\n".join(lines)
 
 async def check_is_closed(update, chat_id):
-    """Returns True if closed, and sends message."""
-    if not is_open():
-        await update.message.reply_text(t(chat_id, 'closed'))
+    """Returns True if closed, and sends message. Not while pre-orders are taken."""
+    if opens_at() is None:
+        await update.message.reply_text(closed_text(chat_id))
         return True
     return False
 
+async def tell_preorder(update, chat_id):
+    """While closed but taking pre-orders, says when orders will go out."""
+    if not is_open():
+        when = hours.HOURS.local_time(opens_at())
+        await update.message.reply_text(t(chat_id, 'preorder_notice').format(when))
+
 async def ask_for_phone(update, chat_id):
-    btn_text = t(chat_id, 'btn_phone')
-    kb = ReplyKeyboardMarkup([[KeyboardButton(btn_text, request_contact=True)]], resize_keyboard=True, one_time_keyboard=False)
+    kb = render.phone_keyboard(get_user_lang(chat_id))
     await update.message.reply_text(t(chat_id, 'ask_phone'), reply_markup=kb)
 
 async def check_user_exists(update, chat_id):
-    if chat_id not in user_data:
-        user_data[chat_id] = {
-            'lang': None, 'phone': None, 'orders': {}, 
-            'current_cafe': None, 'location': None
-        }
+    if await sessions.load(chat_id) is None:
+        sessions.create(chat_id)
         return False 
     return True 
 
-async def check_rate_limit(update: Update, chat_id: int) -> bool:
-    """Returns True when the user has exceeded the request limit."""
+async def check_rate_limit(update: Update, chat_id: int, action: str = 'message') -> bool:
+    """Returns True when the user has exceeded the limit for `action`."""
     if is_admin(update):
         return False
 
-    if not update.message:
+    decision = rate_limiter.check(action, chat_id)
+    if decision.allowed:
         return False
 
-    now_ts = datetime.datetime.utcnow().timestamp()
-    state = rate_limit_state.setdefault(
-        chat_id,
-        {"timestamps": [], "blocked_until": 0.0, "last_notice_at": 0.0},
-    )
-
-    if now_ts < state["blocked_until"]:
-        if now_ts - state["last_notice_at"] >= 5:
-            wait_seconds = int(state["blocked_until"] - now_ts) + 1
-            await update.message.reply_text(t(chat_id, "rate_limited").format(wait_seconds))
-            state["last_notice_at"] = now_ts
-        return True
-
-    state["timestamps"] = [
-        ts for ts in state["timestamps"] if now_ts - ts < RATE_LIMIT_WINDOW_SECONDS
-    ]
-    state["timestamps"].append(now_ts)
-
-    if len(state["timestamps"]) > RATE_LIMIT_MAX_REQUESTS:
-        state["blocked_until"] = now_ts + RATE_LIMIT_BLOCK_SECONDS
-        state["timestamps"].clear()
-        state["last_notice_at"] = now_ts
-        await update.message.reply_text(
-            t(chat_id, "rate_limited").format(RATE_LIMIT_BLOCK_SECONDS)
-        )
-        return True
-
-    return False
+    if decision.notify:
+        notice = t(chat_id, "rate_limited").format(int(decision.retry_after) + 1)
+        if update.callback_query:
+            await update.callback_query.answer(notice)
+        elif update.message:
+            await update.message.reply_text(notice)
+    return True
 
 # --- ADMIN HANDLERS ---
 
@@ -137,22 +225,23 @@ async def admin_dm(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     message_body = " ".join(ctx.args[1:])
 
     # Lookup Chat ID
-    target_chat_id = username_map.get(target_handle)
+    target_chat_id = await sessions.lookup_username(target_handle)
 
     if not target_chat_id:
-        await update.message.reply_text(f"❌ User @{target_handle} not found in bot memory.\n(They must interact with the bot after the last server restart).")
+        await update.message.reply_text(f"❌ User @{target_handle} not found.\n(They must have started the bot at least once).")
         return
 
     # Send Message
     try:
         # Get user lang for a localized header, or default to English/Neutral
-        user_lang = user_data.get(target_chat_id, {}).get('lang', 'en')
+        target_data = await sessions.load(target_chat_id)
+        user_lang = (target_data and target_data.lang) or 'en'
         header = languages.TEXTS[user_lang].get('admin_dm', "🔔 Notification:\n\n{}").format(message_body)
         
         await ctx.bot.send_message(target_chat_id, header)
         await update.message.reply_text(f"✅ Message sent to @{target_handle}")
     except Exception as e:
-        logger.error(f"DM Failed: {e}")
+        logger.error("DM to %s failed: %s", target_chat_id, e)
         await update.message.reply_text(f"❌ Failed to send: {e}")
 
 async def admin_broadcast(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -162,17 +251,8 @@ async def admin_broadcast(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /broadcast <message>")
         return
     
-    count = 0
-    await update.message.reply_text(f"📤 Sending to {len(user_data)} users...")
-    
-    for uid, udata in user_data.items():
-        lang = udata.get('lang', 'en')
-        prefix = languages.get_text(lang, 'admin_broadcast').format(msg)
-        try:
-            await ctx.bot.send_message(uid, prefix)
-            count += 1
-        except: pass
-    await update.message.reply_text(f"✅ Sent to {count} users.")
+    targets = await sessions.all_langs()
+    await broadcasts.submit(ctx.bot, msg, update.effective_chat.id, targets)
 
 async def admin_control(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     global SERVICE_MODE
@@ -181,10 +261,12 @@ async def admin_control(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if "/open" in cmd: SERVICE_MODE = 'OPEN'
     elif "/close" in cmd: SERVICE_MODE = 'CLOSED'
     elif "/auto" in cmd: SERVICE_MODE = 'AUTO'
+    await cluster_state.set('service_mode', SERVICE_MODE)   # the other bot processes follow within a second
     await update.message.reply_text(f"Service Mode: {SERVICE_MODE}")
 
 # --- USER HANDLERS ---
 
+@persist_session
 async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     track_username(update) # Track user
     chat_id = update.effective_chat.id
@@ -193,26 +275,28 @@ async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await check_user_exists(update, chat_id)
 
     # 1. Language Selection (Always First)
-    if not user_data[chat_id]['lang']:
-        keyboard = ReplyKeyboardMarkup([['🇺🇸 English', '🇪🇹 አማርኛ']], resize_keyboard=True, one_time_keyboard=True)
+    if not user_data[chat_id].lang:
+        keyboard = render.language_keyboard()
         msg = languages.TEXTS['am'].get('choose_lang', "Please select language:")
         await update.message.reply_text(msg, reply_markup=keyboard)
         return
 
     # Admin Help
     if is_admin(update):
-        await update.message.reply_text("👑 Admin: /open, /close, /auto, /broadcast, /dm")
+        await update.message.reply_text("👑 Admin: /open, /close, /auto, /broadcast, /dm, /orders, /courier, /report")
 
     # 2. Check Time
     if await check_is_closed(update, chat_id): return
+    await tell_preorder(update, chat_id)
 
     # 3. Check Phone
-    if not user_data[chat_id].get("phone"):
+    if not user_data[chat_id].phone:
         await ask_for_phone(update, chat_id)
         return
 
     await show_main_menu(update)
 
+@persist_session
 async def set_language(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     track_username(update)
     chat_id = update.effective_chat.id
@@ -221,21 +305,22 @@ async def set_language(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     await check_user_exists(update, chat_id)
 
-    if "English" in text:
-        user_data[chat_id]['lang'] = 'en'
-    elif "አማርኛ" in text:
-        user_data[chat_id]['lang'] = 'am'
+    lang = router.LANGUAGE_BUTTONS.get(text)
+    if lang:
+        user_data[chat_id].lang = lang
     
     # Check Time before proceeding
     if await check_is_closed(update, chat_id): return
 
     await update.message.reply_text(t(chat_id, 'welcome'))
+    await tell_preorder(update, chat_id)
     
-    if not user_data[chat_id].get("phone"):
+    if not user_data[chat_id].phone:
         await ask_for_phone(update, chat_id)
     else:
         await show_main_menu(update)
 
+@persist_session
 async def contact(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     track_username(update)
     chat_id = update.effective_chat.id
@@ -245,10 +330,11 @@ async def contact(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if await check_is_closed(update, chat_id): return
     
     if update.message.contact:
-        user_data[chat_id]['phone'] = update.message.contact.phone_number
-        await update.message.reply_text(t(chat_id, 'phone_saved'))
+        user_data[chat_id].phone = update.message.contact.phone_number
+        await update.message.reply_text(t(chat_id, 'phone_saved'), reply_markup=keyboard_after_step())
         await show_main_menu(update)
 
+@persist_session
 async def handle_text(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     track_username(update)
     chat_id = update.effective_chat.id
@@ -261,13 +347,15 @@ async def handle_text(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await start(update, ctx)
         return
 
+    route = router.route(text)
+
     # 2. Handle Language Setup
-    if text in ['🇺🇸 English', '🇪🇹 አማርኛ']:
+    if route and route.action is router.Action.LANGUAGE:
         await set_language(update, ctx)
         return
 
     # 3. Safety: Ensure Lang is set
-    if not user_data[chat_id].get('lang'):
+    if not user_data[chat_id].lang:
         await start(update, ctx)
         return
 
@@ -275,140 +363,245 @@ async def handle_text(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if await check_is_closed(update, chat_id): return
 
     # 5. STRICT PHONE CHECK
-    if not user_data[chat_id].get("phone"):
+    if not user_data[chat_id].phone:
         await ask_for_phone(update, chat_id)
         return
 
     # --- Proceed (Profile, Time, and Phone are all valid) ---
 
-    lang = user_data[chat_id]['lang']
     data = user_data[chat_id]
-
-    # Navigation
-    if text == t(chat_id, 'btn_back'):
-        await show_main_menu(update)
-        return
-    
-    if text == t(chat_id, 'btn_profile'):
-        await show_profile(update)
+    if route is None or route.action not in router.ALLOWED[router.state_of(data)]:
         return
+    await TEXT_ACTIONS[route.action](update, ctx, data, route.arg)
 
-    if text == t(chat_id, 'btn_switch_lang'):
-        data['lang'] = None
-        await start(update, ctx)
-        return
+async def inline_search(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query
+    if await check_rate_limit(update, query.from_user.id, 'inline'): return
+    results = [render.inline_result(item) for item in search.search(query.query)]
+    await query.answer(results, cache_time=300)
 
-    if text == t(chat_id, 'btn_edit_phone'):
-        data['phone'] = None
-        await start(update, ctx)
-        return
+# --- TEXT ACTIONS (dispatched by handle_text through router) ---
 
-    if text == t(chat_id, 'btn_cancel'):
-        data['orders'] = {}
-        data['current_cafe'] = None
-        await update.message.reply_text(t(chat_id, 'order_cancelled'))
-        await show_main_menu(update)
-        return
+async def on_back(update, ctx, data, arg):
+    await show_main_menu(update)
 
-    # Ordering Logic
-    if not data.get("current_cafe"):
-        if text in menus.CAFES:
-            data['current_cafe'] = text
-            await show_cafe_items(update, text)
-        return
+async def on_profile(update, ctx, data, arg):
+    await show_profile(update)
 
-    if text == t(chat_id, 'btn_done'):
-        if not data['orders']:
-            await update.message.reply_text(t(chat_id, 'cart_empty'))
-            return
-        await request_location(update)
-        return
+async def on_switch_lang(update, ctx, data, arg):
+    data.lang = None
+    await start(update, ctx)
 
-    # Add Item to Cart
-    try:
-        if " — " not in text: return
-        item, _, _ = text.partition(" — ")
-        current_cafe = data['current_cafe']
-        
-        # Validation checks
-        if current_cafe not in menus.CAFES or item not in menus.CAFES[current_cafe]: return
-        if menus.CAFES[current_cafe][item] is None: return
+async def on_edit_phone(update, ctx, data, arg):
+    data.phone = None
+    await start(update, ctx)
 
-        key = (current_cafe, item)
-        data['orders'][key] = data['orders'].get(key, 0) + 1
-        msg = t(chat_id, 'added_cart').format(item, data['orders'][key])
-        await update.message.reply_text(msg)
-    except:
-        pass
+async def on_cancel(update, ctx, data, arg):
+    chat_id = update.effective_chat.id
+    data.clear_cart()
+    await update.message.reply_text(t(chat_id, 'order_cancelled'))
+    await show_main_menu(update)
+
+async def on_cafe(update, ctx, data, cafe):
+    data.current_cafe = cafe
+    data.stage = storage.Stage.CART
+    await show_cafe_items(update, cafe)
+
+async def on_done(update, ctx, data, arg):
+    if not data.cart:
+        await update.message.reply_text(t(update.effective_chat.id, 'cart_empty'))
+        return
+    await request_location(update)
+
+async def on_item(update, ctx, data, items_by_cafe):
+    # The same label can exist in several cafés; the current one wins. A pick from
+    # inline search can name another café, which then becomes the current one.
+    cafe = data.current_cafe
+    if cafe not in items_by_cafe:
+        if len(items_by_cafe) != 1: return
+        (cafe,) = items_by_cafe
+        data.current_cafe = cafe
+        if data.stage is storage.Stage.CAFE:
+            data.stage = storage.Stage.CART
+    item_id = items_by_cafe[cafe]
+
+    if not data.catalog_version:
+        # Pin the catalog version so prices stay put while this cart is open.
+        data.catalog_version = menus.current().version
+    item = menus.get(data.catalog_version).item(item_id)
+    if item is None:
+        # Added to the menu after this cart was opened.
+        await update.message.reply_text(t(update.effective_chat.id, 'item_not_found'))
+        return
+    qty = data.add_item(item_id, item.price)
+    msg = t(update.effective_chat.id, 'added_cart').format(menus.display_name(item), qty)
+    await update.message.reply_text(msg)
+
+TEXT_ACTIONS = {
+    router.Action.BACK: on_back,
+    router.Action.PROFILE: on_profile,
+    router.Action.SWITCH_LANG: on_switch_lang,
+    router.Action.EDIT_PHONE: on_edit_phone,
+    router.Action.CANCEL: on_cancel,
+    router.Action.CAFE: on_cafe,
+    router.Action.DONE: on_done,
+    router.Action.ITEM: on_item,
+}
 
 async def show_main_menu(update: Update):
     chat_id = update.effective_chat.id
     
-    user_data[chat_id]['current_cafe'] = None
-    user_data[chat_id]['awaiting_location'] = False
+    user_data[chat_id].current_cafe = None
+    user_data[chat_id].stage = storage.Stage.CAFE
     
-    cafés = list(menus.CAFES.keys())
-    menu_buttons = [[c] for c in cafés]
-    menu_buttons.append([t(chat_id, 'btn_profile')]) 
-    
-    kb = ReplyKeyboardMarkup(menu_buttons, resize_keyboard=True)
-    await update.message.reply_text(t(chat_id, 'choose_cafe'), reply_markup=kb)
+    if config.MENU_MODE == 'inline':
+        text, kb = render.inline_cafes(get_user_lang(chat_id))
+    else:
+        text, kb = render.main_menu(get_user_lang(chat_id))
+    await update.effective_message.reply_text(text, reply_markup=kb)
 
 async def show_cafe_items(update: Update, cafe_name: str):
     chat_id = update.effective_chat.id
-    menu = menus.CAFES[cafe_name]
-    keyboard = []
-    for item, price in menu.items():
-        if price is None: keyboard.append([item])
-        else: keyboard.append([f"{item} — {price} ETB"])
-    
-    keyboard += [[t(chat_id, 'btn_done')], [t(chat_id, 'btn_cancel')], [t(chat_id, 'btn_back')]]
-    header = t(chat_id, 'menu_header').format(cafe_name)
-    await update.message.reply_text(header, reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True))
+    if cafe_name not in menus.current().cafes:
+        # The café was dropped by a menu reload.
+        await show_main_menu(update)
+        return
+    header, kb = render.cafe_menu(cafe_name, get_user_lang(chat_id))
+    await update.message.reply_text(header, reply_markup=kb)
 
 async def request_location(update: Update):
     chat_id = update.effective_chat.id
     data = user_data[chat_id]
     
-    if not data.get("phone"):
+    if not data.phone:
         await ask_for_phone(update, chat_id)
         return
 
-    total = 39
-    lines = []
-    for (cafe, item), qty in data['orders'].items():
-        price = menus.CAFES[cafe][item]
-        total += price * qty
-        lines.append(f"{item} x{qty}")
-
-    summary = "\n".join(lines)
-    msg = f"{summary}\n\n{t(chat_id, 'delivery_fee')}: 39 ETB\n*{t(chat_id, 'total')}: {total} ETB*"
+    # The fee here is the default; the final quote is priced for the shared location.
+    msg = price_summary(chat_id, pricing.quote(data))
+    kb = render.location_keyboard(get_user_lang(chat_id))
     
-    kb = ReplyKeyboardMarkup(
-        [[KeyboardButton(t(chat_id, 'btn_location'), request_location=True)], 
-         [t(chat_id, 'btn_cancel'), t(chat_id, 'btn_back')]],
-        resize_keyboard=True, one_time_keyboard=False
-    )
-    
-    data['awaiting_location'] = True
-    await update.message.reply_text(msg + "\n\n" + t(chat_id, 'ask_location'), reply_markup=kb, parse_mode="Markdown")
+    data.stage = storage.Stage.LOCATION
+    await update.effective_message.reply_text(msg + "\n\n" + t(chat_id, 'ask_location'), reply_markup=kb, parse_mode="Markdown")
 
 async def show_profile(update: Update):
     chat_id = update.effective_chat.id
     data = user_data[chat_id]
     
-    phone = data.get('phone', 'N/A')
-    loc_status = t(chat_id, 'location_set') if data.get('location') else t(chat_id, 'location_not_set')
+    phone = data.phone or 'N/A'
+    loc_status = t(chat_id, 'location_set') if data.location else t(chat_id, 'location_not_set')
     
     msg = t(chat_id, 'profile_header').replace("{}", str(phone), 1).replace("{}", str(loc_status), 1)
     
-    kb = ReplyKeyboardMarkup([
-        [t(chat_id, 'btn_switch_lang'), t(chat_id, 'btn_edit_phone')],
-        [t(chat_id, 'btn_back')]
-    ], resize_keyboard=True)
+    kb = render.profile_keyboard(get_user_lang(chat_id))
     
     await update.message.reply_text(msg, parse_mode='Markdown', reply_markup=kb)
 
+# --- INLINE MENU (config.MENU_MODE == 'inline') ---
+
+async def edit_menu(query, text, kb, toast=None, markup_only=False):
+    """Answers the tap and redraws the menu message in place."""
+    if markup_only:
+        edit = query.edit_message_reply_markup(reply_markup=kb)
+    else:
+        edit = query.edit_message_text(text, reply_markup=kb)
+    try:
+        await asyncio.gather(query.answer(toast), edit)
+    except BadRequest as e:
+        if 'not modified' not in str(e):
+            raise
+
+async def show_inline_page(query, data, cafe, page, toast=None, markup_only=False):
+    lang = get_user_lang(query.message.chat.id)
+    if cafe not in menus.current().cafes:
+        # The café was dropped by a menu reload.
+        data.current_cafe, data.stage = None, storage.Stage.CAFE
+        await edit_menu(query, *render.inline_cafes(lang))
+        return
+    text, kb = render.inline_cafe_page(cafe, page, lang, dict(data.cart), pricing.subtotal(data))
+    await edit_menu(query, text, kb, toast, markup_only)
+
+async def on_menu_home(update, data):
+    data.current_cafe, data.stage = None, storage.Stage.CAFE
+    await edit_menu(update.callback_query, *render.inline_cafes(get_user_lang(update.effective_chat.id)))
+
+async def on_menu_page(update, data, cafe_index, page):
+    cafe = render.cafe_at(cafe_index)
+    if cafe is None:
+        await on_menu_home(update, data)
+        return
+    data.current_cafe = cafe
+    if data.stage is storage.Stage.CAFE:
+        data.stage = storage.Stage.CART
+    await show_inline_page(update.callback_query, data, cafe, page)
+
+async def on_menu_add(update, data, item_id, page):
+    chat_id = update.effective_chat.id
+    if not data.catalog_version:
+        # Pin the catalog version so prices stay put while this cart is open.
+        data.catalog_version = menus.current().version
+    item = menus.get(data.catalog_version).item(item_id)
+    if item is None:
+        await update.callback_query.answer(t(chat_id, 'item_not_found'))
+        return
+    data.current_cafe = item.cafe
+    if data.stage is storage.Stage.CAFE:
+        data.stage = storage.Stage.CART
+    qty = data.add_item(item_id, item.price)
+    toast = t(chat_id, 'added_cart').format(menus.display_name(item), qty).split("\n")[0]
+    # Same page as the tapped button, so only the keyboard changes.
+    await show_inline_page(update.callback_query, data, item.cafe, page, toast, markup_only=True)
+
+async def on_menu_remove(update, data, item_id, page):
+    item = menus.get(data.catalog_version).item(item_id)
+    if item is not None:
+        data.remove_item(item_id, item.price)
+    await show_inline_page(update.callback_query, data, data.current_cafe, page, markup_only=True)
+
+async def on_menu_done(update, data):
+    query = update.callback_query
+    if not data.cart:
+        await query.answer(t(update.effective_chat.id, 'cart_empty'), show_alert=True)
+        return
+    await asyncio.gather(query.answer(), request_location(update))
+
+async def on_menu_cancel(update, data):
+    data.clear_cart()
+    data.current_cafe, data.stage = None, storage.Stage.CAFE
+    chat_id = update.effective_chat.id
+    await edit_menu(update.callback_query, *render.inline_cafes(get_user_lang(chat_id)), t(chat_id, 'order_cancelled'))
+
+async def on_menu_noop(update, data):
+    await update.callback_query.answer()
+
+MENU_ACTIONS = {
+    router.MenuOp.HOME: on_menu_home,
+    router.MenuOp.PAGE: on_menu_page,
+    router.MenuOp.ADD: on_menu_add,
+    router.MenuOp.REMOVE: on_menu_remove,
+    router.MenuOp.DONE: on_menu_done,
+    router.MenuOp.CANCEL: on_menu_cancel,
+    router.MenuOp.NOOP: on_menu_noop,
+}
+
+@persist_session
+async def menu_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    if await check_rate_limit(update, chat_id, 'callback'): return
+
+    parsed = router.parse_menu_data(query.data)
+    data = await sessions.load(chat_id)
+    if parsed is None or data is None or not data.lang or not data.phone:
+        await query.answer()
+        return
+    if opens_at() is None:
+        await query.answer(closed_text(chat_id), show_alert=True)
+        return
+    op, args = parsed
+    await MENU_ACTIONS[op](update, data, *args)
+
+@persist_session
 async def location(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     track_username(update)
     chat_id = update.effective_chat.id
@@ -426,124 +619,376 @@ async def location(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     data = user_data.get(chat_id)
     
     # 3. Check Phone
-    if not data.get("phone"):
+    if not data.phone:
         await ask_for_phone(update, chat_id)
         return
 
-    if not data.get("awaiting_location"): return
+    if data.stage is not storage.Stage.LOCATION: return
+    if await check_rate_limit(update, chat_id, 'order'): return
 
-    data['awaiting_location'] = False
+    data.stage = storage.Stage.CART
     lat = update.message.location.latitude
     lon = update.message.location.longitude
 
-    if not geofence.in_werabe(lat, lon):
+    unpriced = pricing.quote(data)
+    if unpriced.missing:
+        # Taken off the menu since they were added; the customer sees the cart again first.
+        for item_id in unpriced.missing:
+            data.drop_item(item_id)
+        await update.message.reply_text(t(chat_id, 'items_unavailable'))
+        if data.cart:
+            await request_location(update)
+        else:
+            await show_main_menu(update)
+        return
+    lines = unpriced.lines
+    match = geofence.locate(lat, lon, lines[0].item.cafe if lines else None)
+    if match is None:
         await update.message.reply_text(t(chat_id, 'location_error'))
         return
 
-    data['location'] = {'lat': lat, 'lon': lon}
+    data.location = storage.Location(lat, lon, match.zone.name, round(match.distance_km, 2))
+
+    # Closed: the order is taken as a pre-order if everything in it opens soon enough.
+    release_at = opens_at({line.item.cafe for line in lines})
+    if release_at is None:
+        await update.message.reply_text(closed_text(chat_id))
+        return
 
     order_id = f"#{uuid.uuid4().hex[:8].upper()}"
+    logs.bind(order_id=order_id)
     
-    total_price = 39
-    cart_items = []
-    for (cafe, item), qty in data['orders'].items():
-        price = menus.CAFES.get(cafe, {}).get(item, 0)
-        total_price += price * qty
-        cart_items.append(f"• {item} x{qty} ({cafe})")
-    
-    cart_summary = "\n".join(cart_items)
+    quote = pricing.quote(data, match)
+    cart_summary = "\n".join(
+        f"• {menus.display_name(line.item)} x{line.qty} ({line.item.cafe})" for line in quote.lines
+    )
+    price_lines = f"🚚 *Delivery:* {quote.fee} ETB\n"
+    if quote.discount:
+        price_lines += f"🎁 *{quote.promotion}:* -{quote.discount} ETB\n"
     
     customer_info = (
         f"👤 {update.effective_user.full_name}\n"
-        f"📞 {data['phone']}\n"
-        f"@{update.effective_user.username or 'NoUsername'}"
+        f"📞 {data.phone}\n"
+        f"@{update.effective_user.username or 'NoUsername'}\n"
+        f"📍 {match.zone.name}, {match.distance_km:.1f} km"
     )
 
-    try:
-        mapslink = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}"
-        map_msg = f"📍 Customer location for Order ID: `{order_id}`: [Open Map]({mapslink})"
-        
-        await ctx.bot.send_message(
-            chat_id=config.CHANNEL_ID,
-            text=map_msg,
-            parse_mode='Markdown',
-            disable_web_page_preview=False 
-        )
-
-        admin_msg = f"""📦 *ORDER DETAILS {order_id}*
+    mapslink = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}"
+    map_msg = f"📍 Customer location for Order ID: `{order_id}`: [Open Map]({mapslink})"
+
+    admin_msg = f"""📦 *ORDER DETAILS {order_id}*
     
 {customer_info}
 
 🛒 *ITEMS:*
 {cart_summary}
 
-💵 *Total:* {total_price} ETB
+{price_lines}💵 *Total:* {quote.total} ETB
 """
-        kb = InlineKeyboardMarkup([[
-            InlineKeyboardButton("✅ Accept", callback_data=f"accept_{chat_id}_{order_id}"),
-            InlineKeyboardButton("❌ Decline", callback_data=f"decline_{chat_id}_{order_id}")
-        ]])
-        
-        await ctx.bot.send_message(
-            chat_id=config.CHANNEL_ID, 
-            text=admin_msg, 
-            parse_mode='Markdown', 
-            reply_markup=kb
-        )
-
-        await update.message.reply_text(t(chat_id, 'order_sent').format(order_id), parse_mode="Markdown")
-        
-        data['orders'] = {}
-        data['current_cafe'] = None
-        await show_main_menu(update)
+    kb = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ Accept", callback_data=f"accept_{chat_id}_{order_id}"),
+        InlineKeyboardButton("❌ Decline", callback_data=f"decline_{chat_id}_{order_id}")
+    ]])
+
+    items = [[line.item.cafe, menus.display_name(line.item), line.qty, line.amount] for line in quote.lines]
+    channel_posts = [
+        {'chat_id': config.CHANNEL_ID, 'text': map_msg, 'parse_mode': 'Markdown',
+         'disable_web_page_preview': False},
+        {'chat_id': config.CHANNEL_ID, 'text': admin_msg, 'parse_mode': 'Markdown',
+         'reply_markup': render.serialize(kb)},
+    ]
 
+    # The channel posts go through the outbox; the customer only waits for the commit.
+    try:
+        if release_at > time.time():
+            released = {'chat_id': chat_id, 'text': t(chat_id, 'preorder_released').format(order_id),
+                        'parse_mode': 'Markdown'}
+            release_at = await preorder_queue.schedule(
+                order_id, chat_id, items, quote.total, data.location._asdict(), release_at, channel_posts, [released]
+            )
+            sent = t(chat_id, 'preorder_placed').format(hours.HOURS.local_time(release_at), order_id)
+        else:
+            await ledger.create(
+                order_id, chat_id, items=items, total=quote.total, location=data.location._asdict(),
+                notifications=channel_posts,
+            )
+            notifier.wake()
+            sent = t(chat_id, 'order_sent').format(order_id)
     except Exception as e:
-        logger.error(f"FAILED TO SEND ORDER: {e}") 
+        logger.error("Failed to record order: %s", e)
         await update.message.reply_text("❌ System Error. Please contact support.")
+        return
+
+    data.clear_cart()
+    confirmation = f"{price_summary(chat_id, quote)}\n\n{sent}"
+    await update.message.reply_text(confirmation, parse_mode="Markdown", reply_markup=keyboard_after_step())
+    await show_main_menu(update)
+
+async def courier_location(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """A courier's location, shared once or live (each move arrives as an edit)."""
+    msg = update.effective_message
+    loc = msg.location
+    if loc.live_period:
+        live_until = msg.date.timestamp() + loc.live_period   # counted from when sharing began
+    else:
+        live_until = time.time() + dispatch.STATIC_SECONDS
+    dispatcher.track(update.effective_chat.id, loc.latitude, loc.longitude, live_until)
+    if update.message:   # not for the edits that follow a live location
+        await update.message.reply_text("🛵 You're on the map. Keep sharing your live location to get deliveries.")
+
+ORDER_ACTIONS = {
+    # callback action -> (ledger status, card footer, customer text key)
+    "accept": (orders.ACCEPTED, "✅ Accepted by {}", 'order_accepted'),
+    "decline": (orders.DECLINED, "❌ Declined by {}", 'order_declined'),
+    "delivered": (orders.DELIVERED, "📦 Delivered, marked by {}", 'order_delivered'),
+}
 
 async def accept_or_decline(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    if await check_rate_limit(update, query.from_user.id, 'callback'): return
+    gateway.LANE.set(gateway.ORDERS)
     data = query.data
-    
-    if not (data.startswith("accept_") or data.startswith("decline_")): return
 
     try:
         action, uid_str, order_id = data.split("_")
         uid = int(uid_str)
-    except: return
+        status, footer, text_key = ORDER_ACTIONS[action]
+    except (ValueError, KeyError):
+        await query.answer()
+        return
+    logs.bind(order_id=order_id)
 
     msg = query.message
     admin_name = query.from_user.full_name
 
-    if "✅" in msg.text or "❌" in msg.text: return
+    # Cards posted before the ledger existed are registered on first tap.
+    await ledger.adopt(order_id, uid)
+    order = await ledger.transition(order_id, status, by=admin_name)
+    if order is None:
+        current = await ledger.get(order_id)
+        await query.answer(f"Already {current.status}." if current else "Unknown order.")
+        return
+    await query.answer()
 
-    if action == "accept":
-        new_text = msg.text + f"\n\n✅ Accepted by {admin_name}"
-        await query.message.edit_text(new_text, reply_markup=None)
-        await ctx.bot.send_message(uid, t(uid, 'order_accepted').format(order_id), parse_mode="Markdown")
-        
-    elif action == "decline":
-        new_text = msg.text + f"\n\n❌ Declined by {admin_name}"
-        await query.message.edit_text(new_text, reply_markup=None)
-        await ctx.bot.send_message(uid, t(uid, 'order_declined').format(order_id), parse_mode="Markdown")
+    await sessions.load(uid)  # so t(uid, ...) answers in the customer's language
 
-def main():
-    keep_alive()
-    app = ApplicationBuilder().token(config.BOT_TOKEN).build()
+    new_text = msg.text + "\n\n" + footer.format(admin_name)
+    kb = None
+    if status == orders.ACCEPTED:
+        kb = InlineKeyboardMarkup([[
+            InlineKeyboardButton("📦 Delivered", callback_data=f"delivered_{uid}_{order_id}")
+        ]])
+    await query.message.edit_text(new_text, reply_markup=kb)
+    await ctx.bot.send_message(uid, t(uid, text_key).format(order_id), parse_mode="Markdown")
+    if status == orders.ACCEPTED:
+        dispatcher.submit(order)
+    elif status == orders.DELIVERED:
+        await dispatcher.delivered(order_id)
+
+async def admin_orders(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Usage: /orders — lists open (scheduled, pending or accepted) orders from the ledger."""
+    if not is_admin(update): return
+    open_orders = await ledger.by_status(*orders.OPEN_STATUSES, limit=30)
+    if not open_orders:
+        await update.message.reply_text("No open orders.")
+        return
+    lines = [
+        f"{o.order_id} · {o.status} · {o.total} ETB · {datetime.datetime.fromtimestamp(o.created_at):%H:%M}"
+        for o in open_orders
+    ]
+    await update.message.reply_text(f"📋 Open orders ({len(open_orders)}):\n" + "\n".join(lines))
+
+async def admin_courier(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Usage: /courier [add|remove @username] — manages the courier roster; without arguments, lists it."""
+    if not is_admin(update): return
+    if not ctx.args:
+        await update.message.reply_text(dispatcher.roster_text())
+        return
+    if len(ctx.args) != 2 or ctx.args[0] not in ("add", "remove"):
+        await update.message.reply_text("❌ Usage: /courier [add|remove @username]")
+        return
+    handle = ctx.args[1].replace("@", "").lower()
+    chat_id = await sessions.lookup_username(handle)
+    if not chat_id:
+        await update.message.reply_text(f"❌ User @{handle} not found.\n(They must have started the bot at least once).")
+        return
+    if ctx.args[0] == "add":
+        await dispatcher.add_courier(chat_id, f"@{handle}")
+        await update.message.reply_text(f"✅ @{handle} is now a courier. They get deliveries while sharing their live location.")
+    else:
+        await dispatcher.remove_courier(chat_id)
+        await update.message.reply_text(f"✅ @{handle} is no longer a courier.")
+
+async def admin_report(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Usage: /report [YYYY-MM-DD | rebuild] — sales for a day (today by default), from the rollups."""
+    if not is_admin(update): return
+    arg = ctx.args[0] if ctx.args else orders.local_day()
+    if arg == "rebuild":
+        events = await reports.rebuild()
+        await update.message.reply_text(f"✅ Rollups rebuilt from {events} order events.")
+        return
+    try:
+        datetime.date.fromisoformat(arg)
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /report [YYYY-MM-DD | rebuild]")
+        return
+    await update.message.reply_text(await reports.report(arg))
+
+async def admin_profile(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Usage: /profile [seconds] — samples the running bot and replies with where its time goes."""
+    if not is_admin(update): return
+    import profiler   # only ever needed here
+    try:
+        seconds = float(ctx.args[0]) if ctx.args else 10.0
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    seconds = max(1.0, min(seconds, profiler.MAX_SECONDS))
+    chat_id = update.effective_chat.id
+    await update.message.reply_text(f"⏱ Profiling for {seconds:.0f}s...")
+
+    async def run():
+        try:
+            report = await profiler.profile(seconds)
+        except RuntimeError as e:
+            await ctx.bot.send_message(chat_id, f"❌ {e}")
+            return
+        text = report.text()
+        if len(text) <= 4000:
+            await ctx.bot.send_message(chat_id, text)
+        else:
+            await ctx.bot.send_document(chat_id, io.BytesIO(text.encode()), filename="profile.txt",
+                                        caption=text.split("\n", 1)[0])
+    # Runs outside the handler, so the admin chat's other updates are not held up meanwhile.
+    ctx.application.create_task(run(), update=update)
+
+async def on_startup(app):
+    background_tasks.append(asyncio.create_task(menus.watch()))
+    await sessions.start()
+    await cluster_state.start()
+    await ledger.start()
+    await notifier.start(app.bot)
+    await dispatcher.start()
+    await preorder_queue.start()
+    await rate_limiter.start()
+    await broadcasts.start(app.bot)
+
+async def on_shutdown(app):
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await broadcasts.stop()
+    await preorder_queue.stop()
+    await dispatcher.stop()
+    await notifier.stop()
+    await rate_limiter.stop()
+    await cluster_state.stop()
+    await sessions.stop()
+
+def build_app(token=None, request=None, max_concurrent_updates=None, shape_traffic=config.API_SHAPING):
+    processor = processing.PerChatUpdateProcessor(max_concurrent_updates or config.MAX_CONCURRENT_UPDATES)
+    builder = (
+        ApplicationBuilder()
+        .token(token or config.BOT_TOKEN)
+        .update_queue(processing.UpdateQueue(processor, maxsize=config.UPDATE_QUEUE_SIZE))
+        .concurrent_updates(processor)
+    )
+    if config.BOT_API_URL:
+        base = config.BOT_API_URL.rstrip("/")
+        builder = builder.base_url(base + "/bot").base_file_url(base + "/file/bot")
+    if request is not None:
+        builder = builder.get_updates_request(request)
+    # One pool for every send; waiting a little for a free connection beats failing at once.
+    request = request or HTTPXRequest(
+        connection_pool_size=config.API_POOL_SIZE, pool_timeout=5.0, read_timeout=10.0
+    )
+    builder = builder.request(gateway.Gateway(metrics.InstrumentedRequest(request), shaping=shape_traffic,
+                                           share=1 / config.WORKERS))
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("broadcast", admin_broadcast))
     app.add_handler(CommandHandler("dm", admin_dm)) # <-- Added DM Handler
     app.add_handler(CommandHandler(["open", "close", "auto"], admin_control))
+    app.add_handler(CommandHandler("orders", admin_orders))
+    app.add_handler(CommandHandler("courier", admin_courier))
+    app.add_handler(CommandHandler("report", admin_report))
+    app.add_handler(CommandHandler("profile", admin_profile))
     
     app.add_handler(MessageHandler(filters.CONTACT, contact))
+    app.add_handler(MessageHandler(filters.LOCATION & CourierFilter(), courier_location))
     app.add_handler(MessageHandler(filters.LOCATION, location))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-    app.add_handler(CallbackQueryHandler(accept_or_decline))
-    
-    print("Bot is running...")
-    app.run_polling()
+    app.add_handler(CallbackQueryHandler(menu_callback, pattern=router.MENU_PATTERN))
+    app.add_handler(CallbackQueryHandler(accept_or_decline, pattern=r"^(accept|decline|delivered)_"))
+    app.add_handler(InlineQueryHandler(inline_search))
+    metrics.instrument_handlers(app, hooks=[logs.handler_hook])
+    return app
+
+async def serve(app, server, stop_event):
+    """Runs the bot until stop_event is set: webhook mode if WEBHOOK_URL is configured, polling otherwise."""
+    await server.start()   # before anything slow; webhook updates are held until open()
+    async with app:
+        await on_startup(app)
+        server.attach(app)
+        if not config.WEBHOOK_URL:
+            await app.bot.delete_webhook()
+            await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await app.start()
+        await server.open()
+        if config.WEBHOOK_URL:
+            # Updates already come in on the webhook registered last time; this only
+            # re-registers it in case the URL or secret changed, so it need not hold them up.
+            await app.bot.set_webhook(
+                url=config.WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=40,
+            )
+        print("Bot is running...", "(webhook)" if config.WEBHOOK_URL else "(polling)")
+
+        try:
+            await stop_event.wait()
+        finally:
+            server.ready = False
+            if app.updater.running:
+                await app.updater.stop()
+            await app.stop()
+            await on_shutdown(app)
+    await server.stop()
+
+async def serve_worker(app, stop_event):
+    """Runs one worker of a multi-process bot until stop_event is set or the front goes away."""
+    async with app:
+        await on_startup(app)
+        await app.start()
+        feed = asyncio.create_task(cluster.feed(app, config.CLUSTER_SOCKET, config.WORKER_INDEX))
+        stopped = asyncio.create_task(stop_event.wait())
+        try:
+            await asyncio.wait({feed, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            feed.cancel()
+            stopped.cancel()
+            await app.stop()
+            await on_shutdown(app)
+
+async def run():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    if config.WORKER_INDEX is not None:
+        await serve_worker(build_app(), stop_event)
+        return
+    server = KeepAliveServer(config.PORT, secret=config.WEBHOOK_SECRET, sock=LISTEN_SOCKET,
+                             metrics_token=config.METRICS_TOKEN)
+    if config.WORKERS > 1:
+        await cluster.Front(config.WORKERS, server, config.CLUSTER_SOCKET).run(stop_event)
+    else:
+        await serve(build_app(), server, stop_event)
+
+def main():
+    asyncio.run(run())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,285 @@
+"""
+Broadcast jobs.
+
+A job snapshots its recipients into SQLite, then a pool of workers sends to
+them with bounded concurrency under a global messages-per-second budget.
+Each recipient's outcome is written back in batches, so a job interrupted by
+a restart resumes with the recipients that are still pending.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+import cluster
+import gateway
+import languages
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    text          TEXT NOT NULL,
+    admin_chat_id INTEGER NOT NULL,
+    status_msg_id INTEGER,
+    state         TEXT NOT NULL DEFAULT 'running',
+    created_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_targets (
+    job_id  INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    lang    TEXT NOT NULL,
+    state   TEXT NOT NULL DEFAULT 'pending',
+    PRIMARY KEY (job_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS broadcast_targets_pending ON broadcast_targets (job_id, state);
+"""
+
+CONCURRENCY = 8
+MESSAGES_PER_SECOND = 25       # Telegram's documented bulk limit is ~30/s
+MAX_ATTEMPTS = 3
+PROGRESS_EVERY_SECONDS = 5
+FLUSH_EVERY = 50               # recipients per progress write
+
+DELIVERED, FAILED, BLOCKED = 'delivered', 'failed', 'blocked'
+
+
+class RateBudget:
+    """Spaces sends evenly so the whole job stays under `rate` messages per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            slot = max(self._next, self._paused_until, now)
+            self._next = slot + self.interval
+            if slot <= now:
+                return
+            await asyncio.sleep(slot - now)
+            # A flood-wait may have been raised while we slept; take a fresh slot.
+            if self._paused_until <= time.monotonic():
+                return
+
+
+class BroadcastJob:
+    def __init__(self, job_id, text, admin_chat_id, status_msg_id, counts):
+        self.id = job_id
+        self.text = text
+        self.admin_chat_id = admin_chat_id
+        self.status_msg_id = status_msg_id
+        self.counts = counts   # state -> number of recipients
+        self.last_report = None
+        # Rendered once per language, not once per recipient.
+        self.rendered = {}
+
+    def render(self, lang):
+        msg = self.rendered.get(lang)
+        if msg is None:
+            msg = self.rendered[lang] = languages.get_text(lang, 'admin_broadcast').format(self.text)
+        return msg
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def progress_text(self):
+        c = self.counts
+        done = c.get(DELIVERED, 0) + c.get(FAILED, 0) + c.get(BLOCKED, 0)
+        return (
+            f"📤 Broadcast #{self.id}: {done}/{self.total}\n"
+            f"✅ Delivered: {c.get(DELIVERED, 0)}\n"
+            f"🚫 Blocked: {c.get(BLOCKED, 0)}\n"
+            f"❌ Failed: {c.get(FAILED, 0)}"
+        )
+
+
+class BroadcastEngine:
+    def __init__(self, store, shard=None):
+        self.store = store
+        self.shard = shard   # (index, count): resume only jobs started from this worker's chats
+        self.jobs = {}   # job_id -> asyncio.Task
+
+    # --- DB THREAD ---
+
+    def _init_schema(self):
+        self.store.conn.executescript(SCHEMA)
+        self.store.conn.commit()
+
+    def _create(self, text, admin_chat_id, targets):
+        conn = self.store.conn
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO broadcasts (text, admin_chat_id, created_at) VALUES (?, ?, ?)",
+                (text, admin_chat_id, time.time()),
+            )
+            job_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO broadcast_targets (job_id, chat_id, lang) VALUES (?, ?, ?)",
+                [(job_id, chat_id, lang) for chat_id, lang in targets],
+            )
+        return job_id
+
+    def _load_running(self):
+        conn = self.store.conn
+        jobs = []
+        for job_id, text, admin_chat_id, status_msg_id in conn.execute(
+            "SELECT id, text, admin_chat_id, status_msg_id FROM broadcasts"
+            f" WHERE state = 'running' AND {cluster.shard_sql('admin_chat_id', self.shard)}"
+        ).fetchall():
+            counts = dict(conn.execute(
+                "SELECT state, COUNT(*) FROM broadcast_targets WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall())
+            jobs.append(BroadcastJob(job_id, text, admin_chat_id, status_msg_id, counts))
+        return jobs
+
+    def _pending(self, job_id):
+        return self.store.conn.execute(
+            "SELECT chat_id, lang FROM broadcast_targets WHERE job_id = ? AND state = 'pending'", (job_id,)
+        ).fetchall()
+
+    def _save_results(self, job_id, results):
+        with self.store.conn:
+            self.store.conn.executemany(
+                "UPDATE broadcast_targets SET state = ? WHERE job_id = ? AND chat_id = ?",
+                [(state, job_id, chat_id) for chat_id, state in results],
+            )
+
+    def _set_status_msg(self, job_id, msg_id):
+        with self.store.conn:
+            self.store.conn.execute("UPDATE broadcasts SET status_msg_id = ? WHERE id = ?", (msg_id, job_id))
+
+    def _finish(self, job_id):
+        with self.store.conn:
+            self.store.conn.execute("UPDATE broadcasts SET state = 'done' WHERE id = ?", (job_id,))
+
+    # --- PUBLIC ---
+
+    async def start(self, bot):
+        """Creates the tables and resumes any job a restart interrupted."""
+        await self.store.run(self._init_schema)
+        for job in await self.store.run(self._load_running):
+            logger.info("Resuming broadcast #%s", job.id)
+            self._spawn(bot, job)
+
+    async def stop(self):
+        tasks = list(self.jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, bot, text, admin_chat_id, targets):
+        """Queues a broadcast to [(chat_id, lang), ...] and returns immediately."""
+        job_id = await self.store.run(self._create, text, admin_chat_id, targets)
+        job = BroadcastJob(job_id, text, admin_chat_id, None, {'pending': len(targets)})
+        # Edited with progress later, so it must stay a message of its own.
+        token = gateway.COALESCE.set(False)
+        try:
+            status = await bot.send_message(admin_chat_id, job.progress_text())
+        except TelegramError as e:
+            # The job is recorded, so it runs anyway, just without a progress message.
+            logger.warning("Broadcast #%s status message failed: %s", job_id, e)
+        else:
+            job.status_msg_id = status.message_id
+            await self.store.run(self._set_status_msg, job_id, status.message_id)
+        finally:
+            gateway.COALESCE.reset(token)
+        self._spawn(bot, job)
+        return job
+
+    def _spawn(self, bot, job):
+        task = asyncio.create_task(self._run(bot, job))
+        self.jobs[job.id] = task
+        task.add_done_callback(lambda _: self.jobs.pop(job.id, None))
+
+    # --- WORKERS ---
+
+    async def _run(self, bot, job):
+        gateway.LANE.set(gateway.BULK)   # order traffic goes ahead of a broadcast
+        queue = asyncio.Queue()
+        for target in await self.store.run(self._pending, job.id):
+            queue.put_nowait(target)
+
+        budget = RateBudget(MESSAGES_PER_SECOND)
+        results = []
+
+        async def flush():
+            if results:
+                batch = results[:]
+                del results[:]
+                await self.store.run(self._save_results, job.id, batch)
+
+        async def worker():
+            while True:
+                try:
+                    chat_id, lang = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                state = await self._deliver(bot, budget, chat_id, job.render(lang))
+                job.counts['pending'] = job.counts.get('pending', 0) - 1
+                job.counts[state] = job.counts.get(state, 0) + 1
+                results.append((chat_id, state))
+                if len(results) >= FLUSH_EVERY:
+                    await flush()
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(PROGRESS_EVERY_SECONDS)
+                await self._report(bot, job)
+
+        progress = asyncio.create_task(reporter())
+        try:
+            await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        finally:
+            progress.cancel()
+            # Whatever finished before a cancel is kept; the rest stays pending.
+            await flush()
+
+        await self.store.run(self._finish, job.id)
+        await self._report(bot, job)
+
+    async def _deliver(self, bot, budget, chat_id, text):
+        attempts = 0
+        while True:
+            await budget.acquire()
+            try:
+                await bot.send_message(chat_id, text)
+                return DELIVERED
+            except RetryAfter as e:
+                # Flood-wait applies to the whole bot: hold every worker, then retry.
+                # It does not count as a failed attempt.
+                logger.warning("Broadcast flood-wait %ss", e.retry_after)
+                budget.pause(e.retry_after)
+            except Forbidden:
+                return BLOCKED
+            except BadRequest as e:
+                logger.info("Broadcast to %s rejected: %s", chat_id, e)
+                return FAILED
+            except (TimedOut, NetworkError) as e:
+                attempts += 1
+                logger.warning("Broadcast to %s attempt %s failed: %s", chat_id, attempts, e)
+                if attempts >= MAX_ATTEMPTS:
+                    return FAILED
+                await asyncio.sleep(2 ** attempts)
+            except TelegramError as e:
+                # Anything else (a migrated chat, say) fails this recipient, not the job.
+                logger.info("Broadcast to %s failed: %s", chat_id, e)
+                return FAILED
+
+    async def _report(self, bot, job):
+        text = job.progress_text()
+        if not job.status_msg_id or text == job.last_report:
+            return
+        job.last_report = text
+        try:
+            await bot.edit_message_text(text, job.admin_chat_id, job.status_msg_id)
+        except Exception as e:
+            logger.warning("Broadcast progress update failed: %s", e)
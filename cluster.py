@@ -0,0 +1,217 @@
+"""
+Multi-process mode (config.WORKERS > 1).
+
+The front process owns the HTTP port and the update intake: it receives
+webhook updates (or long-polls getUpdates) and forwards each one, as JSON
+in a length-prefixed frame over a Unix socket, to worker
+shard_of(chat, WORKERS). Each worker is a normal bot process (bot.py with
+WORKER_INDEX set) that gets every update of its chats, in order, so a
+chat's session, cart and rate limits live in exactly one process.
+
+What is not per chat is shared through the session database, which all
+workers open: the order ledger, the outbox, broadcasts, usernames and the
+shared settings (see shared.py). Background work over those tables is split
+by the same shard function: a worker delivers the outbox messages of its
+own customers' orders and resumes the broadcasts its own admin chat
+started. Each worker's gateway gets 1/WORKERS of the bot's global and
+group rate limits.
+
+The front restarts a worker that exits. While a worker is down, or its
+socket is backed up for longer than ENQUEUE_TIMEOUT_SECONDS, its updates
+are refused with 503 so Telegram redelivers them later.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import struct
+import sys
+import tempfile
+
+import aiohttp
+from telegram import Update
+
+import config
+from keep_alive import ENQUEUE_TIMEOUT_SECONDS, WEBHOOK_PATH
+
+logger = logging.getLogger(__name__)
+
+FRAME = struct.Struct('!I')
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+RESTART_DELAY = 1.0
+
+
+def shard_of(chat_id, count):
+    return chat_id % count
+
+
+def shard_sql(column, shard):
+    """A WHERE clause keeping rows whose `column` belongs to shard (index, count); '1' for no sharding."""
+    if shard is None:
+        return "1"
+    index, count = shard
+    # SQLite's % keeps the sign of the dividend, Python's does not.
+    return f"((({column}) % {count:d}) + {count:d}) % {count:d} = {index:d}"
+
+
+def chat_of(payload):
+    """The chat an update belongs to: the message's chat, else the user who caused it."""
+    for value in payload.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+# --- FRONT ---
+
+class Front:
+    """Owns the port and the update intake; forwards each update to its worker."""
+
+    def __init__(self, count, server, socket_path=None):
+        self.count = count
+        self.server = server
+        self.socket_path = socket_path or os.path.join(tempfile.gettempdir(), f"wdelivery-{os.getpid()}.sock")
+        self.links = [None] * count    # worker index -> StreamWriter
+        self.procs = [None] * count
+        self.forwarded = [0] * count
+        self._connected = None
+        self._stopping = False
+        self._http = None
+
+    async def run(self, stop_event):
+        self._connected = asyncio.Event()
+        self._http = aiohttp.ClientSession()
+        workers = await asyncio.start_unix_server(self._accept, self.socket_path)
+        self.server.deliver = self.deliver
+        await self.server.start()   # webhook updates are held until every worker is up
+        supervisors = [asyncio.create_task(self._supervise(i)) for i in range(self.count)]
+        poller = None
+        try:
+            await self._connected.wait()
+            if config.WEBHOOK_URL:
+                await self.server.open()
+                await self._call('setWebhook', {
+                    'url': config.WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                    'secret_token': config.WEBHOOK_SECRET,
+                    'allowed_updates': Update.ALL_TYPES,
+                    'max_connections': 40,
+                })
+            else:
+                await self._call('deleteWebhook', {})
+                await self.server.open()
+                poller = asyncio.create_task(self._poll())
+            print(f"Bot is running... ({self.count} workers)", "(webhook)" if config.WEBHOOK_URL else "(polling)")
+            await stop_event.wait()
+        finally:
+            self.server.ready = False
+            self._stopping = True
+            if poller:
+                poller.cancel()
+            for proc in self.procs:
+                if proc and proc.returncode is None:
+                    proc.send_signal(signal.SIGTERM)
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            workers.close()
+            await workers.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            await self._http.close()
+            await self.server.stop()
+
+    async def _supervise(self, index):
+        env = {
+            **os.environ, 'WORKERS': str(self.count), 'WORKER_INDEX': str(index),
+            'CLUSTER_SOCKET': self.socket_path,
+        }
+        while not self._stopping:
+            proc = self.procs[index] = await asyncio.create_subprocess_exec(sys.executable, BOT_PATH, env=env)
+            code = await proc.wait()
+            if not self._stopping:
+                logger.error("Worker %s exited with %s, restarting", index, code)
+                await asyncio.sleep(RESTART_DELAY)
+
+    async def _accept(self, reader, writer):
+        index, = FRAME.unpack(await reader.readexactly(FRAME.size))
+        self.links[index] = writer
+        logger.info("Worker %s connected", index)
+        if all(self.links):
+            self._connected.set()
+        try:
+            await reader.read()   # nothing more comes this way; returns when the worker goes away
+        finally:
+            if self.links[index] is writer:
+                self.links[index] = None
+            writer.close()
+
+    async def deliver(self, payload):
+        """Forwards one update to its worker. Returns the HTTP status for Telegram."""
+        index = shard_of(chat_of(payload), self.count)
+        link = self.links[index]
+        if link is None:
+            return 503
+        try:
+            # Wait for room first: a frame written and then refused would be delivered twice.
+            await asyncio.wait_for(link.drain(), ENQUEUE_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, ConnectionError):
+            logger.warning("Worker %s backed up; refusing update %s", index, payload.get('update_id'))
+            return 503
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        link.write(FRAME.pack(len(body)) + body)
+        self.forwarded[index] += 1
+        return 200
+
+    async def _call(self, method, params, timeout=10):
+        base = (config.BOT_API_URL or "https://api.telegram.org").rstrip("/")
+        url = f"{base}/bot{config.BOT_TOKEN}/{method}"
+        async with self._http.post(url, json=params, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            doc = await r.json()
+        if not doc.get('ok'):
+            raise RuntimeError(f"{method} failed: {doc.get('description')}")
+        return doc['result']
+
+    async def _poll(self):
+        offset = None
+        while True:
+            try:
+                updates = await self._call('getUpdates', {
+                    'offset': offset, 'timeout': 30, 'allowed_updates': Update.ALL_TYPES,
+                }, timeout=40)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for payload in updates:
+                while await self.deliver(payload) != 200:
+                    await asyncio.sleep(0.5)
+                offset = payload['update_id'] + 1
+
+
+# --- WORKER ---
+
+async def feed(app, socket_path, index):
+    """Queues the updates the front forwards to this worker. Returns when the front goes away."""
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            await asyncio.sleep(0.1)
+    writer.write(FRAME.pack(index))
+    await writer.drain()
+    try:
+        while True:
+            size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+            payload = json.loads(await reader.readexactly(size))
+            # Blocks while the queue is full, which backs the socket up to the front.
+            await app.update_queue.put(Update.de_json(payload, app.bot))
+    except asyncio.IncompleteReadError:
+        logger.warning("Front process went away")
+    finally:
+        writer.close()
@@ -1,3 +1,4 @@
+import hashlib
 import os
 from dotenv import load_dotenv
 
@@ -6,9 +7,64 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 CHANNEL_ID = os.getenv('CHANNEL_ID')
 
-# Werabe location boundaries
-MIN_LAT, MAX_LAT = 7.8500, 8.0000
-MIN_LON, MAX_LON = 38.0000, 38.2000
+# SQLite file holding sessions (survives restarts)
+DB_PATH = os.getenv('DB_PATH', 'wdelivery.db')
 
-# Time window (UTC+3)
-OPEN_HOUR, CLOSE_HOUR = 6, 22
\ No newline at end of file
+# Resident sessions written on shutdown and read back in one go at boot (see storage.py)
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', DB_PATH + '.snapshot')
+
+# HTTP server (Render assigns the port through PORT)
+PORT = int(os.getenv('PORT', 8080))
+# Bearer token for /metrics; without one the endpoint is not served
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Webhook mode is used when a public URL is known (Render sets RENDER_EXTERNAL_URL);
+# otherwise the bot long-polls, which is what you want locally.
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or hashlib.sha256((BOT_TOKEN or '').encode()).hexdigest()
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+
+# Handlers running at once across all chats; one chat's updates always run in order
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+
+# Bot processes (see cluster.py). With WORKERS > 1 this process becomes the front, which
+# owns the port and forwards each chat's updates to worker chat_id % WORKERS; the front
+# sets WORKER_INDEX and CLUSTER_SOCKET for the workers it starts.
+WORKERS = int(os.getenv('WORKERS', 1))
+WORKER_INDEX = int(os.environ['WORKER_INDEX']) if os.getenv('WORKER_INDEX') else None
+CLUSTER_SOCKET = os.getenv('CLUSTER_SOCKET')
+
+# Where settings shared by all processes live (see shared.py): 'memory' or 'sqlite'
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'sqlite' if WORKERS > 1 else 'memory')
+
+# Bot API server; set to use a local telegram-bot-api server instead of Telegram's
+BOT_API_URL = os.getenv('BOT_API_URL')
+
+# Outbound Bot API connections, shared by every send (see gateway.py)
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', 128))
+# Pacing to Telegram's rate limits; turn off (0) only against a stand-in API in benchmarks
+API_SHAPING = os.getenv('API_SHAPING', '1') != '0'
+
+# Logging (see logs.py): 'json' or 'text'; LOG_SAMPLE keeps a fraction of noisy events,
+# by event or logger name, e.g. "handled=0.1,httpx=0.05"
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', 'handled=0.1,httpx=0.05')
+
+# Menu catalog, reloaded when the file changes (see menus.py)
+MENU_PATH = os.getenv('MENU_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'menu.json'))
+
+# Delivery zone polygons (see geofence.py)
+ZONES_PATH = os.getenv('ZONES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zones.json'))
+
+# 'reply': one message per step with a reply keyboard; 'inline': one menu message edited in place
+MENU_MODE = os.getenv('MENU_MODE', 'reply')
+
+# Delivery fee bands and promotions (see pricing.py)
+PRICING_PATH = os.getenv('PRICING_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing.json'))
+
+# Opening hours of the service and each café, with holidays (see hours.py)
+HOURS_PATH = os.getenv('HOURS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hours.json'))
+
+# While closed, customers can pre-order if everything in the cart opens within this many hours
+PREORDER_HOURS = float(os.getenv('PREORDER_HOURS', 12))
\ No newline at end of file
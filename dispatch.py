@@ -0,0 +1,511 @@
+"""
+Courier dispatch.
+
+Couriers are put on the roster by an admin (/courier add @name) and share
+their live location with the bot. Free couriers sit in a grid index, one
+dict per cell like the zone grid in geofence.py, so a location update
+touches at most two cells and a nearest-courier query only looks at the
+cells around the pickup point.
+
+An accepted order waits BATCH_SECONDS for any arriving close behind it,
+then the whole batch is matched at once: each order's CANDIDATES nearest
+free couriers to its pickup café are ranked, and pairs are taken shortest
+first, instead of each order taking its nearest courier in arrival order
+and leaving the next one a longer ride. Orders no courier can reach wait
+until one frees up or comes online.
+
+The pickup point is the café's position from the "cafes" entry of
+zones.json. None are listed yet, so for now every order is picked up at its
+drop-off zone's hub, and distances are measured from there.
+
+An assignment is recorded in the deliveries table, and the job message to
+the courier and the note in the channel are queued in the outbox in the
+same transaction. Marking the order delivered frees the courier, who then
+counts as standing at the drop-off until their next location update.
+
+Positions are written to the couriers table in batches, so they survive a
+restart. With several bot processes, the one receiving the channel's
+callbacks dispatches, and every process re-reads the roster and positions
+from there each SYNC_SECONDS.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, namedtuple
+
+import config
+import geofence
+import orders
+import outbox
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS couriers (
+    chat_id    INTEGER PRIMARY KEY,
+    name       TEXT NOT NULL,
+    lat        REAL,
+    lon        REAL,
+    live_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    order_id    TEXT PRIMARY KEY,
+    courier_id  INTEGER NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'assigned',
+    distance_km REAL NOT NULL,
+    assigned_at REAL NOT NULL,
+    done_at     REAL
+);
+CREATE INDEX IF NOT EXISTS deliveries_open ON deliveries (state, courier_id);
+"""
+
+ASSIGNED, DONE = 'assigned', 'done'
+
+CELL_SIZE = 0.0025       # degrees, about 280 m
+KM_PER_DEGREE = 111.2
+CANDIDATES = 3           # nearest couriers ranked per order
+MAX_PICKUP_KM = 15.0
+SCAN_BELOW = 16          # free couriers under which a lookup just scans them all
+BATCH_SECONDS = 2.0
+SYNC_SECONDS = 1.0
+STATIC_SECONDS = 900     # how long a plain (not live) location counts
+
+Job = namedtuple('Job', 'order_id chat_id cafe zone pickup dropoff total since')
+
+
+def job_for(order, now=None):
+    """The Job for an accepted Order, or None if it has no drop-off to go to."""
+    location = order.location
+    if not location:
+        return None
+    cafe = order.items[0][0] if order.items else None
+    dropoff = (location['lat'], location['lon'])
+    return Job(order.order_id, order.chat_id, cafe, location.get('zone'), geofence.pickup(cafe, *dropoff),
+               dropoff, order.total, time.time() if now is None else now)
+
+
+def _ring(cy, cx, r):
+    """The cells at Chebyshev distance r from (cy, cx)."""
+    if r == 0:
+        yield cy, cx
+        return
+    for dx in range(-r, r + 1):
+        yield cy - r, cx + dx
+        yield cy + r, cx + dx
+    for dy in range(-r + 1, r):
+        yield cy + dy, cx - r
+        yield cy + dy, cx + r
+
+
+class CourierIndex:
+    """Free couriers by grid cell."""
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}   # (cy, cx) -> {courier_id: (lat, lon)}
+        self.where = {}   # courier_id -> cell
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, courier_id):
+        return courier_id in self.where
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def put(self, courier_id, lat, lon):
+        cell = self._cell(lat, lon)
+        old = self.where.get(courier_id)
+        if old != cell:
+            if old is not None:
+                self._drop(courier_id, old)
+            self.where[courier_id] = cell
+        self.cells.setdefault(cell, {})[courier_id] = (lat, lon)
+
+    def remove(self, courier_id):
+        cell = self.where.pop(courier_id, None)
+        if cell is not None:
+            self._drop(courier_id, cell)
+
+    def _drop(self, courier_id, cell):
+        members = self.cells[cell]
+        del members[courier_id]
+        if not members:
+            del self.cells[cell]
+
+    def nearest(self, lat, lon, k=1, max_km=MAX_PICKUP_KM):
+        """Up to k (km, courier_id) within max_km of the point, nearest first.
+
+        Searches outwards ring by ring and stops once the k-th best is closer
+        than anything the next ring could hold.
+        """
+        if len(self.where) <= max(k, SCAN_BELOW):
+            return self._scan(lat, lon, k, max_km, self.cells.values())
+        side_km = self.cell_size * KM_PER_DEGREE * math.cos(math.radians(lat))   # the shorter side
+        cy, cx = self._cell(lat, lon)
+        best = []
+        for r in range(int(max_km / side_km) + 2):
+            if (2 * r + 1) ** 2 > 2 * len(self.cells):
+                # Couriers are few or far off: the occupied cells are fewer than those left to walk.
+                return self._scan(lat, lon, k, max_km, self.cells.values())
+            for cell in _ring(cy, cx, r):
+                members = self.cells.get(cell)
+                if not members:
+                    continue
+                for courier_id, (clat, clon) in members.items():
+                    km = geofence.haversine_km(lat, lon, clat, clon)
+                    if km <= max_km:
+                        best.append((km, courier_id))
+            if len(best) >= k:
+                best.sort()
+                del best[k:]
+                # Every cell of ring r + 1 is at least r cells from the point.
+                if best[-1][0] <= r * side_km:
+                    break
+        best.sort()
+        return best[:k]
+
+    @staticmethod
+    def _scan(lat, lon, k, max_km, cells):
+        best = []
+        for members in cells:
+            for courier_id, (clat, clon) in members.items():
+                km = geofence.haversine_km(lat, lon, clat, clon)
+                if km <= max_km:
+                    best.append((km, courier_id))
+        best.sort()
+        return best[:k]
+
+
+def match(index, jobs, candidates=CANDIDATES, max_km=MAX_PICKUP_KM):
+    """Assigns jobs to free couriers in `index`, shortest pickups first. Returns [(job, courier_id, km)].
+
+    Assigned couriers are removed from the index; jobs nobody can reach are left out.
+    """
+    assigned = []
+    left = list(jobs)
+    while left and len(index):
+        pairs = sorted(
+            (km, i, courier_id)
+            for i, job in enumerate(left)
+            for km, courier_id in index.nearest(job.pickup[0], job.pickup[1], candidates, max_km)
+        )
+        matched, taken = set(), set()
+        for km, i, courier_id in pairs:
+            if i in matched or courier_id in taken:
+                continue
+            matched.add(i)
+            taken.add(courier_id)
+            index.remove(courier_id)
+            assigned.append((left[i], courier_id, km))
+        if not matched:
+            break
+        # An order whose candidates all went elsewhere looks again among the rest.
+        left = [job for i, job in enumerate(left) if i not in matched]
+    return assigned
+
+
+class Courier:
+    __slots__ = ('chat_id', 'name', 'lat', 'lon', 'live_until', 'order_id')
+
+    def __init__(self, chat_id, name, lat=None, lon=None, live_until=0.0):
+        self.chat_id = chat_id
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.live_until = live_until
+        self.order_id = None   # the delivery they are on, if any
+
+
+class Dispatcher:
+    def __init__(self, store, ledger, notifier, active=True, shared=False):
+        self.store = store
+        self.ledger = ledger
+        self.notifier = notifier
+        self.active = active          # matches orders here; with several processes, only the channel's
+        self.shared = shared          # other processes change couriers too (WORKERS > 1)
+        self.couriers = {}            # chat_id -> Courier
+        self.index = CourierIndex()
+        self.waiting = OrderedDict()  # order_id -> Job
+        self.busy = {}                # order_id -> (courier chat_id, Job or None)
+        self._moved = {}              # chat_id -> (lat, lon, live_until) not yet written
+        self._wake = None
+        self._tasks = []
+
+    # --- DB THREAD ---
+
+    def _init_schema(self):
+        self.store.conn.executescript(SCHEMA)
+        self.store.conn.commit()
+
+    def _roster(self):
+        return self.store.conn.execute("SELECT chat_id, name, lat, lon, live_until FROM couriers").fetchall()
+
+    def _open_deliveries(self):
+        return self.store.conn.execute(
+            "SELECT courier_id, order_id FROM deliveries WHERE state = ?", (ASSIGNED,)
+        ).fetchall()
+
+    def _add(self, chat_id, name):
+        with self.store.conn:
+            self.store.conn.execute(
+                "INSERT INTO couriers (chat_id, name) VALUES (?, ?)"
+                " ON CONFLICT(chat_id) DO UPDATE SET name = excluded.name",
+                (chat_id, name),
+            )
+
+    def _remove(self, chat_id):
+        # An order they were on goes back to waiting.
+        with self.store.conn:
+            self.store.conn.execute("DELETE FROM couriers WHERE chat_id = ?", (chat_id,))
+            self.store.conn.execute("DELETE FROM deliveries WHERE courier_id = ? AND state = ?", (chat_id, ASSIGNED))
+
+    def _save_positions(self, moved):
+        with self.store.conn:
+            self.store.conn.executemany(
+                "UPDATE couriers SET lat = ?, lon = ?, live_until = ? WHERE chat_id = ?",
+                [(lat, lon, live_until, chat_id) for chat_id, (lat, lon, live_until) in moved.items()],
+            )
+
+    def _record(self, assignments, now):
+        """Records the assignments whose courier is still on the roster; returns their order_ids."""
+        conn = self.store.conn
+        with conn:
+            marks = ', '.join('?' * len(assignments))
+            rostered = {chat_id for (chat_id,) in conn.execute(
+                f"SELECT chat_id FROM couriers WHERE chat_id IN ({marks})", [c.chat_id for _, c, _ in assignments]
+            )}
+            assignments = [a for a in assignments if a[1].chat_id in rostered]
+            conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (order_id, courier_id, distance_km, assigned_at) VALUES (?, ?, ?, ?)",
+                [(job.order_id, courier.chat_id, km, now) for job, courier, km in assignments],
+            )
+            for job, courier, km in assignments:
+                outbox.append_messages(conn, job.order_id, _notices(job, courier, km), now)
+        return {job.order_id for job, _, _ in assignments}
+
+    def _finish(self, order_id, now):
+        with self.store.conn:
+            self.store.conn.execute(
+                "UPDATE deliveries SET state = ?, done_at = ? WHERE order_id = ? AND state = ?",
+                (DONE, now, order_id, ASSIGNED),
+            )
+
+    # --- LIFECYCLE ---
+
+    async def start(self):
+        await self.store.run(self._init_schema)
+        self._wake = asyncio.Event()
+        now = time.time()
+        for chat_id, name, lat, lon, live_until in await self.store.run(self._roster):
+            self.couriers[chat_id] = Courier(chat_id, name, lat, lon, live_until)
+        if self.active:
+            for chat_id, order_id in await self.store.run(self._open_deliveries):
+                courier = self.couriers.get(chat_id)
+                if courier is not None:
+                    courier.order_id = order_id
+                    order = await self.ledger.get(order_id)
+                    self.busy[order_id] = (chat_id, order and job_for(order, now))
+            for order in reversed(await self.ledger.by_status(orders.ACCEPTED, limit=1000)):
+                job = order.order_id not in self.busy and job_for(order, now)
+                if job:
+                    self.waiting[job.order_id] = job
+            for courier in self.couriers.values():
+                self._place(courier, now)
+            self._tasks.append(asyncio.create_task(self._run()))
+            if self.waiting:
+                self._wake.set()
+        self._tasks.append(asyncio.create_task(self._sync_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._moved:
+            await self.sync()
+
+    # --- COURIERS ---
+
+    def is_courier(self, chat_id):
+        return chat_id in self.couriers
+
+    async def add_courier(self, chat_id, name):
+        await self.store.run(self._add, chat_id, name)
+        courier = self.couriers.get(chat_id)
+        if courier is None:
+            self.couriers[chat_id] = Courier(chat_id, name)
+        else:
+            courier.name = name
+
+    async def remove_courier(self, chat_id):
+        await self.store.run(self._remove, chat_id)
+        self._forget(chat_id)
+
+    def track(self, chat_id, lat, lon, live_until):
+        """Moves a courier; cheap enough for every live location update."""
+        courier = self.couriers.get(chat_id)
+        if courier is None:
+            return
+        courier.lat, courier.lon, courier.live_until = lat, lon, live_until
+        self._moved[chat_id] = (lat, lon, live_until)
+        self._place(courier, time.time())
+
+    def _place(self, courier, now):
+        """Keeps the index in step with whether the courier can take a job."""
+        if not self.active:
+            return
+        if courier.order_id is None and courier.lat is not None and courier.live_until > now:
+            if courier.chat_id not in self.index and self.waiting:
+                self._wake.set()
+            self.index.put(courier.chat_id, courier.lat, courier.lon)
+        else:
+            self.index.remove(courier.chat_id)
+
+    def _forget(self, chat_id):
+        courier = self.couriers.pop(chat_id, None)
+        if courier is None:
+            return
+        self.index.remove(chat_id)
+        self._moved.pop(chat_id, None)
+        if courier.order_id is not None:
+            _, job = self.busy.pop(courier.order_id, (None, None))
+            if job is not None:
+                self.waiting[job.order_id] = job
+                self._wake.set()
+
+    # --- ORDERS ---
+
+    def submit(self, order):
+        """Queues an accepted order for the next batch. False if it cannot be dispatched."""
+        job = job_for(order)
+        if job is None or not self.active:
+            return False
+        self.waiting[job.order_id] = job
+        self._wake.set()
+        return True
+
+    async def delivered(self, order_id):
+        """Frees the courier of a delivered order, at its drop-off."""
+        self.waiting.pop(order_id, None)
+        await self.store.run(self._finish, order_id, time.time())
+        chat_id, job = self.busy.pop(order_id, (None, None))
+        courier = self.couriers.get(chat_id)
+        if courier is None:
+            return
+        courier.order_id = None
+        if job is not None:
+            courier.lat, courier.lon = job.dropoff
+            self._moved[chat_id] = (courier.lat, courier.lon, courier.live_until)
+        self._place(courier, time.time())
+
+    async def dispatch(self):
+        """Matches the waiting orders against the free couriers. Returns how many were assigned."""
+        now = time.time()
+        for chat_id in [c for c in self.index.where if self.couriers[c].live_until <= now]:
+            self.index.remove(chat_id)   # stopped sharing their location
+        assignments = match(self.index, self.waiting.values())
+        if not assignments:
+            return 0
+        try:
+            recorded = await self.store.run(
+                self._record, [(job, self.couriers[c], km) for job, c, km in assignments], now
+            )
+        except Exception:
+            for _, chat_id, _ in assignments:
+                if chat_id in self.couriers:
+                    self._place(self.couriers[chat_id], now)
+            raise
+        assigned = 0
+        for job, chat_id, km in assignments:
+            # The courier may have been removed while the assignment was written; the
+            # order then stays waiting for the next batch.
+            courier = self.couriers.get(chat_id)
+            if courier is None:
+                continue
+            if job.order_id not in recorded:
+                self._place(courier, now)   # match() took them out of the index
+                continue
+            del self.waiting[job.order_id]
+            courier.order_id = job.order_id
+            self.busy[job.order_id] = (chat_id, job)
+            assigned += 1
+            logger.info("%s assigned to courier %s, %.1f km from pickup", job.order_id, chat_id, km)
+        if assigned < len(assignments):
+            self._wake.set()
+        self.notifier.wake()
+        return assigned
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(BATCH_SECONDS)   # orders arriving close behind join this batch
+            self._wake.clear()
+            try:
+                await self.dispatch()
+            except Exception:
+                logger.exception("Dispatch failed")
+
+    # --- SYNC ---
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Courier sync failed")
+
+    async def sync(self):
+        """Writes positions moved since last time; with several processes, reads everyone's."""
+        moved, self._moved = self._moved, {}
+        if moved:
+            await self.store.run(self._save_positions, moved)
+        if not self.shared:
+            return
+        now = time.time()
+        seen = set()
+        for chat_id, name, lat, lon, live_until in await self.store.run(self._roster):
+            seen.add(chat_id)
+            courier = self.couriers.get(chat_id)
+            if courier is None:
+                courier = self.couriers[chat_id] = Courier(chat_id, name)
+            courier.name = name
+            if lat is not None and (lat, lon, live_until) != (courier.lat, courier.lon, courier.live_until):
+                courier.lat, courier.lon, courier.live_until = lat, lon, live_until
+                self._place(courier, now)
+        for chat_id in set(self.couriers) - seen:
+            self._forget(chat_id)
+
+    # --- REPORTING ---
+
+    def roster_text(self):
+        now = time.time()
+        lines = []
+        for courier in sorted(self.couriers.values(), key=lambda c: c.name):
+            if courier.order_id is not None:
+                state = f"on {courier.order_id}"
+            elif courier.live_until > now:
+                state = "free"
+            else:
+                state = "offline"
+            lines.append(f"• {courier.name} — {state}")
+        head = f"🛵 Couriers: {len(self.couriers)}, {len(self.index)} free; {len(self.waiting)} orders waiting"
+        return "\n".join([head, *lines]) if lines else head + "\nNone yet. Add one with /courier add @username"
+
+
+def _notices(job, courier, km):
+    """The job message to the courier and the note to the channel, as send_message kwargs."""
+    lat, lon = job.dropoff
+    mapslink = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}"
+    return [
+        {'chat_id': courier.chat_id, 'parse_mode': 'Markdown', 'disable_web_page_preview': True,
+         'text': f"🛵 *New delivery {job.order_id}*\n"
+                 f"Pickup: {job.cafe or '-'}\n"
+                 f"Drop-off: {job.zone or '-'}, [Open Map]({mapslink})\n"
+                 f"💵 Collect: {job.total} ETB"},
+        {'chat_id': config.CHANNEL_ID,
+         'text': f"🛵 {job.order_id} → {courier.name} ({km:.1f} km from pickup)"},
+    ]
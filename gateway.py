@@ -0,0 +1,283 @@
+"""
+Outbound Bot API gateway.
+
+Gateway wraps the request backend, so every call the bot makes passes
+through it, whichever handler or worker issued it. It shapes message traffic
+to Telegram's limits instead of tripping them:
+
+  * a token bucket per chat (about 1 msg/s in private chats, 20 msg/min in
+    groups and channels) and one global bucket (30 msg/s);
+  * priority lanes for the global budget: order traffic first, then
+    interactive replies, then broadcasts (set with the LANE context var);
+  * retries with jitter: 429s are retried after retry_after; timeouts and
+    network errors only for methods that are safe to repeat;
+  * coalescing: plain sendMessage calls that queue up behind the same chat's
+    bucket are joined into one message. Every joined caller gets that
+    message back, so calls that keep their message to edit it later (those
+    with a keyboard, or sent with COALESCE off) are never joined.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from telegram.error import NetworkError
+from telegram.request import BaseRequest, RequestData
+
+logger = logging.getLogger(__name__)
+
+ORDERS, INTERACTIVE, BULK = 0, 1, 2
+LANE = contextvars.ContextVar('gateway_lane', default=INTERACTIVE)
+COALESCE = contextvars.ContextVar('gateway_coalesce', default=True)
+
+GLOBAL_RATE, GLOBAL_BURST = 30.0, 30
+PRIVATE_RATE, PRIVATE_BURST = 1.0, 3
+GROUP_RATE, GROUP_BURST = 20 / 60, 5
+MAX_CHATS = 10_000
+
+MAX_RETRIES = 3
+MAX_TEXT = 4096
+PACED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+IDEMPOTENT_PREFIXES = ('get', 'edit', 'answer', 'delete', 'set')
+
+# Params that must match for two sendMessage calls to be joined.
+_JOIN_KEYS = ('parse_mode', 'disable_web_page_preview', 'disable_notification', 'message_thread_id')
+
+
+class Bucket:
+    """Token bucket that hands out reservations: take() returns how long to wait."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Pacer:
+    """The global budget. When it runs dry, waiters are served by (lane, arrival)."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, lane):
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def _schedule(self):
+        if self._timer is None and self._waiters:
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():   # skip waiters that were cancelled
+                self.tokens -= 1
+                future.set_result(None)
+        self._schedule()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+
+class _JoinedText(RequestData):
+    """The last queued sendMessage of a batch, carrying the batch's joined text."""
+
+    def __init__(self, base, text):
+        super().__init__()
+        self._base = base
+        self._text = text
+
+    @property
+    def parameters(self):
+        return {**self._base.parameters, 'text': self._text}
+
+    @property
+    def json_parameters(self):
+        return {**self._base.json_parameters, 'text': self._text}
+
+
+class _Batch:
+    """sendMessage calls to one chat waiting for the same slot."""
+
+    def __init__(self, request_data):
+        self.requests = [request_data]
+        self.length = len(request_data.parameters.get('text', ''))
+        self.result = asyncio.get_running_loop().create_future()
+
+    def accepts(self, request_data):
+        last = self.requests[-1].parameters
+        params = request_data.parameters
+        return (
+            self.length + len(params.get('text', '')) + 2 <= MAX_TEXT
+            and all(last.get(k) == params.get(k) for k in _JOIN_KEYS)
+        )
+
+    def join(self, request_data):
+        self.requests.append(request_data)
+        self.length += len(request_data.parameters.get('text', '')) + 2
+
+    def request_data(self):
+        if len(self.requests) == 1:
+            return self.requests[0]
+        text = "\n\n".join(r.parameters.get('text', '') for r in self.requests)
+        return _JoinedText(self.requests[-1], text)
+
+
+def _coalescable(api_method, request_data):
+    if api_method != 'sendMessage' or request_data is None or request_data.contains_files or not COALESCE.get():
+        return False
+    params = request_data.parameters
+    return 'text' in params and not (
+        {'entities', 'reply_markup', 'reply_to_message_id', 'reply_parameters'} & params.keys()
+    )
+
+
+def _chat_key(chat_id):
+    """Numeric ids as int, so "-100123" and -100123 share a bucket; @usernames stay as they are."""
+    if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+        return int(chat_id)
+    return chat_id
+
+
+def _retry_after(payload):
+    try:
+        return float(json.loads(payload)['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return 1.0
+
+
+class Gateway(BaseRequest):
+    """Paces, prioritizes, retries and coalesces calls to the wrapped request backend."""
+
+    def __init__(self, inner, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, shaping=True, share=1.0):
+        self.inner = inner
+        self.shaping = shaping   # off for local stand-ins, where only retries apply
+        # The part of the bot-wide limits this process may use, 1/WORKERS when several send
+        # as the same bot. Private chats are sharded, so their limit needs no splitting.
+        self.share = share
+        self.pacer = Pacer(global_rate * share, max(1, round(global_burst * share)))
+        self._chats = OrderedDict()   # chat_id -> Bucket, least recently used first
+        self._open = {}               # chat_id -> _Batch still waiting for its slot
+        self.retries = 0
+        self.coalesced = 0
+
+    @property
+    def read_timeout(self):
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    def _bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:   # private chat
+                rate, burst = PRIVATE_RATE, PRIVATE_BURST
+            else:
+                rate, burst = GROUP_RATE * self.share, max(1, round(GROUP_BURST * self.share))
+            bucket = self._chats[chat_id] = Bucket(rate, burst, now)
+            if len(self._chats) > MAX_CHATS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        timeouts = (read_timeout, write_timeout, connect_timeout, pool_timeout)
+        api_method = url.rsplit('/', 1)[-1]
+        chat_id = request_data.parameters.get('chat_id') if request_data is not None else None
+        if not self.shaping or chat_id is None or not api_method.startswith(PACED_PREFIXES):
+            return await self._send(url, method, api_method, request_data, timeouts)
+        chat_id = _chat_key(chat_id)
+
+        coalescable = _coalescable(api_method, request_data)
+        batch = self._open.get(chat_id) if coalescable else None
+        if batch is not None and batch.accepts(request_data):
+            batch.join(request_data)
+            self.coalesced += 1
+            return await asyncio.shield(batch.result)
+
+        now = time.monotonic()
+        wait = self._bucket(chat_id, now).take(now)
+        batch = None
+        if wait > 0 and coalescable:
+            batch = self._open[chat_id] = _Batch(request_data)
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.pacer.acquire(LANE.get())
+            if batch is None:
+                return await self._send(url, method, api_method, request_data, timeouts)
+            # Closed before sending, so nothing joins a message already on its way.
+            del self._open[chat_id]
+            result = await self._send(url, method, api_method, batch.request_data(), timeouts)
+        except BaseException as e:
+            if batch is not None:
+                if self._open.get(chat_id) is batch:
+                    del self._open[chat_id]
+                if isinstance(e, asyncio.CancelledError):
+                    batch.result.cancel()
+                else:
+                    batch.result.set_exception(e)
+                    batch.result.exception()   # retrieved here; joiners may be gone
+            raise
+        batch.result.set_result(result)
+        return result
+
+    async def _send(self, url, method, api_method, request_data, timeouts):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                code, payload = await self.inner.do_request(url, method, request_data, *timeouts)
+            except NetworkError as e:   # includes TimedOut
+                # A send that timed out may have gone through; only repeat what is safe to repeat.
+                if attempt == MAX_RETRIES or not api_method.startswith(IDEMPOTENT_PREFIXES):
+                    raise
+                delay = min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning("%s failed (%s), retrying in %.1fs", api_method, e, delay)
+            else:
+                if code != 429 or attempt == MAX_RETRIES:
+                    return code, payload
+                # Telegram refused it, so nothing was sent and any method can be retried.
+                delay = _retry_after(payload) * random.uniform(1.0, 1.2)
+                logger.warning("%s hit the flood limit, retrying in %.1fs", api_method, delay)
+            self.retries += 1
+            await asyncio.sleep(delay)
@@ -1,4 +1,198 @@
-from config import MIN_LAT, MAX_LAT, MIN_LON, MAX_LON
+"""
+Delivery zones.
 
-def in_werabe(lat, lon):
-    return MIN_LAT <= lat <= MAX_LAT and MIN_LON <= lon <= MAX_LON
+Zones are named polygons loaded from config.ZONES_PATH. A uniform grid maps
+each cell to the zones whose bounding box touches it, so a lookup does one
+dict access plus a point-in-polygon test for the few candidates in that cell.
+Cells lying wholly inside their first candidate zone are marked interior and
+answered without any polygon test.
+Cafés can have their own coordinates in the file; otherwise distance is
+measured from the matched zone's hub.
+"""
+import json
+import math
+from collections import namedtuple
+
+import config
+
+EARTH_RADIUS_KM = 6371.0
+
+Zone = namedtuple('Zone', 'name polygon bbox hub')
+Match = namedtuple('Match', 'zone distance_km')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Ray casting; polygon is a list of (lat, lon) vertices."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        yi, xi = polygon[i]
+        yj, xj = polygon[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _on_edge(lat, lon, polygon, eps=1e-12):
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        (y1, x1), (y2, x2) = polygon[j], polygon[i]
+        if min(y1, y2) - eps <= lat <= max(y1, y2) + eps and min(x1, x2) - eps <= lon <= max(x1, x2) + eps:
+            if abs((x2 - x1) * (lat - y1) - (y2 - y1) * (lon - x1)) <= eps:
+                return True
+        j = i
+    return False
+
+
+def _segment_meets_box(p, q, min_lat, min_lon, max_lat, max_lon):
+    """True if segment p-q touches the closed box (Liang-Barsky clipping)."""
+    (y1, x1), (y2, x2) = p, q
+    t0, t1 = 0.0, 1.0
+    for d, low, high, start in ((y2 - y1, min_lat, max_lat, y1), (x2 - x1, min_lon, max_lon, x1)):
+        if d == 0:
+            if not low <= start <= high:
+                return False
+            continue
+        a, b = (low - start) / d, (high - start) / d
+        if a > b:
+            a, b = b, a
+        t0, t1 = max(t0, a), min(t1, b)
+        if t0 > t1:
+            return False
+    return True
+
+
+class ZoneIndex:
+    def __init__(self, zones, cafes=None, cell_size=0.01):
+        self.zones = zones
+        self.cafes = cafes or {}
+        self.cell_size = cell_size
+        self.grid = {}
+        for zone in zones:
+            min_lat, min_lon, max_lat, max_lon = zone.bbox
+            for cy in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for cx in range(self._cell(min_lon), self._cell(max_lon) + 1):
+                    self.grid.setdefault((cy, cx), []).append(zone)
+        self.interior = {
+            cell: candidates[0] for cell, candidates in self.grid.items()
+            if self._cell_inside(cell, candidates[0])
+        }
+
+    def _cell_inside(self, cell, zone):
+        """True if the whole cell lies inside zone.
+
+        One corner inside and no polygon edge touching the cell means the
+        boundary never enters it. Corners alone are not enough: a concave
+        zone can cut a notch through a cell whose four corners are inside.
+        """
+        s = self.cell_size
+        lat0, lon0 = cell[0] * s, cell[1] * s
+        if not point_in_polygon(lat0, lon0, zone.polygon):
+            return False
+        polygon = zone.polygon
+        j = len(polygon) - 1
+        for i in range(len(polygon)):
+            if _segment_meets_box(polygon[j], polygon[i], lat0, lon0, lat0 + s, lon0 + s):
+                return False
+            j = i
+        return True
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            doc = json.load(f)
+        zones = []
+        for z in doc['zones']:
+            polygon = [tuple(p) for p in z['polygon']]
+            lats, lons = [p[0] for p in polygon], [p[1] for p in polygon]
+            bbox = (min(lats), min(lons), max(lats), max(lons))
+            hub = tuple(z.get('hub') or (sum(lats) / len(lats), sum(lons) / len(lons)))
+            zones.append(Zone(z['name'], polygon, bbox, hub))
+        cafes = {name: tuple(p) for name, p in doc.get('cafes', {}).items()}
+        return cls(zones, cafes, doc.get('cell_size_deg', 0.01))
+
+    def _cell(self, deg):
+        return math.floor(deg / self.cell_size)
+
+    def zone_at(self, lat, lon):
+        """The first zone containing the point (boundary included), or None."""
+        cell = (self._cell(lat), self._cell(lon))
+        zone = self.interior.get(cell)
+        if zone is not None:
+            return zone
+        return self._scan(lat, lon, self.grid.get(cell, ()))
+
+    @staticmethod
+    def _scan(lat, lon, candidates):
+        for zone in candidates:
+            min_lat, min_lon, max_lat, max_lon = zone.bbox
+            if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                continue
+            if point_in_polygon(lat, lon, zone.polygon) or _on_edge(lat, lon, zone.polygon):
+                return zone
+        return None
+
+    def locate(self, lat, lon, cafe=None):
+        """Match(zone, distance_km) for a drop-off point, or None outside every zone.
+
+        distance_km is measured from `cafe` when its coordinates are known,
+        otherwise from the zone's hub.
+        """
+        zone = self.zone_at(lat, lon)
+        if zone is None:
+            return None
+        origin = self.cafes.get(cafe) or zone.hub
+        return Match(zone, haversine_km(origin[0], origin[1], lat, lon))
+
+    def pickup(self, cafe, lat, lon):
+        """Where an order from `cafe` to (lat, lon) is collected: the café if its
+        coordinates are known, else the drop-off zone's hub, else the drop-off itself."""
+        origin = self.cafes.get(cafe)
+        if origin is None:
+            zone = self.zone_at(lat, lon)
+            origin = zone.hub if zone else (lat, lon)
+        return origin
+
+    def classify(self, points):
+        """Zone name (or None) for each (lat, lon) in points, for offline analysis.
+
+        Points are bucketed by grid cell first, so an interior or empty cell
+        is settled once for all the points in it.
+        """
+        by_cell = {}
+        for i, (lat, lon) in enumerate(points):
+            by_cell.setdefault((self._cell(lat), self._cell(lon)), []).append(i)
+        result = [None] * len(points)
+        for cell, indexes in by_cell.items():
+            zone = self.interior.get(cell)
+            if zone is not None:
+                for i in indexes:
+                    result[i] = zone.name
+                continue
+            candidates = self.grid.get(cell)
+            if not candidates:
+                continue
+            for i in indexes:
+                zone = self._scan(points[i][0], points[i][1], candidates)
+                if zone is not None:
+                    result[i] = zone.name
+        return result
+
+
+ZONES = ZoneIndex.load(config.ZONES_PATH)
+
+
+def locate(lat, lon, cafe=None):
+    return ZONES.locate(lat, lon, cafe)
+
+
+def pickup(cafe, lat, lon):
+    return ZONES.pickup(cafe, lat, lon)
@@ -0,0 +1,169 @@
+"""
+Opening hours.
+
+The service and each café have weekly hours, plus holidays that replace a
+date's hours (an empty list closes it), read from config.HOURS_PATH. Times
+are local, UTC + utc_offset_hours. A café is open when it and the service
+both are; a café without its own hours keeps the service's.
+
+Each Schedule remembers the state it worked out last and the moment that
+state ends, so is_open() is one comparison until the next opening or
+closing passes, and only then walks the calendar again.
+"""
+import datetime
+import json
+import math
+import time
+
+import config
+
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+SEARCH_DAYS = 400          # how far ahead the next opening is looked for
+MAX_STEPS = 64             # rounds when lining up several schedules
+_EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _intervals(spans):
+    """[["06:00", "22:00"], ...] -> sorted ((open_minute, close_minute), ...); close may be "24:00"."""
+    result = []
+    for start, end in spans:
+        start, end = _minutes(start), _minutes(end)
+        if not 0 <= start < end <= 24 * 60:
+            raise ValueError(f"bad opening hours {start}-{end}: close must follow open on the same day")
+        result.append((start, end))
+    return tuple(sorted(result))
+
+
+class Schedule:
+    def __init__(self, week, holidays=None, utc_offset_hours=3):
+        self.week = week                 # weekday (0 = Monday) -> ((open_minute, close_minute), ...)
+        self.holidays = holidays or {}   # datetime.date -> ((open_minute, close_minute), ...)
+        self.offset = utc_offset_hours * 3600
+        self._from = self._until = 0.0   # the cached state holds for [_from, _until)
+        self._open = False
+
+    @classmethod
+    def parse(cls, doc, utc_offset_hours, base=None):
+        """{"daily": [...], "mon": [...], ..., "holidays": {"YYYY-MM-DD": [...]}}; days left out keep `base`'s hours."""
+        daily = doc.get('daily')
+        week = {}
+        for i, name in enumerate(DAYS):
+            spans = doc.get(name, daily)
+            if spans is not None:
+                week[i] = _intervals(spans)
+            elif base is not None:
+                week[i] = base.week.get(i, ())
+        holidays = {
+            datetime.date.fromisoformat(day): _intervals(spans) for day, spans in doc.get('holidays', {}).items()
+        }
+        return cls(week, holidays, utc_offset_hours)
+
+    def hours_on(self, day):
+        return self.holidays.get(day, self.week.get(day.weekday(), ()))
+
+    def _windows(self, ts):
+        """Open (start, end) timestamps from the day before ts onwards, with windows that touch merged."""
+        day = datetime.datetime.utcfromtimestamp(ts + self.offset).date() - datetime.timedelta(days=1)
+        pending = None
+        for _ in range(SEARCH_DAYS):
+            midnight = (day.toordinal() - _EPOCH) * 86400 - self.offset
+            for start, end in self.hours_on(day):
+                window = (midnight + start * 60, midnight + end * 60)
+                if pending is not None and window[0] <= pending[1]:
+                    pending = (pending[0], max(pending[1], window[1]))
+                    continue
+                if pending is not None:
+                    yield pending
+                pending = window
+            day += datetime.timedelta(days=1)
+        if pending is not None:
+            yield pending
+
+    def _state(self, ts):
+        """(open, since, until): whether open at ts, and the span that holds around it."""
+        since = -math.inf
+        for start, end in self._windows(ts):
+            if ts < start:
+                return False, since, start
+            if ts < end:
+                return True, start, end
+            since = end
+        return False, since, math.inf
+
+    def _at(self, ts):
+        if not self._from <= ts < self._until:
+            self._open, self._from, self._until = self._state(ts)
+        return self._open
+
+    def is_open(self, now=None):
+        return self._at(time.time() if now is None else now)
+
+    def next_open(self, ts):
+        """ts if open then, otherwise when it next opens (inf if not within SEARCH_DAYS)."""
+        return ts if self._at(ts) else self._until
+
+    def next_close(self, ts):
+        """When the opening around ts ends; ts if closed then."""
+        return self._until if self._at(ts) else ts
+
+
+class Hours:
+    def __init__(self, service, cafes, utc_offset_hours):
+        self.service = service
+        self.cafes = cafes            # café name -> Schedule, for cafés with their own hours
+        self.offset = utc_offset_hours * 3600
+
+    @classmethod
+    def parse(cls, raw):
+        doc = json.loads(raw)
+        offset = doc.get('utc_offset_hours', 3)
+        service = Schedule.parse(doc['service'], offset)
+        cafes = {name: Schedule.parse(d, offset, base=service) for name, d in doc.get('cafes', {}).items()}
+        return cls(service, cafes, offset)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.parse(f.read())
+
+    def is_open(self, now=None):
+        return self.service.is_open(now)
+
+    def cafe_open(self, cafe, now=None):
+        now = time.time() if now is None else now
+        schedule = self.cafes.get(cafe)
+        return self.service.is_open(now) and (schedule is None or schedule.is_open(now))
+
+    def opens_at(self, cafes=(), now=None, within=math.inf):
+        """The first moment from now on when the service and every café in `cafes` are open,
+        or None if that is not within `within` seconds."""
+        now = time.time() if now is None else now
+        schedules = [self.service, *(self.cafes[c] for c in set(cafes) if c in self.cafes)]
+        ts = now
+        for _ in range(MAX_STEPS):
+            later = max(s.next_open(ts) for s in schedules)
+            if later - now > within:
+                return None
+            if later == ts:
+                return ts
+            ts = later
+        return None
+
+    def local_time(self, ts, now=None):
+        """ts as the customer would say it: "06:00" today, "Tue 06:00" later in the week, else the date."""
+        now = time.time() if now is None else now
+        local = datetime.datetime.utcfromtimestamp(ts + self.offset)
+        today = datetime.datetime.utcfromtimestamp(now + self.offset).date()
+        if local.date() == today:
+            return local.strftime('%H:%M')
+        if local.date() - today < datetime.timedelta(days=7):
+            return local.strftime('%a %H:%M')
+        return local.strftime('%Y-%m-%d %H:%M')
+
+
+HOURS = Hours.load(config.HOURS_PATH)
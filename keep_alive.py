@@ -1,19 +1,143 @@
-from flask import Flask
-from threading import Thread
-import os
+"""
+The bot's HTTP server.
 
-app = Flask('')
+Render needs an open port, and in webhook mode Telegram needs somewhere to
+POST updates. Both are served by one aiohttp app on the bot's own event loop.
+Webhook updates go into the Application's bounded update queue; when it is
+full the request waits briefly and is then refused with 503, so Telegram
+backs off and redelivers instead of us buffering without limit.
 
-@app.route('/')
-def home():
-    return "I am alive and running!"
+The server starts before the bot has finished booting (on a socket bound
+before the heavy imports, when run from bot.main). Webhook updates that
+arrive meanwhile, typically the one that woke the service, are held in a
+small buffer and acknowledged, instead of refused and redelivered after
+Telegram's back-off; open() hands them on. The buffer is only in memory:
+Telegram counts those updates as delivered, so if boot fails before open()
+they are lost (at most EARLY_UPDATES of them; past that the webhook answers
+503 and Telegram keeps the rest).
 
-def run():
-    # Render assigns a random port to the PORT environment variable
-    # We must listen on that specific port
-    port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port)
+/metrics is only served when a metrics token is configured, and only to
+requests that send it as "Authorization: Bearer <token>"; the port is
+public on Render.
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+Where an update goes is up to `deliver`: attach() points it at the
+Application's queue; in multi-process mode the front sets it to forward
+the update to a worker (see cluster.py).
+"""
+import asyncio
+import hmac
+import logging
+
+from aiohttp import web
+from telegram import Update
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram"
+ENQUEUE_TIMEOUT_SECONDS = 5
+EARLY_UPDATES = 100
+
+
+class KeepAliveServer:
+    def __init__(self, port, host="0.0.0.0", secret=None, sock=None, metrics_token=None):
+        self.port = port
+        self.host = host
+        self.secret = secret
+        self.metrics_token = metrics_token
+        self.sock = sock         # an already bound socket to serve on, if any
+        self.app = None          # telegram Application, set by attach()
+        self.deliver = None      # async (payload) -> HTTP status, set by attach() or the cluster front
+        self.ready = False
+        self._early = []         # webhook payloads received before open()
+        self.web = web.Application()
+        self.web.router.add_get("/", self.home)
+        self.web.router.add_get("/healthz", self.healthz)
+        self.web.router.add_get("/readyz", self.readyz)
+        if metrics_token:
+            self.web.router.add_get("/metrics", self.metrics)
+        self.web.router.add_post(WEBHOOK_PATH, self.webhook)
+        self._runner = None
+
+    def attach(self, app):
+        """Starts accepting webhook updates for `app`."""
+        self.app = app
+        self.deliver = self._enqueue
+
+    async def open(self):
+        """Marks the bot ready and delivers the webhook updates held while it booted."""
+        self.ready = True
+        early, self._early = self._early, []
+        for payload in early:
+            while await self.deliver(payload) == 503:
+                await asyncio.sleep(1)
+        if early:
+            logger.info("Delivered %s updates received while starting", len(early))
+
+    async def _enqueue(self, payload):
+        try:
+            update = Update.de_json(payload, self.app.bot)
+        except Exception:
+            logger.warning("Malformed webhook payload")
+            return 400
+        try:
+            await asyncio.wait_for(self.app.update_queue.put(update), ENQUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Update queue full; refusing update %s", update.update_id)
+            return 503
+        return 200
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web, access_log=None)
+        await self._runner.setup()
+        if self.sock is not None:
+            await web.SockSite(self._runner, self.sock).start()
+        else:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("HTTP server listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # --- ROUTES ---
+
+    async def home(self, request):
+        return web.Response(text="I am alive and running!")
+
+    async def healthz(self, request):
+        return web.Response(text="ok")
+
+    async def readyz(self, request):
+        if not self.ready:
+            return web.Response(status=503, text="starting")
+        return web.Response(text="ready")
+
+    async def metrics(self, request):
+        expected = f"Bearer {self.metrics_token}".encode()
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+            return web.Response(status=401, headers={"WWW-Authenticate": "Bearer"})
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def webhook(self, request):
+        if self.secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret:
+            return web.Response(status=403)
+        if not self.ready:
+            if len(self._early) >= EARLY_UPDATES:
+                return web.Response(status=503, headers={"Retry-After": "1"})
+            try:
+                self._early.append(await request.json())
+            except ValueError:
+                return web.Response(status=400)
+            return web.Response()
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        status = await self.deliver(payload)
+        if status == 503:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response(status=status)
@@ -2,7 +2,11 @@ TEXTS = {
     'en': {
         'choose_lang': "Please select your language:",
         'welcome': "👋 Welcome to our Delivery Service!",
-        'closed': "⛔ Sorry, we are currently closed. Open daily 6 AM – 6 PM.",
+        'closed': "⛔ Sorry, we are currently closed.",
+        'closed_until': "⛔ Sorry, we are currently closed. We open again at {}.",
+        'preorder_notice': "🌙 We're closed right now, but you can order ahead: your order goes to the café when we open at {}.",
+        'preorder_placed': "🕒 Pre-order placed! It goes to the café at {}.\n📦 Order No: `{}`",
+        'preorder_released': "✅ We're open! Your pre-order `{}` has been sent to the café. Wait for confirmation.",
         'ask_phone': "📞 Please share your phone number to continue:",
         'btn_phone': "📱 Share Phone Number",
         'phone_saved': "✅ Phone number saved!",
@@ -13,6 +17,7 @@ TEXTS = {
         'item_not_found': "❌ Item not found.",
         'total': "💵 Total",
         'delivery_fee': "🚚 Delivery Fee",
+        'discount': "🎁 Discount",
         'ask_location': "📍 Please share your location to finalize:",
         'btn_location': "📍 Share Location",
         'btn_done': "✅ Done",
@@ -21,9 +26,11 @@ TEXTS = {
         'order_sent': "✅ Order sent! Wait for confirmation.\n📦 Order No: `{}`",
         'order_cancelled': "❌ Order cancelled.",
         'location_error': "❌ Delivery is only available within Werabe city limits.",
+        'items_unavailable': "⚠️ Some items in your cart are no longer on the menu and were removed.",
         'admin_broadcast': "📢 Announcement:\n\n{}",
         'order_accepted': "✅ Your Order `{}` has been ACCEPTED! 🚚\nIt will be delivered shortly.",
         'order_declined': "❌ Your Order `{}` was DECLINED.\nPlease contact support or try again.",
+        'order_delivered': "📦 Your Order `{}` has been delivered. Enjoy your meal!",
         'btn_profile': "👤 My Profile",
         'profile_header': "👤 *User Profile*\n\n📞 Phone: `{}`\n🗣️ Language: English\n📍 Location: {}",
         'btn_switch_lang': "🔄 Switch Language",
@@ -35,7 +42,11 @@ TEXTS = {
     'am': {
         'choose_lang': "እባክዎ ቋንቋ ይምረጡ / Please choose language:",
         'welcome': "👋 ወደ ዴሊቨሪ አገልግሎታችን እንኳን በደህና መጡ!",
-        'closed': "⛔ ይቅርታ፣ አሁን ዝግ ነን። በየቀኑ ከጠዋቱ 12 ሰዓት እስከ ማታ 12 ሰዓት ክፍት ነን።",
+        'closed': "⛔ ይቅርታ፣ አሁን ዝግ ነን።",
+        'closed_until': "⛔ ይቅርታ፣ አሁን ዝግ ነን። እንደገና የምንከፍተው {} ላይ ነው።",
+        'preorder_notice': "🌙 አሁን ዝግ ነን፣ ግን አስቀድመው ማዘዝ ይችላሉ። ትዕዛዝዎ {} ላይ ስንከፍት ወደ ካፌው ይላካል።",
+        'preorder_placed': "🕒 ቅድመ ትዕዛዝዎ ተመዝግቧል! {} ላይ ወደ ካፌው ይላካል።\n📦 የትዕዛዝ ቁጥር: `{}`",
+        'preorder_released': "✅ ከፍተናል! ቅድመ ትዕዛዝዎ `{}` ወደ ካፌው ተልኳል። ማረጋገጫ እስኪደርስዎት ይጠብቁ።",
         'ask_phone': "📞 ለመቀጠል እባክዎ ስልክ ቁጥርዎን ያጋሩ፡",
         'btn_phone': "📱 ስልክ ቁጥር ያጋሩ",
         'phone_saved': "✅ ስልክ ቁጥር ተመዝግቧል!",
@@ -46,6 +57,7 @@ TEXTS = {
         'item_not_found': "❌ እቃው አልተገኘም።",
         'total': "💵 ጠቅላላ",
         'delivery_fee': "🚚 የትራንስፖርት",
+        'discount': "🎁 ቅናሽ",
         'ask_location': "📍 ትዕዛዙን ለመጨረስ እባክዎ ያሉበትን ቦታ (Location) ያጋሩ፡",
         'btn_location': "📍 ቦታ ያጋሩ (Location)",
         'btn_done': "✅ ጨርሻለሁ",
@@ -54,9 +66,11 @@ TEXTS = {
         'order_sent': "✅ ትዕዛዝዎ ተልኳል! ማረጋገጫ እስኪደርስዎት ይጠብቁ።\n📦 የትዕዛዝ ቁጥር: `{}`",
         'order_cancelled': "❌ ትዕዛዝ ተሰርዟል።",
         'location_error': "❌ ዴሊቨሪ የምንሰጠው በወራቤ ከተማ ውስጥ ብቻ ነው።",
+        'items_unavailable': "⚠️ በጋሪዎ ውስጥ የነበሩ አንዳንድ ምግቦች ከሜኑው ስለተነሱ ተወግደዋል።",
         'admin_broadcast': "📢 ማስታወቂያ፡\n\n{}",
         'order_accepted': "✅ ትዕዛዝ ቁጥር `{}` ተቀባይነት አግኝቷል! 🚚\nበቅርቡ ይደርስዎታል።",
         'order_declined': "❌ ትዕዛዝ ቁጥር `{}` ውድቅ ተደርጓል።\nእባክዎ ይደውሉልን።",
+        'order_delivered': "📦 ትዕዛዝ ቁጥር `{}` ደርሷል። መልካም ምግብ!",
         'btn_profile': "👤 የእኔ መረጃ (Profile)",
         'profile_header': "👤 *የግል መረጃ*\n\n📞 ስልክ: `{}`\n🗣️ ቋንቋ: አማርኛ\n📍 አድራሻ: {}",
         'btn_switch_lang': "🔄 ቋንቋ ቀይር",
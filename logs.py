@@ -0,0 +1,151 @@
+"""
+Logging that stays off the event loop.
+
+setup() puts a QueueHandler on the root logger. Callers only filter, sample
+and enqueue a record; formatting and writing happen on a listener thread.
+Messages use %-style arguments, so nothing is formatted for records that are
+filtered out, and the formatting that is done happens on that thread too
+(pass values, not objects that change right after the call).
+
+Records carry the context of the update being handled (handler, chat_id,
+order_id; see bind() and handler_hook()) and are written as one JSON object
+per line. Noisy events are sampled at the rates in config.LOG_SAMPLE, keyed
+by the record's `event` or its logger name; warnings and errors always get
+through.
+"""
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+logger = logging.getLogger(__name__)
+
+# Handlers slower than this are always logged, whatever the sample rate.
+SLOW_SECONDS = 1.0
+
+_FIELDS = ('handler', 'chat_id', 'order_id', 'duration_ms', 'event')
+_context = contextvars.ContextVar('log_context', default={})
+
+
+def bind(**fields):
+    """Adds fields to every record logged from the current task."""
+    _context.set({**_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copies the bound fields onto the record, in the logging task."""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class Sampler(logging.Filter):
+    """Keeps a fraction of the records below WARNING for the configured events."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(getattr(record, 'event', None)) or self.rates.get(record.name)
+        if rate is None:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key in _FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                doc[key] = value
+        if hasattr(record, 'sample_rate'):
+            doc['sample_rate'] = record.sample_rate
+        if record.exc_info:
+            doc['exc'] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records unformatted; the listener thread formats them."""
+
+    def prepare(self, record):
+        return record
+
+
+def parse_rates(spec):
+    """'httpx=0.05,handled=0.1' -> {'httpx': 0.05, 'handled': 0.1}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, rate = part.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+_listener = None
+
+
+def setup(level=logging.INFO, fmt='json', sample=None, stream=None):
+    """Routes every log record through a queue to a writer thread."""
+    global _listener
+    shutdown()
+    target = logging.StreamHandler(stream)
+    if fmt == 'json':
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(Sampler(sample or {}))
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, target, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def shutdown():
+    """Writes out what is still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# --- HANDLERS ---
+
+def handler_hook(name):
+    """Hook for metrics.instrument(): binds the handler name and chat to the update's
+    task, and logs how long the handler took."""
+    def start(update):
+        chat = getattr(update, 'effective_chat', None)
+        _context.set({'handler': name, 'chat_id': chat.id if chat else None})
+
+    def finish(elapsed):
+        level = logging.WARNING if elapsed >= SLOW_SECONDS else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, "%s handled in %.1f ms", name, elapsed * 1000,
+                       extra={'event': 'handled', 'duration_ms': round(elapsed * 1000, 1)})
+    return start, finish
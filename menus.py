@@ -1,23 +1,134 @@
-CAFES = {
-    'Lubaba Reastaurant': {'kitfo': 400,'tibs': 300},
-
-    'Temberlin cafe': {'-------------Sandwich and Burger-------------': None,'club sandwich': 300+50,'club sandwich with chicken': 350+50,'club sandwch with tuna': 370+50,'tuna sandwich': 350+50,
-    'egg sandwich': 170+50,'vegetable sanwich': 150+50,'temberlin sandwich': 290+50,'veggi sandwich': 150+50,'chips': 120+50,'temberlin burger': 370+50,
-    'special burger': 320+50,'double burger': 290+50,'cheese burger': 290+50,'egg burger': 260+50,'chicken burger': 300+50,'fasting burger': 200+50,'normal burger': 280+50,
-    '---------------Mini pizza---------------': None,'temberlin special pizza': 320+50,'beef pizza': 250+50,'chicken pizza': 280+50,'vegtable chez pizza': 240+50,'fasting(vegtable pizza)': 220+50,
-    'margeret pizza': 260+50,'tuna pizza(fasting)': 270+50,'tuna & cheese pizza': 280+50,'qutro pizza': 300+50,'meat lover pizza': 250+50,
-    '---------------Medium pizza---------------': None,'.temberlin special pizza': 400+50,'.beef pizza': 320+50,'.chicken pizza': 350+50,'.vegtable pizza': 300+50,'.fasting(vegtable pizza)': 280+50,
-    '.margeret pizza': 330+50,'.tuna pizza(fasting)': 340+50,'.tuna & cheese pizza': 350+50,'.qutro pizza': 360+50,'.meat lover pizza': 320+50,
-    '---------------pizza Large---------------': None,'temberlin special pizza.': 450+50,'beef pizza.': 370+50,'chicken pizza.': 400+50,'vegtable cheez pizza.': 350+50,'fasting(vegtable pizza).': 300+50,
-    'margeret pizza.': 390+50,'tuna pizza(fasting).': 400+50,'tuna & cheese pizza.': 420+50,'qutro pizza.': 440+50,'meat lover pizza.': 370+50,
-    '-----------------Wrap-----------------': None,'temberlin special rap': 390+50,'chicken rap shorma': 350+50,'beef rap' : 340+50,'tuna rap': 360+50,'vegtable rap': 250+50
-    ,'-----------------Lunch-----------------': None,'tibs': 280+50,'kuanta firfir': 230+50,'special kuanta firfir': 250+50,'sga firfir': 190+50,'bozena shiro': 220+50,'shiro feses': 150+50,'tegabino': 200+50,'pasta beatklt': 160+50,
-    'pasta besgo': 150+50,'pasta besga': 200+50,'pasta betuna': 210+50,'pasta benkulal': 190+50,'ruz beatklt': 160+50,'ruz besga': 200+50,'ruz betuna': 210+50,'ruz besgo': 160+50,'timatim lebleb': 150+50,'-----------------Breakfast-----------------': None,
-    'Tenbrlin special maesum': 180+50,'fetira': 140+50,'fetira dekak': 140+50,'fetira gored': 130+50,'special chechebsa': 160+50,'special fetira dekak': 160+50,'enkulal sls': 130+50,
-    'enkulal firfir': 125+50,'special omlet': 200+50,'normal omlet': 170+50,'cheese omlet': 190+50,'melewa benkulal': 140+50,'melewa normal': 120+50,'special fool': 160+50,'normal fool': 100+50,
-    'fool betuna': 150+50,'special injera firfir': 180+50,'tuna firfir': 200+50,'pancake': 150+50,'enkulal besga': 190+50,'injera firfir': 130+50,'fool be avocado': 120+50},
-
-    'Habesha Cafe': {'coffee': 20, 'injera': 50},
-    'Werabe Delight': {'sambusa': 10, 'juice': 15},
-    'Oromia Coffee': {'espresso': 25, 'tea': 15},
-}
\ No newline at end of file
+"""
+The menu catalog.
+
+Menus are read from config.MENU_PATH into immutable Catalog objects. Items
+carry a stable integer id (assigned in the file; never renumber existing
+items), their section and size as separate fields, and an integer price.
+
+watch() polls the file's mtime and swaps in a freshly loaded Catalog with
+a single assignment, so readers always see one whole version. Carts keep the
+version they were built from; get(version) returns that catalog while it is
+still in the recent history, so prices do not change under an open cart.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict, namedtuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+Item = namedtuple('Item', 'id cafe name size section price')
+
+HISTORY = 8   # old catalog versions kept for open carts
+
+
+class Catalog:
+    def __init__(self, version, cafes, mtime=None):
+        self.version = version
+        self.mtime = mtime
+        self.cafes = cafes      # OrderedDict cafe name -> tuple of Items, in menu order
+        self.items = {item.id: item for items in cafes.values() for item in items}
+
+    @classmethod
+    def parse(cls, raw, mtime=None):
+        doc = json.loads(raw)
+        cafes = OrderedDict()
+        seen = set()
+        for cafe in doc['cafes']:
+            items = []
+            for section in cafe['sections']:
+                for entry in section['items']:
+                    item_id = int(entry['id'])
+                    if item_id in seen:
+                        raise ValueError(f"duplicate item id {item_id}")
+                    seen.add(item_id)
+                    items.append(Item(
+                        item_id, cafe['name'], entry['name'], entry.get('size'),
+                        section.get('name'), int(entry['price'])
+                    ))
+            if not items:
+                # Nothing to show or order; the menu pages assume every café has items.
+                logger.warning("Café %s has no items; left out of the menu", cafe['name'])
+                continue
+            cafes[cafe['name']] = tuple(items)
+        version = hashlib.sha1(raw).hexdigest()[:12]
+        return cls(version, cafes, mtime)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            return cls.parse(f.read(), mtime)
+
+    def item(self, item_id):
+        return self.items.get(item_id)
+
+
+def display_name(item):
+    return f"{item.name} ({item.size})" if item.size else item.name
+
+
+# --- CURRENT VERSION ---
+
+_current = Catalog.load(config.MENU_PATH)
+_history = OrderedDict([(_current.version, _current)])
+
+
+def current():
+    return _current
+
+
+def get(version):
+    """The catalog a cart was built from, or the current one if it has aged out."""
+    return _history.get(version) or _current
+
+
+def swap(catalog):
+    global _current
+    _history[catalog.version] = catalog
+    _history.move_to_end(catalog.version)
+    while len(_history) > HISTORY:
+        _history.popitem(last=False)
+    _current = catalog
+
+
+def _load_if_changed(path):
+    try:
+        if os.stat(path).st_mtime == _current.mtime:
+            return None
+        catalog = Catalog.load(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error("Menu reload failed, keeping version %s: %s", _current.version, e)
+        return None
+    if catalog.version == _current.version:
+        _current.mtime = catalog.mtime
+        return None
+    return catalog
+
+
+def _install(catalog):
+    if catalog is None:
+        return False
+    swap(catalog)
+    logger.info("Menu catalog reloaded: version %s, %s items", catalog.version, len(catalog.items))
+    return True
+
+
+def reload_if_changed(path=None):
+    """Reloads the catalog if the file's mtime moved. Returns True if a new version was swapped in."""
+    return _install(_load_if_changed(path or config.MENU_PATH))
+
+
+async def watch(interval=10.0):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Parse off the loop, swap on it.
+            _install(await asyncio.to_thread(_load_if_changed, config.MENU_PATH))
+        except Exception:
+            # Whatever a bad edit breaks, keep watching for the next one.
+            logger.exception("Menu reload failed, keeping version %s", _current.version)
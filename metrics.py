@@ -0,0 +1,209 @@
+"""
+In-process metrics in Prometheus text format.
+
+Handlers registered on the Application are wrapped by instrument_handlers(),
+which also runs the hooks of other per-handler instrumentation (logs.py);
+outbound Bot API calls are timed by InstrumentedRequest, which sits between
+the Bot and its real HTTP backend. Observing a value is a bisect plus two
+additions, and nothing is formatted until /metrics is scraped.
+"""
+import contextvars
+import functools
+import time
+from bisect import bisect_left
+
+from telegram.error import TelegramError
+from telegram.request import BaseRequest
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 7, 10, 15, 20)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _label_str(self, values, extra=''):
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_str(values)} {child.value}"]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, child.counts):
+            cumulative += n
+            le = self._label_str(values, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        le = self._label_str(values, 'le="+Inf"')
+        labels = self._label_str(values)
+        lines.append(f"{self.name}_bucket{le} {child.count}")
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- BOT METRICS ---
+
+HANDLER_SECONDS = Histogram('wdelivery_handler_seconds', 'Handler latency.', ('handler',))
+HANDLER_ERRORS = Counter('wdelivery_handler_errors_total', 'Handlers that raised.', ('handler',))
+API_SECONDS = Histogram('wdelivery_api_seconds', 'Bot API call latency.', ('method',))
+API_ERRORS = Counter('wdelivery_api_errors_total', 'Bot API calls that failed.', ('method',))
+API_CALLS_PER_UPDATE = Histogram(
+    'wdelivery_api_calls_per_update', 'Bot API calls made while handling one update.', ('handler',), COUNT_BUCKETS
+)
+
+# Bot API calls made by the handler currently running in this task.
+_api_calls = contextvars.ContextVar('api_calls', default=None)
+
+
+def instrument(handler, name=None, hooks=()):
+    """Times handler into the handler metrics. Each of hooks is called once with the
+    handler's name and returns (start, finish): start(update) runs before every call,
+    finish(elapsed_seconds) after it, so other instrumentation shares this one wrapper."""
+    name = name or handler.__name__
+    latency = HANDLER_SECONDS.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+    calls = API_CALLS_PER_UPDATE.labels(name)
+    starts, finishes = zip(*(hook(name) for hook in hooks)) if hooks else ((), ())
+
+    @functools.wraps(handler)
+    async def wrapper(update, ctx):
+        for start in starts:
+            start(update)
+        counter = [0]
+        token = _api_calls.set(counter)
+        started = time.perf_counter()
+        try:
+            return await handler(update, ctx)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            latency.observe(elapsed)
+            calls.observe(counter[0])
+            _api_calls.reset(token)
+            for finish in finishes:
+                finish(elapsed)
+    return wrapper
+
+
+def instrument_handlers(app, hooks=()):
+    """Wraps the callback of every handler registered on app (see instrument())."""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument(handler.callback, hooks=hooks)
+
+
+class InstrumentedRequest(BaseRequest):
+    """Times every Bot API call made through the wrapped request backend."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    @property
+    def read_timeout(self):
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        api_method = url.rsplit('/', 1)[-1]
+        counter = _api_calls.get()
+        if counter is not None:
+            counter[0] += 1
+        started = time.perf_counter()
+        try:
+            code, payload = await self.inner.do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+        except (TelegramError, OSError):
+            API_ERRORS.labels(api_method).inc()
+            raise
+        finally:
+            API_SECONDS.labels(api_method).observe(time.perf_counter() - started)
+        if code != 200:
+            API_ERRORS.labels(api_method).inc()
+        return code, payload
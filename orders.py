@@ -0,0 +1,180 @@
+"""
+Order ledger.
+
+Every order placed through location() gets a row keyed by order_id.
+Status changes are compare-and-set: an UPDATE only applies while the order
+is still in one of the statuses it may move from, so two admins tapping the
+same button cannot both win. Indexed by status, customer and day.
+
+create() can also queue the order's channel notifications in the outbox
+within the same transaction, so an order is never recorded without them.
+A pre-order placed while closed is recorded as scheduled and becomes
+pending when preorders.py releases it to the channel.
+
+Placing an order and each outcome are also written to the analytics event
+log, in the same transaction (see analytics.py). Adopted orders have no
+items or total, so they stay out of it.
+"""
+import datetime
+import json
+import time
+from collections import namedtuple
+
+import analytics
+import outbox
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id   TEXT PRIMARY KEY,
+    chat_id    INTEGER NOT NULL,
+    status     TEXT NOT NULL,
+    total      INTEGER NOT NULL DEFAULT 0,
+    items      TEXT NOT NULL DEFAULT '[]',
+    location   TEXT,
+    day        TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    handled_by TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status, created_at);
+CREATE INDEX IF NOT EXISTS orders_chat ON orders (chat_id, created_at);
+CREATE INDEX IF NOT EXISTS orders_day ON orders (day);
+"""
+
+SCHEDULED, PENDING, ACCEPTED, DECLINED, DELIVERED = 'scheduled', 'pending', 'accepted', 'declined', 'delivered'
+OPEN_STATUSES = (SCHEDULED, PENDING, ACCEPTED)
+
+# target status -> statuses it may be reached from
+TRANSITIONS = {
+    PENDING: (SCHEDULED,),
+    ACCEPTED: (PENDING,),
+    DECLINED: (PENDING,),
+    DELIVERED: (ACCEPTED,),
+}
+
+Order = namedtuple('Order', 'order_id chat_id status total items location day created_at updated_at handled_by')
+
+_COLUMNS = ', '.join(Order._fields)
+
+
+def local_day(ts=None):
+    """The EAT (UTC+3) calendar day for a timestamp, as YYYY-MM-DD."""
+    ts = time.time() if ts is None else ts
+    return (datetime.datetime.utcfromtimestamp(ts) + datetime.timedelta(hours=3)).strftime('%Y-%m-%d')
+
+
+def local_hour(ts):
+    """The EAT (UTC+3) hour of the day for a timestamp."""
+    return (datetime.datetime.utcfromtimestamp(ts) + datetime.timedelta(hours=3)).hour
+
+
+def insert_order(conn, order_id, chat_id, items, total, location, status, now):
+    """Records an order unless order_id is known. Call inside the caller's transaction."""
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO orders (order_id, chat_id, status, total, items, location, day, created_at, updated_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (order_id, chat_id, status, total, json.dumps(items, ensure_ascii=False),
+         json.dumps(location), local_day(now), now, now),
+    )
+    if cur.rowcount == 1 and items:
+        analytics.record(conn, order_id, analytics.PLACED, local_day(now), local_hour(now), total, items, now)
+
+
+def update_status(conn, order_id, status, by, now):
+    """Compare-and-set to status; True if it applied. Call inside the caller's transaction."""
+    sources = TRANSITIONS[status]
+    marks = ', '.join('?' * len(sources))
+    cur = conn.execute(
+        f"UPDATE orders SET status = ?, handled_by = ?, updated_at = ? WHERE order_id = ? AND status IN ({marks})",
+        (status, by, now, order_id, *sources),
+    )
+    if cur.rowcount != 1:
+        return False
+    if status in analytics.OUTCOMES:
+        day, created_at, total, items = conn.execute(
+            "SELECT day, created_at, total, items FROM orders WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        items = json.loads(items)
+        if items:   # adopted orders were never counted as placed
+            analytics.record(conn, order_id, status, day, local_hour(created_at), total, items, now)
+    return True
+
+
+def _order(row):
+    if row is None:
+        return None
+    order = Order(*row)
+    return order._replace(items=json.loads(order.items), location=json.loads(order.location or 'null'))
+
+
+class OrderLedger:
+    def __init__(self, store):
+        self.store = store
+
+    # --- DB THREAD ---
+
+    def _init_schema(self):
+        self.store.conn.executescript(SCHEMA)
+        self.store.conn.executescript(analytics.SCHEMA)   # written along with every order
+        self.store.conn.commit()
+
+    def _insert(self, order_id, chat_id, items, total, location, status, now, notifications=()):
+        with self.store.conn:
+            insert_order(self.store.conn, order_id, chat_id, items, total, location, status, now)
+            if notifications:
+                outbox.insert_messages(self.store.conn, order_id, notifications, now)
+
+    def _transition(self, order_id, status, by, now):
+        with self.store.conn:
+            applied = update_status(self.store.conn, order_id, status, by, now)
+        if not applied:
+            return None
+        return self._get(order_id)
+
+    def _get(self, order_id):
+        return _order(self.store.conn.execute(f"SELECT {_COLUMNS} FROM orders WHERE order_id = ?", (order_id,)).fetchone())
+
+    def _select(self, where, args, limit):
+        rows = self.store.conn.execute(
+            f"SELECT {_COLUMNS} FROM orders WHERE {where} ORDER BY created_at DESC LIMIT ?", (*args, limit)
+        ).fetchall()
+        return [_order(r) for r in rows]
+
+    # --- PUBLIC ---
+
+    async def start(self):
+        await self.store.run(self._init_schema)
+
+    async def create(self, order_id, chat_id, items, total, location, notifications=()):
+        """Records a new pending order. items is a list of [cafe, item, qty, amount].
+
+        notifications are send_message kwargs queued in the outbox with the order.
+        """
+        await self.store.run(
+            self._insert, order_id, chat_id, items, total, location, PENDING, time.time(), notifications
+        )
+
+    async def adopt(self, order_id, chat_id):
+        """Registers a pending order that was posted before the ledger existed; no-op if known.
+        Its items and total are unknown, so analytics leaves it out."""
+        await self.store.run(self._insert, order_id, chat_id, [], 0, None, PENDING, time.time())
+
+    async def transition(self, order_id, status, by=None):
+        """Moves order_id to status if it is still in an allowed source status.
+
+        Returns the updated Order, or None if someone else got there first.
+        """
+        return await self.store.run(self._transition, order_id, status, by, time.time())
+
+    async def get(self, order_id):
+        return await self.store.run(self._get, order_id)
+
+    async def by_status(self, *statuses, limit=50):
+        marks = ', '.join('?' * len(statuses))
+        return await self.store.run(self._select, f"status IN ({marks})", statuses, limit)
+
+    async def by_customer(self, chat_id, limit=20):
+        return await self.store.run(self._select, "chat_id = ?", (chat_id,), limit)
+
+    async def by_day(self, day, limit=500):
+        return await self.store.run(self._select, "day = ?", (day,), limit)
@@ -0,0 +1,192 @@
+"""
+Outbox for channel notifications.
+
+An order's channel messages are written to the outbox in the same SQLite
+transaction that records the order, so the customer can be answered as soon
+as that commit lands. A background worker then delivers due messages in
+batches, with retries and exponential back-off.
+
+Messages of one order go out in seq order: the card is not posted until
+the map link is. Each message is marked sent as soon as Telegram accepts
+it, not when the rest of its batch is done, so a retry never re-posts what
+already went out. Only a crash between Telegram's reply and that one-row
+write can repeat a message.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import cluster
+import gateway
+import logs
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id        TEXT NOT NULL,
+    seq             INTEGER NOT NULL,
+    payload         TEXT NOT NULL,
+    state           TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    message_id      INTEGER,
+    created_at      REAL NOT NULL,
+    UNIQUE (order_id, seq)
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt_at);
+"""
+
+PENDING, SENT, DEAD = 'pending', 'sent', 'dead'
+
+BATCH_SIZE = 20
+POLL_SECONDS = 5
+MAX_ATTEMPTS = 10
+MAX_BACKOFF_SECONDS = 300
+
+
+def insert_messages(conn, order_id, messages, now=None, first_seq=0):
+    """Queues send_message kwargs for order_id. Call inside the caller's transaction."""
+    now = time.time() if now is None else now
+    conn.executemany(
+        "INSERT OR IGNORE INTO outbox (order_id, seq, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(order_id, seq, json.dumps(kwargs, ensure_ascii=False), now, now)
+         for seq, kwargs in enumerate(messages, first_seq)],
+    )
+
+
+def append_messages(conn, order_id, messages, now=None):
+    """Queues messages after any already queued for order_id. Call inside the caller's transaction."""
+    first_seq, = conn.execute(
+        "SELECT COALESCE(MAX(seq) + 1, 0) FROM outbox WHERE order_id = ?", (order_id,)
+    ).fetchone()
+    insert_messages(conn, order_id, messages, now, first_seq)
+
+
+def backoff(attempts):
+    return min(MAX_BACKOFF_SECONDS, 2 ** attempts) * random.uniform(0.8, 1.2)
+
+
+class Outbox:
+    def __init__(self, store, shard=None):
+        self.store = store
+        # (index, count): deliver only for orders of chats in this worker's shard (see cluster.py)
+        self._mine = cluster.shard_sql("(SELECT chat_id FROM orders WHERE order_id = o.order_id)", shard)
+        self._wake = None
+        self._task = None
+
+    # --- DB THREAD ---
+
+    def _init_schema(self):
+        self.store.conn.executescript(SCHEMA)
+        self.store.conn.commit()
+
+    def _due(self, now, limit):
+        # Only the lowest pending seq of each order is eligible.
+        return self.store.conn.execute(
+            "SELECT o.id, o.order_id, o.payload, o.attempts FROM outbox o"
+            " WHERE o.state = 'pending' AND o.next_attempt_at <= ?"
+            " AND NOT EXISTS (SELECT 1 FROM outbox p WHERE p.order_id = o.order_id"
+            "                 AND p.seq < o.seq AND p.state = 'pending')"
+            f" AND {self._mine}"
+            " ORDER BY o.id LIMIT ?",
+            (now, limit),
+        ).fetchall()
+
+    def _record(self, results):
+        with self.store.conn:
+            self.store.conn.executemany(
+                "UPDATE outbox SET state = ?, attempts = ?, next_attempt_at = ?, message_id = ? WHERE id = ?",
+                results,
+            )
+
+    def _next_due_at(self):
+        row = self.store.conn.execute(
+            f"SELECT MIN(next_attempt_at) FROM outbox o WHERE o.state = 'pending' AND {self._mine}"
+        ).fetchone()
+        return row[0]
+
+    # --- LIFECYCLE ---
+
+    async def start(self, bot):
+        await self.store.run(self._init_schema)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Tells the worker new messages were queued."""
+        if self._wake is not None:
+            self._wake.set()
+
+    # --- WORKER ---
+
+    async def _run(self, bot):
+        gateway.LANE.set(gateway.ORDERS)
+        while True:
+            self._wake.clear()
+            try:
+                sent = await self.deliver_due(bot)
+            except Exception:
+                logger.exception("Outbox delivery failed")
+                sent = 0
+            if sent == BATCH_SIZE:
+                continue   # probably more waiting
+            next_at = await self.store.run(self._next_due_at)
+            timeout = POLL_SECONDS if next_at is None else min(POLL_SECONDS, max(0.0, next_at - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def deliver_due(self, bot):
+        """Sends one batch of due messages. Returns how many were picked up."""
+        rows = await self.store.run(self._due, time.time(), BATCH_SIZE)
+        if not rows:
+            return 0
+
+        async def send(row):
+            # Recorded as soon as it is known: a batch can take a minute at channel pacing,
+            # and a crash meanwhile must not re-post what already went out.
+            await self.store.run(self._record, [await self._send(bot, *row)])
+
+        await asyncio.gather(*(send(row) for row in rows))
+        return len(rows)
+
+    async def _send(self, bot, row_id, order_id, payload, attempts):
+        logs.bind(order_id=order_id)   # each send runs in its own task
+        kwargs = json.loads(payload)
+        attempts += 1
+        try:
+            try:
+                msg = await bot.send_message(**kwargs)
+            except BadRequest as e:
+                # Customer names can break Markdown; the plain text is better than nothing.
+                if 'parse entities' not in str(e) or not kwargs.pop('parse_mode', None):
+                    raise
+                msg = await bot.send_message(**kwargs)
+            return (SENT, attempts, 0, msg.message_id, row_id)
+        except RetryAfter as e:
+            return (PENDING, attempts - 1, time.time() + e.retry_after, None, row_id)
+        except (BadRequest, Forbidden) as e:
+            logger.error("Outbox message for %s rejected: %s", order_id, e)
+            return (DEAD, attempts, 0, None, row_id)
+        except Exception as e:
+            if attempts >= MAX_ATTEMPTS:
+                logger.error("Outbox message for %s gave up after %s attempts: %s", order_id, attempts, e)
+                return (DEAD, attempts, 0, None, row_id)
+            logger.warning("Outbox message for %s attempt %s failed: %s", order_id, attempts, e)
+            return (PENDING, attempts, time.time() + backoff(attempts), None, row_id)
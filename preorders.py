@@ -0,0 +1,164 @@
+"""
+Pre-orders.
+
+An order placed while the service or one of its cafés is closed is recorded
+as scheduled, and its channel posts wait here until the first moment
+everything in the cart is open (hours.py). Releasing it moves the order to
+pending and queues the channel posts, plus a note to the customer, in the
+outbox, all in one transaction.
+
+Release times are handed out when an order is scheduled: each pre-order gets
+the later of its opening time and the last slot already taken in the same
+opening (within BURST_SECONDS of it) plus enough time for the channel to
+take that one's posts at the group rate limit. The overnight queue then
+trickles into the channel at opening instead of all landing in the first
+second and being throttled there, and a café opening at 06:00 is not held
+behind orders waiting for one that opens at 10:00.
+
+Each process keeps the release times of its own chats' pre-orders in a
+heap, loaded from the table at start, and sleeps until the earliest is due.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import time
+
+import cluster
+import gateway
+import orders
+import outbox
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS preorders (
+    order_id   TEXT PRIMARY KEY,
+    chat_id    INTEGER NOT NULL,
+    release_at REAL NOT NULL,
+    payload    TEXT NOT NULL,
+    state      TEXT NOT NULL DEFAULT 'waiting',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS preorders_due ON preorders (state, release_at);
+"""
+
+WAITING, RELEASED = 'waiting', 'released'
+BURST_SECONDS = 3600   # waiting slots this soon after an opening are spaced against
+
+
+def spacing(messages):
+    """Seconds the channel needs to take `messages` posts at the group rate limit."""
+    return len(messages) / gateway.GROUP_RATE
+
+
+class PreorderQueue:
+    def __init__(self, store, notifier, shard=None):
+        self.store = store
+        self.notifier = notifier
+        # (index, count): release only this worker's chats' pre-orders (see cluster.py)
+        self._mine = cluster.shard_sql("chat_id", shard)
+        self.heap = []        # (release_at, order_id)
+        self._wake = None
+        self._task = None
+
+    # --- DB THREAD ---
+
+    def _init_schema(self):
+        self.store.conn.executescript(SCHEMA)
+        self.store.conn.commit()
+
+    def _waiting(self):
+        return self.store.conn.execute(
+            f"SELECT release_at, order_id FROM preorders WHERE state = ? AND {self._mine}", (WAITING,)
+        ).fetchall()
+
+    def _schedule(self, order_id, chat_id, items, total, location, opens_at, notifications, now):
+        conn = self.store.conn
+        with conn:
+            last_at, last_payload = conn.execute(
+                "SELECT release_at, payload FROM preorders WHERE state = ? AND release_at >= ? AND release_at < ?"
+                " ORDER BY release_at DESC LIMIT 1",
+                (WAITING, opens_at, opens_at + BURST_SECONDS),
+            ).fetchone() or (None, None)
+            release_at = opens_at
+            if last_at is not None:
+                release_at = last_at + spacing(json.loads(last_payload)['channel'])
+            orders.insert_order(conn, order_id, chat_id, items, total, location, orders.SCHEDULED, now)
+            conn.execute(
+                "INSERT INTO preorders (order_id, chat_id, release_at, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (order_id, chat_id, release_at, json.dumps(notifications, ensure_ascii=False), now),
+            )
+        return release_at
+
+    def _release(self, order_id, now):
+        conn = self.store.conn
+        with conn:
+            row = conn.execute(
+                "SELECT payload FROM preorders WHERE order_id = ? AND state = ?", (order_id, WAITING)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute("UPDATE preorders SET state = ? WHERE order_id = ?", (RELEASED, order_id))
+            orders.update_status(conn, order_id, orders.PENDING, None, now)
+            payload = json.loads(row[0])
+            outbox.append_messages(conn, order_id, payload['channel'] + payload['customer'], now)
+        return True
+
+    # --- LIFECYCLE ---
+
+    async def start(self):
+        await self.store.run(self._init_schema)
+        self.heap = await self.store.run(self._waiting)
+        heapq.heapify(self.heap)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- PUBLIC ---
+
+    async def schedule(self, order_id, chat_id, items, total, location, opens_at, channel, customer):
+        """Records a scheduled order whose `channel` posts (and `customer` notes) go out once it
+        is released, at opens_at or the next free slot after it. Returns the release time."""
+        notifications = {'channel': list(channel), 'customer': list(customer)}
+        release_at = await self.store.run(
+            self._schedule, order_id, chat_id, items, total, location, opens_at, notifications, time.time()
+        )
+        heapq.heappush(self.heap, (release_at, order_id))
+        self._wake.set()
+        return release_at
+
+    # --- WORKER ---
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.time()
+            released = 0
+            while self.heap and self.heap[0][0] <= now:
+                _, order_id = heapq.heappop(self.heap)
+                try:
+                    if await self.store.run(self._release, order_id, now):
+                        logger.info("Pre-order %s released", order_id)
+                        released += 1
+                except Exception:
+                    logger.exception("Releasing pre-order %s failed", order_id)
+                    heapq.heappush(self.heap, (now + 5, order_id))
+                    break
+            if released:
+                self.notifier.wake()
+            # asyncio.timeout rather than wait_for, which can swallow a cancel that lands as the wake does
+            deadline = asyncio.get_running_loop().time() + self.heap[0][0] - time.time() if self.heap else None
+            try:
+                async with asyncio.timeout_at(deadline):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
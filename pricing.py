@@ -0,0 +1,149 @@
+"""
+Cart pricing.
+
+Subtotals are kept on the session as items are added, so reading one is
+O(1). A quote totals its own lines instead, and puts that back on the
+session: the catalog the cart was priced from may be gone (the version
+history is in memory and short), and the lines are then priced from the
+current one. Delivery fees come from the table in config.PRICING_PATH, by zone
+and distance band, and at most one promotion (the one saving the most)
+applies to an order.
+
+Cart items the catalog no longer has (a reload removed them after the
+catalog the cart was priced from aged out) are not priced; the Quote lists
+them in `missing`, and an order is not placed until they leave the cart.
+
+quote() returns an immutable Quote. The customer's summary and the admin
+card are both rendered from the same Quote, so they cannot disagree. Quotes
+are cached per (catalog version, cart, zone, fee band, table version, day).
+"""
+import hashlib
+import json
+import math
+from collections import OrderedDict, namedtuple
+
+import config
+import menus
+import orders
+
+Promotion = namedtuple('Promotion', 'name percent amount free_delivery min_subtotal cafes zones starts ends')
+Line = namedtuple('Line', 'item qty amount')
+Quote = namedtuple('Quote', 'version lines subtotal fee discount promotion total zone missing')
+
+CACHE_SIZE = 4096
+
+
+class PriceTable:
+    def __init__(self, version, default_fee, fees, promotions):
+        self.version = version
+        self.default_fee = default_fee
+        self.fees = fees              # zone name -> [(max_km, fee)], ascending; inf for the last band
+        self.promotions = promotions
+
+    @classmethod
+    def parse(cls, raw):
+        doc = json.loads(raw)
+        fees = {
+            zone: sorted((math.inf if km is None else float(km), int(fee)) for km, fee in bands)
+            for zone, bands in doc.get('zones', {}).items()
+        }
+        promotions = [
+            Promotion(
+                p['name'], p.get('percent', 0), p.get('amount', 0), p.get('free_delivery', False),
+                p.get('min_subtotal', 0), frozenset(p.get('cafes', ())), frozenset(p.get('zones', ())),
+                p.get('starts'), p.get('ends'),
+            )
+            for p in doc.get('promotions', [])
+        ]
+        return cls(hashlib.sha1(raw).hexdigest()[:12], int(doc['default_fee']), fees, promotions)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.parse(f.read())
+
+    def band(self, zone, distance_km):
+        """(band index, fee) for a delivery; (None, default_fee) before the location is known."""
+        bands = self.fees.get(zone)
+        if not bands or distance_km is None:
+            return None, self.default_fee
+        for i, (max_km, fee) in enumerate(bands):
+            if distance_km <= max_km:
+                return i, fee
+        return len(bands) - 1, bands[-1][1]
+
+
+TABLE = PriceTable.load(config.PRICING_PATH)
+
+
+# --- PROMOTIONS ---
+
+def _discount(promo, subtotal, fee, cafes, zone, day):
+    if subtotal < promo.min_subtotal:
+        return 0
+    if promo.cafes and not cafes <= promo.cafes:
+        return 0
+    if promo.zones and zone not in promo.zones:
+        return 0
+    if (promo.starts and day < promo.starts) or (promo.ends and day > promo.ends):
+        return 0
+    off = subtotal * promo.percent // 100 + promo.amount
+    if promo.free_delivery:
+        off += fee
+    return min(off, subtotal + fee)
+
+
+def best_promotion(table, subtotal, fee, cafes, zone, day):
+    """(promotion, discount) saving the most, or (None, 0)."""
+    best, best_off = None, 0
+    for promo in table.promotions:
+        off = _discount(promo, subtotal, fee, cafes, zone, day)
+        if off > best_off:
+            best, best_off = promo, off
+    return best, best_off
+
+
+# --- QUOTES ---
+
+_cache = OrderedDict()
+
+
+def subtotal(data):
+    """The cart subtotal; recomputed only for sessions stored before it was tracked."""
+    if data.subtotal is None:
+        catalog = menus.get(data.catalog_version)
+        data.subtotal = sum(catalog.item(i).price * qty for i, qty in data.cart if catalog.item(i))
+    return data.subtotal
+
+
+def quote(data, match=None, table=None):
+    """The price snapshot for a session's cart; match is the geofence.Match once the location is known."""
+    table = table or TABLE
+    catalog = menus.get(data.catalog_version)
+    zone = match.zone.name if match else None
+    band, fee = table.band(zone, match.distance_km if match else None)
+    day = orders.local_day()
+    cart = tuple(data.cart)
+    key = (catalog.version, cart, zone, band, table.version, day)
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache.move_to_end(key)
+        data.subtotal = cached.subtotal
+        return cached
+
+    lines = tuple(
+        Line(item, qty, item.price * qty)
+        for item, qty in ((catalog.item(i), qty) for i, qty in cart) if item is not None
+    )
+    missing = tuple(i for i, _ in cart if catalog.item(i) is None)
+    sub = sum(line.amount for line in lines)
+    data.subtotal = sub
+    promo, off = best_promotion(table, sub, fee, frozenset(line.item.cafe for line in lines), zone, day)
+    result = Quote(
+        f"{catalog.version}/{table.version}", lines, sub, fee, off,
+        promo.name if promo else None, sub + fee - off, zone, missing,
+    )
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
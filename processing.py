@@ -0,0 +1,101 @@
+"""
+Concurrent update processing with per-chat ordering.
+
+Updates from different chats run concurrently, up to a global cap; updates
+from the same chat run strictly one after another, in arrival order, since
+handlers mutate that chat's session in place. Each chat's lock exists only
+while it has updates in flight and is dropped when the last one finishes.
+
+At most max_pending updates are taken from the queue and not yet finished,
+running or waiting for their chat; the rest wait in the bounded update
+queue (UpdateQueue), so overload is refused at the webhook instead of held
+in memory.
+"""
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+# The base class takes its semaphore before do_process_update. Keeping that
+# one effectively unlimited means an update reaches do_process_update without
+# suspending, so per-chat arrival order is fixed before any waiting happens.
+_UNLIMITED = 2 ** 31 - 1
+
+# Updates taken off the queue but not finished, per update allowed in flight.
+PENDING_PER_SLOT = 4
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_in_flight, max_pending=None):
+        super().__init__(_UNLIMITED)
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending or max_in_flight * PENDING_PER_SLOT
+        self._in_flight = asyncio.BoundedSemaphore(max_in_flight)
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._chats = {}   # chat key -> [lock, updates holding or waiting for it]
+
+    @staticmethod
+    def chat_key(update):
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, 'effective_user', None)
+        return user.id if user is not None else None
+
+    @property
+    def active_chats(self):
+        return len(self._chats)
+
+    async def admit(self):
+        """Waits until fewer than max_pending updates are taken and unfinished (see UpdateQueue)."""
+        await self._pending.acquire()
+
+    async def process_update(self, update, coroutine):
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self._pending.release()
+
+    async def do_process_update(self, update, coroutine):
+        key = self.chat_key(update)
+        if key is None:
+            async with self._in_flight:
+                await coroutine
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._in_flight:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+
+    async def initialize(self):
+        # The stop signal takes a slot that no update gives back.
+        self._pending = asyncio.Semaphore(self.max_pending)
+
+    async def shutdown(self):
+        pass
+
+
+class UpdateQueue(asyncio.Queue):
+    """The Application's update queue, handing out an update only once the processor admits one more.
+
+    PTB's fetcher starts a task for each update as soon as it gets one, so
+    without this it would empty the queue into tasks waiting on the processor.
+    Held here instead, updates fill the bounded queue, and a full queue is
+    what makes the webhook answer 503 and cluster.feed wait.
+    """
+
+    def __init__(self, processor, maxsize=0):
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self):
+        await self.processor.admit()
+        return await super().get()
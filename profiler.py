@@ -0,0 +1,191 @@
+"""
+Sampling profiler for the running bot (admin /profile).
+
+An interval timer (SIGALRM) interrupts the event loop thread every few
+milliseconds and the handler counts where the stack is. Nothing is hooked
+into calls, so the loop runs at full speed between samples; the cost is one
+short stack walk per sample. (A sampling thread would be cheaper still, but
+it only gets the GIL where the loop releases it, in I/O calls, so it would
+see little else.) Meanwhile a task on the loop measures how late its ticks
+fire, and the tasks alive are counted once a second.
+
+Signals are delivered to the main thread, so the loop must run there, as it
+does in bot.main().
+
+The report lists:
+  * hot functions, by samples spent in the function itself and below it;
+  * slow steps: coroutines that held the loop for long stretches without
+    awaiting, named by the innermost coroutine on the stack;
+  * event loop lag and busy share;
+  * task counts, grouped by coroutine.
+"""
+import asyncio
+import inspect
+import os
+import signal
+import threading
+import time
+from collections import Counter
+
+INTERVAL = 0.01
+LAG_TICK = 0.01
+TASK_EVERY = 1.0
+MAX_SECONDS = 300
+TOP = 15
+
+_running = False
+
+
+def _label(code):
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _idle(code):
+    return code.co_name == 'select' and code.co_filename.endswith('selectors.py')
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+class _Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self.spent = 0.0            # seconds spent in the signal handler
+        # Keyed by id(code): hashing a code object hashes its bytecode, every time.
+        self.codes = {}             # id -> code, which also keeps the ids valid
+        self.own = Counter()        # id -> samples with it on top of the stack
+        self.total = Counter()      # id -> samples with it anywhere on the stack
+        self.steps = {}             # id -> [steps, samples, longest]
+        self._step = None           # [Handle._run frame, id of the code it is named by, samples so far]
+        self._previous = None
+        self._handle_run = id(asyncio.events.Handle._run.__code__)
+
+    def start(self):
+        self._previous = signal.signal(signal.SIGALRM, self._on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous)
+        self._end_step()
+
+    def _on_alarm(self, signum, frame):
+        if frame is not None:
+            started = time.perf_counter()
+            self.sample(frame)
+            self.spent += time.perf_counter() - started
+
+    def sample(self, frame):
+        self.samples += 1
+        if _idle(frame.f_code):
+            self.idle += 1
+            self._end_step()
+            return
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        ids = [id(f.f_code) for f in frames]
+        known = self.codes
+        for f, key in zip(frames, ids):
+            if key not in known:
+                known[key] = f.f_code
+        self.own[ids[0]] += 1
+        self.total.update(set(ids))
+
+        # The loop runs each callback from Handle._run; what sits above it is one step.
+        for i in range(len(ids) - 1, 0, -1):
+            if ids[i] == self._handle_run:
+                break
+        else:
+            self._end_step()
+            return
+        handle_frame = frames[i]   # a new frame for every callback the loop runs
+        if self._step is not None and self._step[0] is handle_frame:
+            self._step[2] += 1
+            return
+        self._end_step()
+        coroutine = next((key for f, key in zip(frames[:i], ids) if f.f_code.co_flags & inspect.CO_COROUTINE),
+                         ids[i - 1])
+        self._step = [handle_frame, coroutine, 1]
+
+    def _end_step(self):
+        if self._step is None:
+            return
+        _, key, samples = self._step
+        self._step = None
+        stats = self.steps.setdefault(key, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += samples
+        stats[2] = max(stats[2], samples)
+
+
+class Report:
+    def __init__(self, seconds, interval, sampler, lags, task_counts, tasks_by_coro):
+        self.seconds = seconds
+        self.interval = interval
+        self.sampler = sampler
+        self.lags = lags
+        self.task_counts = task_counts
+        self.tasks_by_coro = tasks_by_coro
+
+    def text(self, top=TOP):
+        s = self.sampler
+        busy = s.samples - s.idle
+        lines = [
+            f"Profile: {self.seconds:.0f}s, {s.samples} samples every {self.interval * 1000:.0f} ms, "
+            f"loop busy {busy / max(1, s.samples):.0%}, sampling cost {s.spent / max(self.seconds, 1e-9):.2%}",
+            f"Loop lag: p50 {_percentile(self.lags, 50) * 1000:.1f} ms, p99 {_percentile(self.lags, 99) * 1000:.1f} ms, "
+            f"max {max(self.lags, default=0) * 1000:.1f} ms",
+        ]
+        if self.task_counts:
+            lines.append(f"Tasks: {self.task_counts[-1]} now, peak {max(self.task_counts)}")
+            lines.extend(f"  {n:6} {name}" for name, n in self.tasks_by_coro.most_common(5))
+
+        lines.append("")
+        lines.append("Hot functions (own% / total%):")
+        for key, n in s.own.most_common(top):
+            lines.append(f"  {n / max(1, busy):6.1%} {s.total[key] / max(1, busy):6.1%}  {_label(s.codes[key])}")
+
+        lines.append("")
+        lines.append("Slow steps (longest / total ms, steps):")
+        slowest = sorted(s.steps.items(), key=lambda kv: -kv[1][2])[:top]
+        for key, (steps, samples, longest) in slowest:
+            lines.append(f"  {longest * self.interval * 1000:6.0f} {samples * self.interval * 1000:8.0f} "
+                         f"{steps:6}  {_label(s.codes[key])}")
+        return "\n".join(lines)
+
+
+async def profile(seconds, interval=INTERVAL, stop=None):
+    """Samples the running event loop for `seconds` (or until the `stop` event is set) and returns a Report."""
+    global _running
+    if _running:
+        raise RuntimeError("a profile is already running")
+    if threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("the event loop is not on the main thread, so it cannot be sampled")
+    _running = True
+    seconds = min(seconds, MAX_SECONDS)
+    sampler = _Sampler(interval)
+    lags, task_counts = [], []
+    tasks_by_coro = Counter()
+    try:
+        sampler.start()
+        started = time.monotonic()
+        next_count = started
+        while (now := time.monotonic()) - started < seconds and not (stop and stop.is_set()):
+            if now >= next_count:
+                tasks = asyncio.all_tasks()
+                task_counts.append(len(tasks))
+                tasks_by_coro = Counter(getattr(t.get_coro(), '__qualname__', '?') for t in tasks)
+                next_count = now + TASK_EVERY
+            expected = time.monotonic() + LAG_TICK
+            await asyncio.sleep(LAG_TICK)
+            lags.append(max(0.0, time.monotonic() - expected))
+    finally:
+        sampler.stop()
+        _running = False
+    return Report(time.monotonic() - started, interval, sampler, lags, task_counts, tasks_by_coro)
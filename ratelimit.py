@@ -0,0 +1,118 @@
+"""
+Token-bucket rate limiting.
+
+Each (action, key) pair owns a bucket of `capacity` tokens refilled at
+capacity / per_seconds tokens per second. A request takes one token; a key
+that runs dry is blocked for `block_seconds`. A bucket is a fixed four
+slots, where the sliding window it replaced kept a timestamp per request,
+so memory per key is bounded whatever the traffic; a check costs about the
+same as before (bench/ratelimit.py).
+
+Buckets live in a backend. MemoryBackend keeps them in an OrderedDict in
+last-touch order, so evicting idle keys only pops from the front. A shared
+backend (e.g. Redis) needs to implement the same take/evict_idle/__len__.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+Limit = namedtuple('Limit', 'capacity per_seconds block_seconds')
+# retry_after is only filled in when notify is set, i.e. when the caller should tell the user.
+Decision = namedtuple('Decision', 'allowed retry_after notify')
+
+ALLOW = Decision(True, 0.0, False)
+DENY = Decision(False, 0.0, False)
+NOTICE_INTERVAL_SECONDS = 5
+
+# Bucket layout: [tokens, updated_at, blocked_until, notified_at]
+_TOKENS, _UPDATED, _BLOCKED, _NOTIFIED = range(4)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, limit, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = [limit.capacity - 1, now, 0.0, 0.0]
+            return ALLOW
+        self._buckets.move_to_end(key)
+
+        if now < bucket[_BLOCKED]:
+            return self._deny(bucket, bucket[_BLOCKED] - now, now)
+
+        capacity = limit.capacity
+        tokens = bucket[_TOKENS] + (now - bucket[_UPDATED]) * capacity / limit.per_seconds
+        bucket[_UPDATED] = now
+        if tokens >= 1:
+            bucket[_TOKENS] = (capacity if tokens > capacity else tokens) - 1
+            return ALLOW
+
+        bucket[_TOKENS] = 0.0
+        bucket[_BLOCKED] = now + limit.block_seconds
+        bucket[_NOTIFIED] = 0.0
+        return self._deny(bucket, limit.block_seconds, now)
+
+    @staticmethod
+    def _deny(bucket, retry_after, now):
+        if now - bucket[_NOTIFIED] < NOTICE_INTERVAL_SECONDS:
+            return DENY
+        bucket[_NOTIFIED] = now
+        return Decision(False, retry_after, True)
+
+    def evict_idle(self, idle_seconds, now):
+        """Drops buckets untouched for idle_seconds. Returns how many were dropped."""
+        buckets = self._buckets
+        cutoff = now - idle_seconds
+        dropped = 0
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if bucket[_UPDATED] > cutoff or bucket[_BLOCKED] > now:
+                break
+            buckets.popitem(last=False)
+            dropped += 1
+        return dropped
+
+
+class RateLimiter:
+    def __init__(self, limits, backend=None, sweep_interval=60.0):
+        self.limits = limits                    # action -> Limit
+        self.backend = backend or MemoryBackend()
+        self.sweep_interval = sweep_interval
+        # A bucket idle this long is full again and not blocked, so dropping it loses nothing.
+        self.idle_seconds = max(l.per_seconds + l.block_seconds for l in limits.values())
+        self._task = None
+
+    def check(self, action, key, now=None):
+        if now is None:
+            now = time.monotonic()
+        return self.backend.take((action, key), self.limits[action], now)
+
+    def evict_idle(self, now=None):
+        return self.backend.evict_idle(self.idle_seconds, time.monotonic() if now is None else now)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            dropped = self.evict_idle()
+            if dropped:
+                logger.info("Rate limiter evicted %s idle keys, %s left", dropped, len(self.backend))
@@ -0,0 +1,208 @@
+"""
+Pre-rendered keyboards and menu headers.
+
+Menus depend only on (cafe, language), so each keyboard is built once and
+kept as the JSON string Telegram expects. python-telegram-bot sends a str
+reply_markup as-is, which skips to_dict() and json.dumps() on every message.
+The cache is dropped when a new menu catalog is swapped in or invalidate()
+is called.
+
+Inline menu pages change with the cart, so only their page layout is cached;
+the keyboard JSON is assembled from plain dicts on each tap.
+"""
+import json
+
+from telegram import (
+    InlineQueryResultArticle, InputTextMessageContent, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+)
+
+import languages
+import menus
+import router
+
+PAGE_SIZE = 8
+
+_cache = {}
+_catalog = None
+
+
+def invalidate():
+    global _catalog
+    _cache.clear()
+    _catalog = None
+
+
+def _cached(key, build):
+    global _catalog
+    catalog = menus.current()
+    if _catalog is not catalog:
+        _cache.clear()
+        _catalog = catalog
+    value = _cache.get(key)
+    if value is None:
+        value = _cache[key] = build()
+    return value
+
+
+def serialize(markup):
+    return json.dumps(markup.to_dict(), ensure_ascii=False, separators=(',', ':'))
+
+
+def item_label(item):
+    return f"{menus.display_name(item)} — {item.price} ETB"
+
+
+def section_label(section):
+    return f"------ {section} ------"
+
+
+# --- KEYBOARDS ---
+
+def main_menu(lang):
+    """(text, reply_markup) for the café picker."""
+    def build():
+        rows = [[c] for c in menus.current().cafes]
+        rows.append([languages.get_text(lang, 'btn_profile')])
+        return languages.get_text(lang, 'choose_cafe'), serialize(ReplyKeyboardMarkup(rows, resize_keyboard=True))
+    return _cached(('main', lang), build)
+
+
+def cafe_menu(cafe, lang):
+    """(header, reply_markup) for one café's item list."""
+    def build():
+        rows = []
+        section = None
+        for item in menus.current().cafes[cafe]:
+            if item.section and item.section != section:
+                rows.append([section_label(item.section)])
+            section = item.section
+            rows.append([item_label(item)])
+        rows += [
+            [languages.get_text(lang, 'btn_done')],
+            [languages.get_text(lang, 'btn_cancel')],
+            [languages.get_text(lang, 'btn_back')],
+        ]
+        header = languages.get_text(lang, 'menu_header').format(cafe)
+        return header, serialize(ReplyKeyboardMarkup(rows, resize_keyboard=True))
+    return _cached(('cafe', cafe, lang), build)
+
+
+def location_keyboard(lang):
+    def build():
+        return serialize(ReplyKeyboardMarkup(
+            [[KeyboardButton(languages.get_text(lang, 'btn_location'), request_location=True)],
+             [languages.get_text(lang, 'btn_cancel'), languages.get_text(lang, 'btn_back')]],
+            resize_keyboard=True, one_time_keyboard=False
+        ))
+    return _cached(('location', lang), build)
+
+
+def phone_keyboard(lang):
+    def build():
+        return serialize(ReplyKeyboardMarkup(
+            [[KeyboardButton(languages.get_text(lang, 'btn_phone'), request_contact=True)]],
+            resize_keyboard=True, one_time_keyboard=False
+        ))
+    return _cached(('phone', lang), build)
+
+
+def profile_keyboard(lang):
+    def build():
+        return serialize(ReplyKeyboardMarkup([
+            [languages.get_text(lang, 'btn_switch_lang'), languages.get_text(lang, 'btn_edit_phone')],
+            [languages.get_text(lang, 'btn_back')]
+        ], resize_keyboard=True))
+    return _cached(('profile', lang), build)
+
+
+def remove_keyboard():
+    return _cached(('remove',), lambda: serialize(ReplyKeyboardRemove()))
+
+
+def language_keyboard():
+    def build():
+        return serialize(ReplyKeyboardMarkup([['🇺🇸 English', '🇪🇹 አማርኛ']], resize_keyboard=True, one_time_keyboard=True))
+    return _cached(('language',), build)
+
+
+# --- INLINE RESULTS ---
+
+def inline_result(item):
+    """Search result for an item; picking it sends the item's button label."""
+    def build():
+        return InlineQueryResultArticle(
+            id=str(item.id),
+            title=menus.display_name(item),
+            description=f"{item.cafe} · {item.price} ETB",
+            input_message_content=InputTextMessageContent(item_label(item)),
+        )
+    return _cached(('inline', item.id), build)
+
+
+# --- INLINE MENUS ---
+
+def _button(text, op, *args):
+    return {'text': text, 'callback_data': router.menu_data(op, *args)}
+
+
+def _inline(rows):
+    return json.dumps({'inline_keyboard': rows}, ensure_ascii=False, separators=(',', ':'))
+
+
+def cafe_at(index):
+    """The café at a position in the current catalog, or None."""
+    cafes = _cached(('cafe_list',), lambda: tuple(menus.current().cafes))
+    return cafes[index] if 0 <= index < len(cafes) else None
+
+
+def cafe_index(cafe):
+    return _cached(('cafe_index', cafe), lambda: list(menus.current().cafes).index(cafe))
+
+
+def cafe_pages(cafe):
+    """[(section, items)] pages of up to PAGE_SIZE items; a page never spans two sections."""
+    def build():
+        pages = []
+        for item in menus.current().cafes[cafe]:
+            if not pages or pages[-1][0] != item.section or len(pages[-1][1]) == PAGE_SIZE:
+                pages.append((item.section, []))
+            pages[-1][1].append(item)
+        return tuple((section, tuple(items)) for section, items in pages)
+    return _cached(('pages', cafe), build)
+
+
+def inline_cafes(lang):
+    """(text, reply_markup) for the inline café picker."""
+    def build():
+        rows = [[_button(c, router.MenuOp.PAGE, i, 0)] for i, c in enumerate(menus.current().cafes)]
+        return languages.get_text(lang, 'choose_cafe'), _inline(rows)
+    return _cached(('inline_main', lang), build)
+
+
+def inline_cafe_page(cafe, page, lang, quantities, subtotal):
+    """(text, reply_markup) for one page of a café, showing quantities already in the cart."""
+    pages = cafe_pages(cafe)
+    page %= len(pages)
+    section, items = pages[page]
+    rows = []
+    for item in items:
+        qty = quantities.get(item.id)
+        if qty:
+            rows.append([_button(f"{qty} × {item_label(item)}", router.MenuOp.ADD, item.id, page),
+                         _button("➖", router.MenuOp.REMOVE, item.id, page)])
+        else:
+            rows.append([_button(item_label(item), router.MenuOp.ADD, item.id, page)])
+    if len(pages) > 1:
+        rows.append([
+            _button("«", router.MenuOp.PAGE, cafe_index(cafe), page - 1),
+            _button(f"{page + 1}/{len(pages)}", router.MenuOp.NOOP),
+            _button("»", router.MenuOp.PAGE, cafe_index(cafe), (page + 1) % len(pages)),
+        ])
+    done = languages.get_text(lang, 'btn_done')
+    rows.append([_button(f"{done} · {subtotal} ETB" if subtotal else done, router.MenuOp.DONE)])
+    rows.append([_button(languages.get_text(lang, 'btn_cancel'), router.MenuOp.CANCEL),
+                 _button(languages.get_text(lang, 'btn_back'), router.MenuOp.HOME)])
+    text = languages.get_text(lang, 'menu_header').format(cafe)
+    if section:
+        text += "\n" + section_label(section)
+    return text, _inline(rows)
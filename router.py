@@ -0,0 +1,147 @@
+"""
+Button-text routing and the order-flow state machine.
+
+Every label the bot can show (each button in each language, each café name
+and each rendered "item — price ETB" row) is mapped to a Route in one dict,
+so handle_text resolves a message with a single lookup. ALLOWED declares
+which actions each conversation state accepts.
+
+Inline menu buttons carry compact callback_data ("m" + op + dot-separated
+ints, e.g. "m+42.3"), well inside Telegram's 64-byte limit.
+"""
+import enum
+from collections import namedtuple
+
+import languages
+import menus
+import render
+import storage
+
+
+class Action(enum.Enum):
+    LANGUAGE = 'language'        # arg: lang code
+    BACK = 'back'
+    PROFILE = 'profile'
+    SWITCH_LANG = 'switch_lang'
+    EDIT_PHONE = 'edit_phone'
+    CANCEL = 'cancel'
+    DONE = 'done'
+    CAFE = 'cafe'                # arg: cafe name
+    ITEM = 'item'                # arg: {cafe: item_id} for every café that renders this label
+
+
+class State(enum.Enum):
+    LANGUAGE = 'language'        # no language chosen yet
+    PHONE = 'phone'              # no phone number yet
+    CAFE = 'cafe'                # picking a café
+    CART = 'cart'                # adding items from the current café
+    LOCATION = 'location'        # cart done, waiting for a location pin
+
+
+class MenuOp(enum.Enum):
+    PAGE = 'c'                   # args: café index, page
+    ADD = '+'                    # args: item id, page
+    REMOVE = '-'                 # args: item id, page
+    DONE = 'd'
+    CANCEL = 'x'
+    HOME = 'h'
+    NOOP = 'n'
+
+
+Route = namedtuple('Route', 'action arg')
+
+LANGUAGE_BUTTONS = {'🇺🇸 English': 'en', '🇪🇹 አማርኛ': 'am'}
+
+BUTTON_KEYS = {
+    'btn_back': Action.BACK,
+    'btn_profile': Action.PROFILE,
+    'btn_switch_lang': Action.SWITCH_LANG,
+    'btn_edit_phone': Action.EDIT_PHONE,
+    'btn_cancel': Action.CANCEL,
+    'btn_done': Action.DONE,
+}
+
+_NAVIGATION = {Action.BACK, Action.PROFILE, Action.SWITCH_LANG, Action.EDIT_PHONE, Action.CANCEL}
+
+ALLOWED = {
+    State.LANGUAGE: {Action.LANGUAGE},
+    State.PHONE: {Action.LANGUAGE},
+    State.CAFE: _NAVIGATION | {Action.LANGUAGE, Action.CAFE, Action.ITEM},   # ITEM: picked from inline search
+    State.CART: _NAVIGATION | {Action.LANGUAGE, Action.DONE, Action.ITEM},
+    State.LOCATION: _NAVIGATION | {Action.LANGUAGE, Action.DONE, Action.ITEM},
+}
+
+
+_STAGES = {
+    storage.Stage.CAFE: State.CAFE,
+    storage.Stage.CART: State.CART,
+    storage.Stage.LOCATION: State.LOCATION,
+}
+
+
+def state_of(data):
+    if not data.lang:
+        return State.LANGUAGE
+    if not data.phone:
+        return State.PHONE
+    return _STAGES[data.stage]
+
+
+# --- ROUTING TABLE ---
+
+_table = {}
+_catalog = None
+
+
+def build_table():
+    table = {}
+    catalog = menus.current()
+    # Item rows first so that a button or café label always wins a collision.
+    for cafe, items in catalog.cafes.items():
+        for item in items:
+            route = table.setdefault(render.item_label(item), Route(Action.ITEM, {}))
+            route.arg[cafe] = item.id
+    for cafe in catalog.cafes:
+        table[cafe] = Route(Action.CAFE, cafe)
+    for texts in languages.TEXTS.values():
+        for key, action in BUTTON_KEYS.items():
+            if key in texts:
+                table[texts[key]] = Route(action, None)
+    for label, lang in LANGUAGE_BUTTONS.items():
+        table[label] = Route(Action.LANGUAGE, lang)
+    return table
+
+
+def route(text):
+    """The Route for a message text, or None if it is not a label the bot shows."""
+    global _table, _catalog
+    catalog = menus.current()
+    if _catalog is not catalog:
+        _table, _catalog = build_table(), catalog
+    return _table.get(text)
+
+
+# --- CALLBACK DATA ---
+
+MENU_PREFIX = 'm'
+MENU_PATTERN = r'^m[c+\-dxhn]'
+_MENU_OPS = {op.value: op for op in MenuOp}
+_MENU_ARITY = {MenuOp.PAGE: 2, MenuOp.ADD: 2, MenuOp.REMOVE: 2}
+
+
+def menu_data(op, *args):
+    data = MENU_PREFIX + op.value + '.'.join(str(a) for a in args)
+    assert len(data.encode()) <= 64, data
+    return data
+
+
+def parse_menu_data(data):
+    """(MenuOp, [int args]) for an inline menu button, or None if malformed."""
+    op = _MENU_OPS.get(data[1:2]) if data.startswith(MENU_PREFIX) else None
+    if op is None:
+        return None
+    try:
+        args = [int(a) for a in data[2:].split('.')] if data[2:] else []
+    except ValueError:
+        return None
+    return (op, args) if len(args) == _MENU_ARITY.get(op, 0) else None
@@ -0,0 +1,152 @@
+"""
+Menu search for inline queries.
+
+Every word of an item's name, size, section and café goes into a prefix trie
+and a trigram index, built once per catalog version. A query matches an item
+when each of its words matches one of the item's words, either as a prefix or
+fuzzily by shared trigrams, which catches the spellings in the data
+("vegtable", "sanwich", "rap"). Results are cached per query string, so the
+prefixes a customer types on the way to a word are each computed once.
+"""
+import re
+from collections import Counter, OrderedDict
+
+import menus
+
+LIMIT = 20
+CACHE_SIZE = 2048
+MIN_FUZZY_LEN = 3
+FUZZY_THRESHOLD = 0.5
+
+# Weight of a word by where it appears in the item.
+NAME, SIZE, SECTION, CAFE = 1.0, 0.6, 0.5, 0.4
+FUZZY_PENALTY = 0.8
+
+_WORD = re.compile(r"[^\W_]+")
+_WORDS = ''   # trie node key holding every word under that prefix
+
+
+def tokens(text):
+    return _WORD.findall(text.lower())
+
+
+def trigrams(word, end=True):
+    padded = f"${word}$" if end else f"${word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.order = {item_id: n for n, item_id in enumerate(catalog.items)}
+        self.postings = {}    # word -> {item_id: weight}
+        for item in catalog.items.values():
+            fields = ((item.name, NAME), (item.size, SIZE), (item.section, SECTION), (item.cafe, CAFE))
+            for text, weight in fields:
+                for word in tokens(text or ''):
+                    posting = self.postings.setdefault(word, {})
+                    posting[item.id] = max(posting.get(item.id, 0), weight)
+
+        self.trie = {}
+        for word in self.postings:
+            node = self.trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+                node.setdefault(_WORDS, []).append(word)
+
+        self.grams = {}       # trigram -> [word]
+        self.gram_counts = {}
+        for word in self.postings:
+            grams = trigrams(word)
+            self.gram_counts[word] = len(grams)
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(word)
+
+    def prefixed(self, prefix):
+        node = self.trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return ()
+        return node[_WORDS]
+
+    def similar(self, token, partial):
+        """{word: score} for words sharing enough trigrams with token."""
+        if len(token) < MIN_FUZZY_LEN:
+            return {}
+        complete = trigrams(token)
+        shared = Counter(word for gram in complete for word in self.grams.get(gram, ()))
+        scores = {}
+        for word, n in shared.items():
+            score = 2 * n / (len(complete) + self.gram_counts[word])
+            if score >= FUZZY_THRESHOLD:
+                scores[word] = score
+        if partial:
+            # A half-typed word is judged only on the trigrams typed so far.
+            head = trigrams(token, end=False)
+            for word, n in Counter(w for gram in head for w in self.grams.get(gram, ())).items():
+                score = n / len(head)
+                if score >= FUZZY_THRESHOLD and score > scores.get(word, 0):
+                    scores[word] = score
+        return scores
+
+    def _token_scores(self, token, partial):
+        """{item_id: best score} for one query word."""
+        scores = {}
+        for word in self.prefixed(token):
+            for item_id, weight in self.postings[word].items():
+                if weight > scores.get(item_id, 0):
+                    scores[item_id] = weight
+        for word, similarity in self.similar(token, partial).items():
+            for item_id, weight in self.postings[word].items():
+                score = weight * similarity * FUZZY_PENALTY
+                if score > scores.get(item_id, 0):
+                    scores[item_id] = score
+        return scores
+
+    def search(self, query, limit=LIMIT):
+        words = tokens(query)
+        if not words:
+            return []
+        # The last word is still being typed unless the query ends in a space.
+        partial = not query[-1:].isspace()
+        totals = None
+        for n, token in enumerate(words):
+            scores = self._token_scores(token, partial and n == len(words) - 1)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {item_id: totals[item_id] + s for item_id, s in scores.items() if item_id in totals}
+            if not totals:
+                return []
+        ranked = sorted(totals, key=lambda item_id: (-totals[item_id], self.order[item_id]))
+        return [self.catalog.items[item_id] for item_id in ranked[:limit]]
+
+
+# --- CURRENT INDEX ---
+
+_index = None
+_cache = OrderedDict()
+
+
+def index():
+    global _index
+    catalog = menus.current()
+    if _index is None or _index.catalog is not catalog:
+        _index = SearchIndex(catalog)
+        _cache.clear()
+    return _index
+
+
+def search(query, limit=LIMIT):
+    """Items matching query in the current catalog, best first."""
+    idx = index()
+    key = (' '.join(tokens(query)) + (' ' if query[-1:].isspace() else ''), limit)
+    hit = _cache.get(key)
+    if hit is not None:
+        _cache.move_to_end(key)
+        return hit
+    result = _cache[key] = idx.search(key[0], limit)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
@@ -0,0 +1,117 @@
+"""
+Settings shared by every bot process, such as the service mode.
+
+A backend stores JSON values by key. MemoryBackend keeps them in the
+process, which is all a single process needs. SQLiteBackend keeps them in a
+table of the session database, which every worker opens (WAL mode allows
+several processes on one host). Anything else offering async get_all() and
+set() plugs in the same way.
+
+SharedState caches the values so reads are plain dict lookups, writes
+through on set(), and re-reads the backend every refresh_interval so a
+change made by another process lands within that time.
+"""
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.values = {}
+
+    async def start(self):
+        pass
+
+    async def get_all(self):
+        return dict(self.values)
+
+    async def set(self, key, value):
+        self.values[key] = value
+
+
+class SQLiteBackend:
+    def __init__(self, store):
+        self.store = store
+
+    # --- DB THREAD ---
+
+    def _init_schema(self):
+        self.store.conn.executescript(SCHEMA)
+        self.store.conn.commit()
+
+    def _read(self):
+        return self.store.conn.execute("SELECT key, value FROM shared_state").fetchall()
+
+    def _write(self, key, raw):
+        with self.store.conn:
+            self.store.conn.execute(
+                "INSERT INTO shared_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, raw),
+            )
+
+    # --- API ---
+
+    async def start(self):
+        await self.store.run(self._init_schema)
+
+    async def get_all(self):
+        return {key: json.loads(raw) for key, raw in await self.store.run(self._read)}
+
+    async def set(self, key, value):
+        await self.store.run(self._write, key, json.dumps(value))
+
+
+class SharedState:
+    def __init__(self, backend, refresh_interval=1.0, on_change=None):
+        self.backend = backend
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change   # called with (key, value) when another process changed it
+        self.values = {}
+        self._task = None
+
+    async def start(self):
+        await self.backend.start()
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Shared state refresh failed")
+
+    async def refresh(self):
+        for key, value in (await self.backend.get_all()).items():
+            if self.values.get(key) != value:
+                self.values[key] = value
+                if self.on_change:
+                    self.on_change(key, value)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    async def set(self, key, value):
+        await self.backend.set(key, value)
+        self.values[key] = value
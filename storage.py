@@ -0,0 +1,449 @@
+"""
+Durable session storage.
+
+Sessions live in SQLite (WAL mode) and are cached in memory as slotted
+Session objects. Handlers read and mutate the cached sessions directly;
+changed chat_ids are marked dirty and written back in batches by a
+background task, so no handler waits on disk. All SQLite work runs on a
+single worker thread owned by the store.
+
+The cache is an LRU tier: sessions idle for longer than idle_ttl, or the
+least recently used ones beyond max_resident, are dropped after they are
+flushed, and load() pages them back in on the chat's next message.
+
+On a clean stop the resident sessions and usernames are also written to a
+snapshot file (marshal of plain tuples), which the next start() reads in
+one go, so the chats that were active before a restart do not each wait on
+SQLite for their first message. The snapshot is deleted once read: SQLite
+stays the source of truth, and a snapshot is only trusted right after the
+clean stop that wrote it.
+"""
+import asyncio
+import enum
+import json
+import logging
+import marshal
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id INTEGER PRIMARY KEY,
+    data    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usernames (
+    username TEXT PRIMARY KEY,
+    chat_id  INTEGER NOT NULL
+);
+"""
+
+
+class Stage(enum.IntEnum):
+    CAFE = 0        # picking a café
+    CART = 1        # adding items from current_cafe
+    LOCATION = 2    # cart done, waiting for a location pin
+
+
+Location = namedtuple('Location', 'lat lon zone distance_km')
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+class Session:
+    """One chat's conversation state.
+
+    The cart is a flat array of (item_id, qty) pairs, or None while empty;
+    subtotal follows it as items are added (None if not known yet).
+    Language, café and catalog version strings are interned, so every session
+    shares the same few objects.
+    """
+    __slots__ = ('lang', 'phone', 'current_cafe', 'stage', 'catalog_version', 'location', '_cart', 'subtotal', 'touched')
+
+    def __init__(self):
+        self.lang = None
+        self.phone = None
+        self.current_cafe = None
+        self.stage = Stage.CAFE
+        self.catalog_version = None
+        self.location = None
+        self._cart = None
+        self.subtotal = 0
+        self.touched = 0.0
+
+    @property
+    def cart(self):
+        """[(item_id, qty)] in the order items were first added."""
+        if self._cart is None:
+            return []
+        return list(zip(self._cart[::2], self._cart[1::2]))
+
+    def add_item(self, item_id, price):
+        """Adds one of item_id to the cart and returns its new quantity."""
+        if self._cart is None:
+            self._cart = array('I')
+        if self.subtotal is not None:
+            self.subtotal += price
+        cart = self._cart
+        for i in range(0, len(cart), 2):
+            if cart[i] == item_id:
+                cart[i + 1] += 1
+                return cart[i + 1]
+        cart.extend((item_id, 1))
+        return 1
+
+    def remove_item(self, item_id, price):
+        """Takes one of item_id out of the cart and returns its new quantity."""
+        cart = self._cart
+        for i in range(0, len(cart or ()), 2):
+            if cart[i] == item_id:
+                if self.subtotal is not None:
+                    self.subtotal -= price
+                if cart[i + 1] > 1:
+                    cart[i + 1] -= 1
+                    return cart[i + 1]
+                del cart[i:i + 2]
+                if not cart:
+                    self.clear_cart()
+                return 0
+        return 0
+
+    def drop_item(self, item_id):
+        """Takes every one of item_id out of the cart; the subtotal is then unknown until requoted."""
+        cart = self._cart
+        for i in range(0, len(cart or ()), 2):
+            if cart[i] == item_id:
+                del cart[i:i + 2]
+                self.subtotal = None
+                if not cart:
+                    self.clear_cart()
+                return
+
+    def clear_cart(self):
+        self._cart = None
+        self.subtotal = 0
+        self.catalog_version = None
+
+
+def new_session():
+    return Session()
+
+
+def session_state(data):
+    """The session as a tuple of plain values, for the snapshot."""
+    return (
+        data.lang, data.phone, data.current_cafe, int(data.stage), data.catalog_version,
+        tuple(data.location) if data.location else None,
+        data._cart.tobytes() if data._cart else None, data.subtotal,
+    )
+
+
+def session_from_state(state):
+    lang, phone, current_cafe, stage, catalog_version, location, cart, subtotal = state
+    data = Session()
+    data.lang = _intern(lang)
+    data.phone = phone
+    data.current_cafe = _intern(current_cafe)
+    data.stage = Stage(stage)
+    data.catalog_version = _intern(catalog_version)
+    data.location = Location(*location) if location else None
+    if cart:
+        data._cart = array('I')
+        data._cart.frombytes(cart)
+    data.subtotal = subtotal
+    return data
+
+
+def encode_session(data):
+    doc = {
+        'lang': data.lang, 'phone': data.phone, 'orders': [list(pair) for pair in data.cart],
+        'catalog_version': data.catalog_version, 'subtotal': data.subtotal, 'current_cafe': data.current_cafe,
+        'stage': int(data.stage), 'location': data.location._asdict() if data.location else None,
+    }
+    return json.dumps(doc, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_session(raw):
+    doc = json.loads(raw)
+    data = Session()
+    data.lang = _intern(doc.get('lang'))
+    data.phone = doc.get('phone')
+    data.current_cafe = _intern(doc.get('current_cafe'))
+    data.catalog_version = _intern(doc.get('catalog_version'))
+    # Carts saved before item ids existed were [cafe, item, qty]; those are dropped.
+    pairs = [entry for entry in doc.get('orders', []) if len(entry) == 2]
+    if pairs:
+        data._cart = array('I', [n for pair in pairs for n in pair])
+        data.subtotal = doc.get('subtotal')
+    if 'stage' in doc:
+        data.stage = Stage(doc['stage'])
+    elif data.current_cafe:
+        # Written before stages existed.
+        data.stage = Stage.LOCATION if doc.get('awaiting_location') else Stage.CART
+    if data.stage is not Stage.CAFE and not data.current_cafe:
+        data.stage = Stage.CAFE
+    location = doc.get('location')
+    if location:
+        data.location = Location(location['lat'], location['lon'], location.get('zone'), location.get('distance_km'))
+    return data
+
+
+SNAPSHOT_VERSION = 1
+
+
+class SessionStore:
+    def __init__(self, path, flush_interval=2.0, idle_ttl=1800.0, max_resident=100_000, min_idle=300.0,
+                 snapshot_path=None):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.max_resident = max_resident
+        self.min_idle = min_idle   # never page out a session touched more recently than this
+        self.cache = OrderedDict()  # chat_id -> Session, least recently touched first
+        self._missing = set()    # chat_ids known to have no stored session
+        self._dirty = set()
+        self._dirty_usernames = {}
+        self._usernames = OrderedDict()
+        self._conn = None
+        self._executor = None
+        self._task = None
+        self._restoring = None
+
+    # --- DB THREAD ---
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._conn = conn
+
+    def _read(self, chat_id):
+        row = self._conn.execute("SELECT data FROM sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def _read_username(self, username):
+        row = self._conn.execute("SELECT chat_id FROM usernames WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, sessions, usernames):
+        with self._conn:
+            if sessions:
+                self._conn.executemany(
+                    "INSERT INTO sessions (chat_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data",
+                    sessions,
+                )
+            if usernames:
+                self._conn.executemany(
+                    "INSERT INTO usernames (username, chat_id) VALUES (?, ?) "
+                    "ON CONFLICT(username) DO UPDATE SET chat_id = excluded.chat_id",
+                    usernames,
+                )
+
+    def _read_all_langs(self):
+        rows = self._conn.execute("SELECT chat_id, json_extract(data, '$.lang') FROM sessions").fetchall()
+        return [(chat_id, lang or 'en') for chat_id, lang in rows]
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the store's DB thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    @property
+    def conn(self):
+        """The SQLite connection. Only touch it from inside `run()`."""
+        return self._conn
+
+    # --- LIFECYCLE ---
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+        await self.run(self._open)
+        if self.snapshot_path:
+            # In the background: handlers can already load sessions from SQLite meanwhile.
+            self._restoring = asyncio.create_task(self._restore())
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._restoring:
+            try:
+                await self._restoring
+            except Exception:
+                logger.exception("Session snapshot restore failed")
+            self._restoring = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self.snapshot_path:
+            # Only after a successful flush, so the snapshot never holds writes SQLite lacks.
+            await asyncio.to_thread(self._write_snapshot, self._snapshot())
+        await self.run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Session flush failed")
+                continue
+            self.evict_idle()
+
+    async def flush(self):
+        if not self._dirty and not self._dirty_usernames:
+            return
+        dirty, self._dirty = self._dirty, set()
+        usernames, self._dirty_usernames = self._dirty_usernames, {}
+        # Serialize on the loop thread so the DB thread never sees a dict mid-mutation.
+        rows = [(cid, encode_session(self.cache[cid])) for cid in dirty if cid in self.cache]
+        try:
+            await self.run(self._write, rows, list(usernames.items()))
+        except Exception:
+            self._dirty |= dirty
+            for name, cid in usernames.items():
+                self._dirty_usernames.setdefault(name, cid)
+            raise
+
+    # --- SNAPSHOT ---
+
+    def _write_snapshot(self, blob):
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, self.snapshot_path)
+
+    def _read_snapshot(self):
+        """[(chat_id, Session)], [(username, chat_id)] from the snapshot, which is then removed.
+
+        Runs on a worker thread: it touches no shared state, only the file.
+        """
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return [], []
+        os.remove(self.snapshot_path)
+        try:
+            version, path, sessions, usernames = marshal.loads(blob)
+        except (EOFError, ValueError, TypeError):
+            logger.warning("Ignoring unreadable session snapshot")
+            return [], []
+        if version != SNAPSHOT_VERSION or path != os.path.abspath(self.path):
+            return [], []
+        return [(chat_id, session_from_state(state)) for chat_id, state in sessions], usernames
+
+    async def _restore(self):
+        sessions, usernames = await asyncio.to_thread(self._read_snapshot)
+        now = time.monotonic()
+        restored = 0
+        for chat_id, data in sessions:
+            # Anything load() or create() put in the cache meanwhile is as new or newer.
+            if chat_id not in self.cache:
+                data.touched = now
+                self.cache[chat_id] = data
+                restored += 1
+        for username, chat_id in usernames:
+            self._usernames.setdefault(username, chat_id)
+        if restored:
+            logger.info("Restored %s sessions from the snapshot", restored)
+
+    def _snapshot(self):
+        return marshal.dumps((
+            SNAPSHOT_VERSION, os.path.abspath(self.path),
+            [(chat_id, session_state(data)) for chat_id, data in self.cache.items()],
+            list(self._usernames.items()),
+        ))
+
+    # --- SESSIONS ---
+
+    def _touch(self, chat_id, data):
+        data.touched = time.monotonic()
+        self.cache.move_to_end(chat_id)
+        return data
+
+    async def load(self, chat_id):
+        """Returns the cached session for chat_id, reading it from disk on first touch."""
+        data = self.cache.get(chat_id)
+        if data is not None:
+            return self._touch(chat_id, data)
+        if chat_id in self._missing:
+            return None
+        raw = await self.run(self._read, chat_id)
+        # Another handler may have created the session while we were reading.
+        if chat_id in self.cache:
+            return self._touch(chat_id, self.cache[chat_id])
+        if raw is None:
+            if len(self._missing) >= self.max_resident:
+                self._missing.clear()
+            self._missing.add(chat_id)
+            return None
+        data = self.cache[chat_id] = decode_session(raw)
+        return self._touch(chat_id, data)
+
+    def create(self, chat_id):
+        data = self.cache[chat_id] = new_session()
+        self._missing.discard(chat_id)
+        self._dirty.add(chat_id)
+        return self._touch(chat_id, data)
+
+    def evict_idle(self, now=None):
+        """Drops clean sessions that are past idle_ttl or beyond max_resident. Returns how many."""
+        now = time.monotonic() if now is None else now
+        excess = len(self.cache) - self.max_resident
+        victims = []
+        for chat_id, data in self.cache.items():
+            idle = now - data.touched
+            if idle < self.min_idle or (idle < self.idle_ttl and len(victims) >= excess):
+                break
+            if chat_id not in self._dirty:
+                victims.append(chat_id)
+        for chat_id in victims:
+            del self.cache[chat_id]
+        return len(victims)
+
+    def mark_dirty(self, chat_id):
+        if chat_id in self.cache:
+            self._dirty.add(chat_id)
+
+    async def all_langs(self):
+        """(chat_id, lang) for every stored session, including ones not yet flushed."""
+        await self.flush()
+        return await self.run(self._read_all_langs)
+
+    # --- USERNAMES ---
+
+    def _remember_username(self, username, chat_id):
+        self._usernames[username] = chat_id
+        self._usernames.move_to_end(username)
+        if len(self._usernames) > self.max_resident:
+            self._usernames.popitem(last=False)
+
+    def set_username(self, username, chat_id):
+        if self._usernames.get(username) != chat_id:
+            self._dirty_usernames[username] = chat_id
+        self._remember_username(username, chat_id)
+
+    async def lookup_username(self, username):
+        chat_id = self._usernames.get(username)
+        if chat_id is None:
+            chat_id = await self.run(self._read_username, username)
+            if chat_id is not None:
+                self._remember_username(username, chat_id)
+        return chat_id
@@ -0,0 +1,12 @@
+"""
+Puts the repo and bench/ (for fakes, the stand-in Telegram API) on sys.path.
+
+The tests are plain functions that run their own event loop with
+asyncio.run(), so nothing beyond pytest is needed.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+sys.path.insert(0, ROOT)
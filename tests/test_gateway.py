@@ -0,0 +1,148 @@
+"""The outbound gateway (gateway.py) in front of the stand-in Telegram API."""
+import asyncio
+import json
+import time
+
+import pytest
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, TimedOut
+
+import fakes
+import gateway
+
+CHAT = 1001
+
+
+class FloodedAPI(fakes.FakeTelegramAPI):
+    """Answers the first `floods` sendMessage calls with 429 and retry_after."""
+
+    def __init__(self, floods, retry_after=0.01):
+        super().__init__()
+        self.floods = floods
+        self.retry_after = retry_after
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        if self.floods and url.endswith("/sendMessage"):
+            self.floods -= 1
+            self.calls.append((url.rsplit("/", 1)[-1], request_data.parameters))
+            return 429, json.dumps({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                    "parameters": {"retry_after": self.retry_after}}).encode()
+        return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+class TimingOutAPI(fakes.FakeTelegramAPI):
+    """Times out every call, as if the reply never came back."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        if url.endswith("/getMe"):
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        self.calls.append((url.rsplit("/", 1)[-1], request_data.parameters))
+        raise TimedOut()
+
+
+@pytest.fixture(autouse=True)
+def quick_limits(monkeypatch):
+    """Limits scaled up so paced sends finish in a fraction of a second."""
+    monkeypatch.setattr(gateway, "PRIVATE_RATE", 20.0)
+    monkeypatch.setattr(gateway, "GROUP_RATE", 20.0)
+
+
+def run(test, api=None, **kwargs):
+    """Runs test(bot, gateway, api) with a Bot whose requests go through a Gateway over api."""
+    api = api or fakes.FakeTelegramAPI()
+    gw = gateway.Gateway(api, **kwargs)
+
+    async def main():
+        async with Bot(fakes.TOKEN, request=gw) as bot:
+            await test(bot, gw, api)
+    asyncio.run(main())
+
+
+def test_paces_a_chat_after_its_burst():
+    async def test(bot, gw, api):
+        gateway.COALESCE.set(False)
+        sent = []
+
+        async def send(n):
+            await bot.send_message(CHAT, f"message {n}")
+            sent.append(time.monotonic())
+        started = time.monotonic()
+        await asyncio.gather(*(send(n) for n in range(gateway.PRIVATE_BURST + 4)))
+        assert api.count("sendMessage") == gateway.PRIVATE_BURST + 4
+        # The burst goes at once, the rest one per 1/PRIVATE_RATE seconds.
+        assert sorted(sent)[gateway.PRIVATE_BURST - 1] - started < 0.04
+        assert sorted(sent)[-1] - started >= 4 / gateway.PRIVATE_RATE - 0.02
+    run(test)
+
+
+def test_str_and_int_chat_ids_share_a_bucket():
+    async def test(bot, gw, api):
+        await bot.send_message(-100123, "int")
+        await bot.send_message("-100123", "str")
+        assert list(gw._chats) == [-100123]
+    run(test)
+
+
+def test_retries_a_flood_refusal_after_retry_after():
+    async def test(bot, gw, api):
+        msg = await bot.send_message(CHAT, "hello")
+        assert msg.text == "hello"
+        assert api.count("sendMessage") == 3
+        assert gw.retries == 2
+    run(test, FloodedAPI(floods=2))
+
+
+def test_gives_up_after_max_retries():
+    async def test(bot, gw, api):
+        with pytest.raises(RetryAfter):
+            await bot.send_message(CHAT, "hello")
+        assert api.count("sendMessage") == gateway.MAX_RETRIES + 1
+    run(test, FloodedAPI(floods=gateway.MAX_RETRIES + 1))
+
+
+def test_does_not_repeat_a_send_that_timed_out(monkeypatch):
+    monkeypatch.setattr(gateway.random, "uniform", lambda a, b: 0.0)
+
+    async def test(bot, gw, api):
+        with pytest.raises(TimedOut):
+            await bot.send_message(CHAT, "maybe delivered")
+        assert api.count("sendMessage") == 1
+        # Edits are safe to repeat.
+        with pytest.raises(TimedOut):
+            await bot.edit_message_text("again", CHAT, 7)
+        assert api.count("editMessageText") == gateway.MAX_RETRIES + 1
+    run(test, TimingOutAPI())
+
+
+def test_joins_messages_queued_behind_a_chat():
+    async def test(bot, gw, api):
+        queued = 3
+        msgs = await asyncio.gather(*(bot.send_message(CHAT, f"line {n}")
+                                      for n in range(gateway.PRIVATE_BURST + queued)))
+        calls = [params["text"] for method, params in api.calls if method == "sendMessage"]
+        assert len(calls) == gateway.PRIVATE_BURST + 1
+        joined = range(gateway.PRIVATE_BURST, gateway.PRIVATE_BURST + queued)
+        assert calls[-1] == "\n\n".join(f"line {n}" for n in joined)
+        assert gw.coalesced == queued - 1
+        assert len({m.message_id for m in msgs[gateway.PRIVATE_BURST:]}) == 1
+    run(test)
+
+
+def test_keeps_apart_messages_whose_result_is_reused():
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Menu", callback_data="menu")]])
+
+    async def test(bot, gw, api):
+        async def own_message(n):
+            gateway.COALESCE.set(False)
+            return await bot.send_message(CHAT, f"status {n}")
+        msgs = await asyncio.gather(
+            *(bot.send_message(CHAT, f"line {n}") for n in range(gateway.PRIVATE_BURST)),
+            bot.send_message(CHAT, "menu", reply_markup=keyboard),
+            bot.send_message(CHAT, "after the menu"),
+            own_message(1),
+            own_message(2),
+        )
+        assert gw.coalesced == 0
+        assert api.count("sendMessage") == len(msgs)
+        assert len({m.message_id for m in msgs}) == len(msgs)
+    run(test)
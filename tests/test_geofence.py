@@ -0,0 +1,33 @@
+"""Zone lookups through the grid index agree with the plain polygon test."""
+import random
+
+import geofence
+
+
+def zone(name, polygon):
+    lats, lons = [p[0] for p in polygon], [p[1] for p in polygon]
+    return geofence.Zone(name, polygon, (min(lats), min(lons), max(lats), max(lons)), polygon[0])
+
+
+# A U shape: a notch 0.002 wide cuts through cell (1, 1) between its corners.
+NOTCHED = zone('U', [(0, 0), (0, 0.03), (0.03, 0.03), (0.03, 0.016), (0.005, 0.016),
+                     (0.005, 0.014), (0.03, 0.014), (0.03, 0)])
+
+
+def test_a_notch_through_a_cell_keeps_it_off_the_interior():
+    index = geofence.ZoneIndex([NOTCHED], cell_size=0.01)
+    assert (1, 1) not in index.interior
+    assert index.zone_at(0.015, 0.015) is None
+    assert index.classify([(0.015, 0.015)]) == [None]
+    assert index.zone_at(0.015, 0.012).name == 'U'
+
+
+def test_index_matches_point_in_polygon():
+    rng = random.Random(1)
+    square = zone('square', [(0.1, 0.1), (0.1, 0.2), (0.2, 0.2), (0.2, 0.1)])
+    index = geofence.ZoneIndex([NOTCHED, square], cell_size=0.005)
+    assert index.interior   # the shortcut is still used where it is safe
+    points = [(rng.uniform(-0.01, 0.21), rng.uniform(-0.01, 0.21)) for _ in range(5000)]
+    expected = [index._scan(lat, lon, [NOTCHED, square]) for lat, lon in points]
+    assert [index.zone_at(lat, lon) for lat, lon in points] == expected
+    assert index.classify(points) == [z and z.name for z in expected]
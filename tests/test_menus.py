@@ -0,0 +1,27 @@
+"""Menu catalog loading and hot reload (menus.py)."""
+import json
+
+import config
+import menus
+
+
+def menu_doc():
+    with open(config.MENU_PATH) as f:
+        return json.load(f)
+
+
+def test_a_bad_price_keeps_the_current_catalog(tmp_path):
+    doc = menu_doc()
+    doc['cafes'][0]['sections'][0]['items'][0]['price'] = None
+    path = tmp_path / "menu.json"
+    path.write_text(json.dumps(doc))
+    assert menus._load_if_changed(str(path)) is None
+    assert not menus.reload_if_changed(str(path))
+
+
+def test_cafes_without_items_are_left_out():
+    doc = menu_doc()
+    doc['cafes'].append({'name': 'Empty cafe', 'sections': [{'name': 'Drinks', 'items': []}]})
+    catalog = menus.Catalog.parse(json.dumps(doc).encode())
+    assert 'Empty cafe' not in catalog.cafes
+    assert len(catalog.cafes) == len(menu_doc()['cafes'])
@@ -0,0 +1,49 @@
+"""Pre-order release slots (preorders.py) on a scratch database."""
+import asyncio
+import time
+
+import orders
+import preorders
+import storage
+
+POSTS = [{'chat_id': -100, 'text': 'map'}, {'chat_id': -100, 'text': 'order'}]
+
+
+def scheduled(tmp_path, test):
+    """Runs test(queue) against a PreorderQueue on a fresh database."""
+    async def main():
+        store = storage.SessionStore(str(tmp_path / "preorders.db"))
+        await store.start()
+        await orders.OrderLedger(store).start()
+        queue = preorders.PreorderQueue(store, notifier=None)
+        await queue.start()
+        try:
+            await test(queue)
+        finally:
+            await queue.stop()
+            await store.stop()
+    asyncio.run(main())
+
+
+def schedule(queue, n, opens_at):
+    return queue.schedule(f"#{n:08d}", 1000 + n, [["cafe", "item", 1, 100]], 100, None, opens_at, POSTS, [])
+
+
+def test_orders_for_one_opening_are_spaced(tmp_path):
+    async def test(queue):
+        opening = time.time() + 6 * 3600
+        slots = [await schedule(queue, n, opening) for n in range(3)]
+        gap = preorders.spacing(POSTS)
+        assert slots == [opening, opening + gap, opening + 2 * gap]
+    scheduled(tmp_path, test)
+
+
+def test_an_earlier_opening_is_not_held_behind_a_later_one(tmp_path):
+    async def test(queue):
+        six = time.time() + 6 * 3600
+        ten = six + 4 * 3600
+        assert await schedule(queue, 1, ten) == ten
+        assert await schedule(queue, 2, six) == six
+        assert await schedule(queue, 3, six) == six + preorders.spacing(POSTS)
+        assert await schedule(queue, 4, ten) == ten + preorders.spacing(POSTS)
+    scheduled(tmp_path, test)
@@ -0,0 +1,20 @@
+"""Cart quotes (pricing.py)."""
+import menus
+import pricing
+import storage
+
+
+def test_items_gone_from_the_catalog_are_reported_not_priced():
+    item = next(iter(menus.current().items.values()))
+    data = storage.Session()
+    data.add_item(item.id, item.price)
+    data.add_item(999_999, 50)
+    quote = pricing.quote(data)
+    assert [line.item for line in quote.lines] == [item]
+    assert quote.missing == (999_999,)
+    assert quote.subtotal == item.price
+
+    data.drop_item(999_999)
+    quote = pricing.quote(data)
+    assert quote.missing == ()
+    assert data.subtotal == item.price
@@ -0,0 +1,82 @@
+"""Update processing (processing.py) under a running Application."""
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+import fakes
+import keep_alive
+import processing
+from keep_alive import KeepAliveServer, WEBHOOK_PATH
+
+
+def application(handler, max_in_flight, max_pending, queue_size):
+    processor = processing.PerChatUpdateProcessor(max_in_flight, max_pending)
+    api = fakes.FakeTelegramAPI()
+    app = (
+        ApplicationBuilder()
+        .token(fakes.TOKEN)
+        .request(api)
+        .get_updates_request(api)
+        .update_queue(processing.UpdateQueue(processor, maxsize=queue_size))
+        .concurrent_updates(processor)
+        .build()
+    )
+    app.add_handler(MessageHandler(filters.ALL, handler))
+    return app
+
+
+def test_slow_handlers_fill_the_queue_and_the_webhook_refuses(monkeypatch):
+    monkeypatch.setattr(keep_alive, "ENQUEUE_TIMEOUT_SECONDS", 0.05)
+
+    async def main():
+        release = asyncio.Event()
+        started = []
+
+        async def slow(update, ctx):
+            started.append(update.message.text)
+            await release.wait()
+
+        app = application(slow, max_in_flight=1, max_pending=2, queue_size=2)
+        server = KeepAliveServer(0)
+        server.attach(app)
+        await server.open()
+        async with app:
+            await app.start()
+            async with TestClient(TestServer(server.web)) as client:
+                statuses = []
+                for n in range(6):
+                    r = await client.post(WEBHOOK_PATH, json=fakes.make_text(100 + n, f"update {n}"))
+                    statuses.append(r.status)
+                    await asyncio.sleep(0.01)
+                # Two taken by the processor, two waiting in the queue, the rest refused.
+                assert statuses == [200, 200, 200, 200, 503, 503]
+                assert started == ["update 0"]
+                assert app.update_queue.qsize() == 2
+                release.set()
+                await app.update_queue.join()
+                assert started == [f"update {n}" for n in range(4)]
+            await app.stop()
+    asyncio.run(main())
+
+
+def test_one_chats_updates_run_in_arrival_order():
+    async def main():
+        done = []
+
+        async def handler(update, ctx):
+            await asyncio.sleep(0.01 if update.message.text.endswith("0") else 0)
+            done.append((update.effective_chat.id, update.message.text))
+
+        app = application(handler, max_in_flight=4, max_pending=8, queue_size=100)
+        async with app:
+            await app.start()
+            for n in range(5):
+                for chat in (1, 2):
+                    await app.update_queue.put(Update.de_json(fakes.make_text(chat, f"m{n}"), app.bot))
+            await app.update_queue.join()
+            await app.stop()
+        for chat in (1, 2):
+            assert [text for c, text in done if c == chat] == [f"m{n}" for n in range(5)]
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""The webhook server (keep_alive.py), driven over HTTP as Telegram would."""
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Bot
+
+import fakes
+import keep_alive
+from keep_alive import KeepAliveServer, WEBHOOK_PATH
+
+SECRET = "s3cret"
+HEADERS = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+
+def serve(test, queue_size=10, ready=True):
+    """Runs test(server, client, app) against a KeepAliveServer attached to a stand-in Application."""
+    async def main():
+        app = SimpleNamespace(bot=Bot(fakes.TOKEN), update_queue=asyncio.Queue(maxsize=queue_size))
+        server = KeepAliveServer(0, secret=SECRET)
+        server.attach(app)
+        if ready:
+            await server.open()
+        async with TestClient(TestServer(server.web)) as client:
+            await test(server, client, app)
+    asyncio.run(main())
+
+
+def test_rejects_requests_without_the_secret():
+    async def test(server, client, app):
+        r = await client.post(WEBHOOK_PATH, json=fakes.make_text(1, "/start"))
+        assert r.status == 403
+        r = await client.post(WEBHOOK_PATH, json=fakes.make_text(1, "/start"),
+                              headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        assert r.status == 403
+        assert app.update_queue.empty()
+    serve(test)
+
+
+def test_queues_updates_with_the_secret():
+    async def test(server, client, app):
+        payload = fakes.make_text(7, "/start")
+        r = await client.post(WEBHOOK_PATH, json=payload, headers=HEADERS)
+        assert r.status == 200
+        update = app.update_queue.get_nowait()
+        assert update.update_id == payload["update_id"]
+        assert update.effective_chat.id == 7
+    serve(test)
+
+
+def test_refuses_with_503_while_the_queue_is_full(monkeypatch):
+    monkeypatch.setattr(keep_alive, "ENQUEUE_TIMEOUT_SECONDS", 0.05)
+
+    async def test(server, client, app):
+        r = await client.post(WEBHOOK_PATH, json=fakes.make_text(1, "a"), headers=HEADERS)
+        assert r.status == 200
+        r = await client.post(WEBHOOK_PATH, json=fakes.make_text(1, "b"), headers=HEADERS)
+        assert r.status == 503
+        assert r.headers["Retry-After"] == "1"
+        app.update_queue.get_nowait()   # room again
+        r = await client.post(WEBHOOK_PATH, json=fakes.make_text(1, "c"), headers=HEADERS)
+        assert r.status == 200
+    serve(test, queue_size=1)
+
+
+def test_rejects_malformed_bodies():
+    async def test(server, client, app):
+        r = await client.post(WEBHOOK_PATH, data=b"not json", headers=HEADERS)
+        assert r.status == 400
+    serve(test)
+
+
+def test_readyz_turns_ready_on_open():
+    async def test(server, client, app):
+        r = await client.get("/readyz")
+        assert r.status == 503
+        assert (await client.get("/healthz")).status == 200
+        await server.open()
+        r = await client.get("/readyz")
+        assert r.status == 200
+    serve(test, ready=False)
+
+
+def test_updates_received_while_starting_are_delivered_on_open_in_order():
+    async def test(server, client, app):
+        payloads = [fakes.make_text(5, f"message {n}") for n in range(3)]
+        for payload in payloads:
+            r = await client.post(WEBHOOK_PATH, json=payload, headers=HEADERS)
+            assert r.status == 200
+        assert app.update_queue.empty()
+        await server.open()
+        got = [app.update_queue.get_nowait().message.text for _ in payloads]
+        assert got == ["message 0", "message 1", "message 2"]
+    serve(test, ready=False)
+
+
+def test_refuses_early_updates_beyond_the_buffer(monkeypatch):
+    monkeypatch.setattr(keep_alive, "EARLY_UPDATES", 2)
+
+    async def test(server, client, app):
+        statuses = []
+        for n in range(3):
+            r = await client.post(WEBHOOK_PATH, json=fakes.make_text(5, str(n)), headers=HEADERS)
+            statuses.append(r.status)
+        assert statuses == [200, 200, 503]
+    serve(test, ready=False)
+
+
+def test_metrics_need_the_token():
+    async def main():
+        closed = KeepAliveServer(0)
+        async with TestClient(TestServer(closed.web)) as client:
+            assert (await client.get("/metrics")).status == 404
+        server = KeepAliveServer(0, metrics_token="m3trics")
+        async with TestClient(TestServer(server.web)) as client:
+            assert (await client.get("/metrics")).status == 401
+            r = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+            assert r.status == 401
+            r = await client.get("/metrics", headers={"Authorization": "Bearer m3trics"})
+            assert r.status == 200
+            assert "wdelivery_handler_seconds" in await r.text()
+    asyncio.run(main())